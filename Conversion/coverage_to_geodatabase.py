@@ -10,7 +10,7 @@ import arcpy
 import os, logging
 import re
 from ormap.arc_utilities import ListFieldNames, DeleteFC, AddField
-from ormap.ormapnum import ormapnum
+from ormap.ormapnum import ORMapNumber
 
 # ========================================================================
 
@@ -140,8 +140,6 @@ def add_mapindex_fields(fc):
     AddField(fc, "ShortMapTitle", "TEXT", fieldlen=20)
     AddField(fc, "LongMapTitle",  "TEXT", fieldlen=50)
 
-    orm = ormapnum()
-
     fields = ["ORMapNum", "ShortMapTitle", "LongMapTitle", "OID@"]
     ORMAPNUM = 0
     SHORTTTL = 1
@@ -157,7 +155,7 @@ def add_mapindex_fields(fc):
                 cursor.deleteRow()
             else:
                 try:
-                    orm.unpack(o)
+                    orm = ORMapNumber.unpack(o)
                     row[SHORTTTL] = orm.shortmaptitle
                     row[LONGTTL]  = orm.longmaptitle
                 except ValueError as e:
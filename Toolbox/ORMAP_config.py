@@ -3,6 +3,12 @@
 # 2018-03-30 -- folded in the two config files, layout and map
 # 2017-12-11 -- Brian converted this file from MapProduction18x24.ini (then deleted 95% of it!)
 
+##### Main map data frame #####
+# Field in the data driven pages index that has the scale of each page,
+# needed to plan the page layouts before printing. Printing says so if the
+# index does not have it, and then sets up each page as it goes.
+PageScaleField = "MapScale"
+
 ##### Locator map data frame #####
 LocatorDF = "LocatorDF"
 LocatorScale = 800000
@@ -13,7 +19,9 @@ LocatorLayers=[
          '"TR<>\'{0}{1}{2}{3}\'".format(int(orm.township), orm.township_dir, int(orm.range), orm.range_dir)'),
         ]
 LocatorExtentLayer = None # Don't pan this locator map. It always shows the whole county.
+LocatorExtentFields = None
 LocatorFeatureCount = None
+LocatorFeatureCountFields = None
 
 ##### Sections map data frame #####
 SectionDF = "SectionsDF"
@@ -29,6 +37,17 @@ SectionExtentLayer = SectionLayers[1][0]
 # If there are no features showing (due to query definition) then hide this locator map
 SectionFeatureCount = SectionLayers[0][0]
 
+# Fields in the feature count layer and the map number parts they hold.
+# With these the toolbox reads the layer once to find out which sections
+# have features instead of counting them for every page.
+# Set this to None to count features every time.
+SectionFeatureCountFields = [("TOWN", "township"), ("RANGE", "range"), ("SECTION", "section")]
+
+# Same idea for the extent layer, its extents are read once and saved next
+# to the MXD instead of asking ArcMap for the extent on every page.
+# These have to match the fields used in the extent layer's query.
+SectionExtentFields = SectionFeatureCountFields[:2]
+
 ##### Quarter sections map data frame #####
 QSectionDF = "QSectionsDF"
 QSectionScale = 50000
@@ -43,6 +62,13 @@ QSectionExtentLayer = QSectionLayers[0][0]
 
 # If there are no features showing (due to query definition) then hide this locator map
 QSectionFeatureCount = QSectionLayers[0][0]
+QSectionFeatureCountFields = SectionFeatureCountFields
+QSectionExtentFields = SectionFeatureCountFields
+
+# Which sections have features and their extents are saved next to the MXD
+# and read again when the geodatabase changes. Data in SDE can't be checked
+# that way, so it's read again when it's this many hours old. None never does.
+LocatorCacheMaxAge = 24
 
 # ---------------------------------------------------------------------------
 # Cancelled Taxlot Numbers appear in a table with the numbers sorted
@@ -54,3 +80,53 @@ QSectionFeatureCount = QSectionLayers[0][0]
 CancelledNumbersTable = "K:/taxmaped/Clatsop/towned/cancelled.xlsx"
 MaxCancelledRows = 15 # Go to 8 point font if # of rows exceeds this
 
+# ---------------------------------------------------------------------------
+# Printing waits for each exported file to be complete before going on.
+PrintMinGap  = 0  # least number of seconds from one export to the next
+PrintTimeout = 60 # seconds to wait for an exported file before giving up on it
+
+# Big print jobs can be split between this many python.exe processes,
+# each one opens the saved MXD. 1 prints everything in ArcMap.
+PrintWorkers = 1
+
+# A print batch keeps a manifest of the maps it printed next to the
+# output files, and skips maps that were already printed from the same
+# MXD, map index row, cancelled taxlots and map index geodatabase.
+# False prints everything.
+# It goes by the time the MXD and the geodatabase were saved, so any edit
+# prints every map again; print "CHANGED" to only get the maps whose
+# features changed. It's only used for a saved MXD (printing from the
+# command line or with PrintWorkers), never when printing from ArcMap
+# ("CURRENT"), which can have changes that are not saved.
+PrintManifest = True
+# The plot date changes every day, True prints a map again when its date would change.
+ReprintForPlotDate = False
+
+# An atlas (all the maps in one PDF) is saved every this many pages while it's built.
+AtlasFlushPages = 50
+
+# Print pages grouped by township, section, scale and suffix instead of
+# in the order they were picked, so the locator maps and scalebars change less.
+# File names and the order of pages in an atlas are the same either way.
+ReorderPages = True
+
+# Timings for each stage of each page go in TraceFile + ".jsonl" and
+# TraceFile + ".trace.json" (for chrome://tracing), None to not write them.
+# Print workers each write their own, like "printmaps-worker0.jsonl".
+TraceFile = None # like "C:/temp/printmaps"
+
+# Feature classes drawn on the maps, in the geodatabase that holds the DDP index.
+# Printing the map number "CHANGED" prints the maps where any of them changed.
+# These are the names Conversion/coverage_to_geodatabase.py makes, add any
+# annotation feature classes that are on the maps. One that can't be found
+# or read is reported and left out.
+ChangeFeatureClasses = [
+    "taxlots_fd\\taxlot",
+    "taxlots_fd\\taxcode",
+    "corner",
+    "water_lines",
+    "cartographic_lines",
+    "reference_lines",
+    "plss_lines",
+]
+
@@ -9,6 +9,8 @@ import arcpy
 from arcpy import mapping as MAP
 from printMaps import print_maps
 from arc_utilities import ListPagenames
+from pageindex import index_for
+from plss import plss_for
 
 class PrintMaps(object):
     """This class has the methods you need to define
@@ -17,7 +19,11 @@ class PrintMaps(object):
     def __init__(self):
         """Define the tool (tool name is the name of the class)."""
         self.label = self.__class__.__name__
-        self.description = """Print one or more maps, as determined by a list of map numbers."""
+        self.description = """Print one or more maps, as determined by a list of map numbers.
+In ArcMap ("CURRENT") every map is printed, maps that were printed before
+are only skipped (PrintManifest in ORMAP_config) for a saved map document,
+the one in ArcMap can have changes that are not saved. Print "CHANGED" to only
+get the maps whose features changed since they were last printed."""
         self.canRunInBackground = False
         #self.category = "Map production" # Use your own category here, or an existing one.
         #self.stylesheet = "" # I don't know how to use this yet.
@@ -25,6 +31,16 @@ class PrintMaps(object):
         self.extensions = ["pdf","jpg"]
         return
 
+    def __first_format(self, formats):
+        """ The output file gets the extension of the first format,
+        "PDF;JPEG:96" gives "PDF". """
+        if not formats:
+            return ""
+        format = formats.split(';')[0].split(':')[0].strip("\"' ").upper()
+        if format == "PRINTER":
+            format = "JPEG"
+        return format
+
     def __set_output_filter(self, format):
         if format == "PDF":
             filter = [ "pdf" ]
@@ -79,23 +95,27 @@ class PrintMaps(object):
         mxd_filepath = ""
         try:
             mxd = MAP.MapDocument(self.mxdname)
-            map_number.filter.list = ListPagenames(mxd)
+            # "CHANGED" prints the maps whose features changed since they were last printed.
+            map_number.filter.list = ["CHANGED"] + ListPagenames(mxd)
             mxd_filepath = os.path.split(mxd.filePath)[0]
             del mxd
         except Exception as e:
             arcpy.AddMessage("%s. \"%s\"" % (e,self.mxdname))
 
                 
-        # params[1] is output format
+        # params[1] is output format, pick more than one and each page
+        # is set up once and exported in all of them.
+        # "JPEG:96" is a JPEG at 96 dpi, see exportformats.
         output_format = arcpy.Parameter(name="output_format",
                                         displayName="Output format",
                                         datatype="GPString",
                                         parameterType="Required", # Required|Optional|Derived
                                         direction="Input", # Input|Output
+                                        multiValue = True,
                                         )
         # You could set a list of acceptable values here for example
         output_format.filter.type = "ValueList"
-        output_format.filter.list = ["Printer","PDF","JPEG"]
+        output_format.filter.list = ["Printer","PDF","JPEG","JPEG:96","JPEG:300"]
         # You can set a default value here.
         output_format.value = "PDF"
         
@@ -106,12 +126,31 @@ class PrintMaps(object):
                                       parameterType="Required", # Required|Optional|Derived
                                       direction="Output", # Input|Output
                                       )
-        output_file.filter.list = self.__set_output_filter(str(output_format.value))
+        output_file.filter.list = self.__set_output_filter("PDF")
 
         # Try to set up something more useful as a path than the default
-        output_file.value = self.__set_output_file(mxd_filepath, output_format.value)
+        output_file.value = self.__set_output_file(mxd_filepath, "PDF")
+
+        # params[3] is an atlas, all the PDF pages in one file in map number order
+        atlas_file = arcpy.Parameter(name="atlas_file",
+                                     displayName="Atlas file",
+                                     datatype="DEFile",
+                                     parameterType="Optional", # Required|Optional|Derived
+                                     direction="Output", # Input|Output
+                                     )
+        atlas_file.filter.list = [ "pdf" ]
+
+        # params[4] is whether to keep the single page PDFs when making an atlas
+        atlas_only = arcpy.Parameter(name="atlas_only",
+                                     displayName="Atlas only (don't keep the single page PDFs)",
+                                     datatype="GPBoolean",
+                                     parameterType="Optional", # Required|Optional|Derived
+                                     direction="Input", # Input|Output
+                                     )
+        atlas_only.value = False
+        atlas_only.enabled = False
 
-        return [map_number, output_format, output_file]
+        return [map_number, output_format, output_file, atlas_file, atlas_only]
         
     def isLicensed(self):
         """Set whether tool is licensed to execute."""
@@ -122,14 +161,36 @@ class PrintMaps(object):
         validation is performed.  This method is called whenever a parameter
         has been changed."""
 
-        parameters[2].filter.list = self.__set_output_filter(str(parameters[1].value))
-        parameters[2].value = self.__set_output_file(str(parameters[2].value), parameters[1].value)
+        # Expand wildcards like "8 10 5*" and "8 10 5+" (section 5 and the maps inside it) into the list of pages.
+        if parameters[0].values and parameters[0].filter.list:
+            if [v for v in parameters[0].values if v and ('*' in v or v.endswith('+'))]:
+                all_pagenames = [v for v in parameters[0].filter.list if v != "CHANGED"]
+                idx = index_for(all_pagenames)
+                tree = plss_for(all_pagenames, arcpy.AddMessage)
+                l_pagename = []
+                for v in parameters[0].values:
+                    if v and '*' in v:
+                        l_pagename.extend(idx.expand(v))
+                    elif v and v.endswith('+'):
+                        l_pagename.extend(tree.expand(v))
+                    else:
+                        l_pagename.append(v)
+                parameters[0].values = l_pagename
+
+        format = self.__first_format(parameters[1].valueAsText)
+        parameters[2].filter.list = self.__set_output_filter(format)
+        parameters[2].value = self.__set_output_file(str(parameters[2].value), format)
+
+        parameters[4].enabled = bool(parameters[3].value)
 
         return
 
     def updateMessages(self, parameters):
         """Modify the messages created by internal validation for each tool
         parameter.  This method is called after internal validation."""
+        if parameters[3].value and parameters[1].valueAsText and \
+           not "PDF" in parameters[1].valueAsText.upper():
+            parameters[3].setErrorMessage("An atlas needs PDF in the output formats.")
         return
 
     def execute(self, parameters, messages):
@@ -150,10 +211,13 @@ class PrintMaps(object):
         map_numbers = parameters[0].valueAsText
         output_type = parameters[1].valueAsText
         output_file = parameters[2].value
+        atlas_file  = parameters[3].valueAsText or None
+        atlas_only  = bool(parameters[4].value) if atlas_file else False
         
         # Okay finally go ahead and do the work.
         mxd = MAP.MapDocument(self.mxdname)
-        print_maps(mxd, map_numbers, output_type, str(output_file))
+        print_maps(mxd, map_numbers, output_type, str(output_file), atlas_file, atlas_only,
+                   saved=(self.mxdname != "CURRENT"))
         del mxd
 
         return
@@ -171,8 +235,9 @@ if __name__ == "__main__":
     pmo.mxdname = mxdname # Override "CURRENT" for standalone test
     params = pmo.getParameterInfo()
     params[0].value = "8 10 5CD D2;8 10 5CD D1;8 10 5CD"
-    params[1].value = "JPEG"
+    params[1].value = "PDF;JPEG:96"
     params[2].value = r"C:\TempPath\printmap-unittest-.jpg"
+    params[3].value = r"C:\TempPath\printmap-unittest-atlas.pdf"
     pmo.execute(params, Messenger())
 
 # That's all!
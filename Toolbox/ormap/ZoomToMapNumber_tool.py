@@ -8,6 +8,7 @@ import arcpy
 from arcpy import mapping as MAP
 import zoomToMapNumber
 from arc_utilities import ListPagenames
+from pageindex import index_for
 
 class ZoomToMapNumber(object):
     """This class has the methods you need to define
@@ -53,6 +54,18 @@ class ZoomToMapNumber(object):
         """Modify the values and properties of parameters before internal
         validation is performed.  This method is called whenever a parameter
         has been changed."""
+
+        # Accept partial, dotted or ORMAPNUM input and turn it into a pagename
+        # when there's only one page it could be.
+        mapnum = parameters[0].valueAsText
+        if mapnum and parameters[0].filter.list and not mapnum in parameters[0].filter.list:
+            idx = index_for(parameters[0].filter.list)
+            pagename = idx.lookup(mapnum)
+            if not pagename:
+                found = idx.complete(mapnum, limit=2)
+                if len(found) == 1: pagename = found[0]
+            if pagename:
+                parameters[0].value = pagename
         
         # Did not need to deal with wildcards after all...
 #        mapnum = parameters[0].valueAsText
@@ -79,6 +92,7 @@ class ZoomToMapNumber(object):
         mxd = MAP.MapDocument(self.mxdname)
         messages.addMessage("MXD file: %s" % mxd.filePath)
         map_number = parameters[0].valueAsText
+        zoomToMapNumber.check_caches(mxd)
         zoomToMapNumber.update_page_layout(mxd, map_number)
         del mxd
         return
@@ -5,8 +5,22 @@ Wrappers for ESRUI arcpy functions to make them more usable.
 """
 from __future__ import print_function
 import os
+from fnmatch import fnmatchcase
 import arcpy
 from arcpy import mapping as MAP
+from mapnum import sort_mapnumbers
+
+def _backend(backend):
+    """ The map document calls go through a backend, arcpy.mapping unless another one is given. """
+    if backend is None:
+        from backend import arcpybackend
+        backend = arcpybackend()
+    return backend
+
+def _named(items, wildcard):
+    """ Return the items whose names match a wildcard, ignoring case like the arcpy List* calls. """
+    wildcard = wildcard.lower()
+    return [item for item in items if fnmatchcase(item.name.lower(), wildcard)]
 
 def aprint(msg):		
     """ Print a message. Execution does not stop. """		
@@ -47,28 +61,28 @@ def ListFieldNames(fc):
     """ Return a list of the names of the fields in a feature class. """
     return [f.name for f in arcpy.ListFields(fc)]
 
-def GetDataframe(mxd, dfname):		
+def GetDataframe(mxd, dfname, backend=None):		
     """ Return the named dataframe object from an MXD. """		
     df = None		
     try:		
-        df = MAP.ListDataFrames(mxd, dfname)[0]		
+        df = _named(_backend(backend).list_dataframes(mxd), dfname)[0]		
     except Exception as e:		
         aprint("Dataframe not found. Make sure it is named '%s'. \"%s\"" % (dfname,e))		
     return df		
 
-def GetLayer(mxd, df, layername):
+def GetLayer(mxd, df, layername, backend=None):
     """ Return the named layer from an MXD. """
     layer = None		
     try:		
-        layer = MAP.ListLayers(mxd, layername, df)[0]		
+        layer = _named(_backend(backend).list_layers(mxd, df), layername)[0]		
     except IndexError:		
-        print("Can't find layer \"%s\"/\"%s\"." % (df.name, layername))		
+        aprint("Can't find layer \"%s\"/\"%s\"." % (df.name, layername))		
     return layer
 
-def SetDefinitionQuery(mxd, df, layername, query):
+def SetDefinitionQuery(mxd, df, layername, query, backend=None):
     """ Set the definition query on a layer. """
     if df:
-        layer = GetLayer(mxd, df, layername)
+        layer = GetLayer(mxd, df, layername, backend)
         if not layer: return False
         try:
             layer.definitionQuery = query
@@ -79,11 +93,11 @@ def SetDefinitionQuery(mxd, df, layername, query):
  
 def ListPagenames(mxd):
     """ Given an mxd for a map document with Data Driven Pages,
-    Return a list of pagenames from that doc. """
+    Return a list of pagenames from that doc, in map number order. """
     try:
         maindf = mxd.dataDrivenPages.dataFrame
         ddp_layer = mxd.dataDrivenPages.indexLayer
-    except Except as e:
+    except Exception as e:
         aprint("Can't get ddp layer, %s" % e)
     pagename = mxd.dataDrivenPages.pageNameField
     d_val = {}
@@ -91,7 +105,7 @@ def ListPagenames(mxd):
     with arcpy.da.SearchCursor(ddp_layer.dataSource, [pagename.name]) as cursor:
         for row in cursor:
             d_val[row[0]] = 1
-    return sorted(d_val)
+    return sort_mapnumbers(d_val)
 
 # ---------------------------------------------------------------------
 
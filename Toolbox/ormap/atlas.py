@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Put the maps from a print batch into one PDF as they are printed.
+
+Pages go into the atlas in map number order. Maps that are finished
+early (by another worker) wait until the ones before them are in.
+Only file names are kept while waiting, and the PDF is saved and
+opened again every so often, so memory does not grow with the size
+of the batch.
+
+arcpy.mapping can append pages to a PDF but it can't make bookmarks,
+so a contents file is written next to the atlas with the first page
+of each township and the page number of every map.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import os
+from mapnum import bucket_mapnumbers
+
+def contents_file(filename):
+    """ Return the name of the contents file for an atlas. """
+    return os.path.splitext(filename)[0] + ".contents.txt"
+
+class atlas(object):
+    """ A multipage PDF being built from single page PDFs. """
+
+    def __init__(self, filename, pagenames, backend, flush_every=50):
+        """ filename     the atlas PDF, it's replaced if it's already there
+            pagenames    every page that will be added, in any order
+            backend      from the backend module, it makes the PDF
+            flush_every  save the PDF after adding this many pages """
+        self.filename = filename
+        self.backend  = backend
+        self.flush_every = flush_every
+        self.townships = [(key, names) for key, names in bucket_mapnumbers(pagenames, "township")]
+        self.order = [pagename for key, names in self.townships for pagename in names]
+        self.next  = 0        # index in self.order of the next page to go in
+        self.pending = {}     # files waiting for their turn, indexed by pagename, None for a missing page
+        self.d_pagenumber = {} # page in the atlas, indexed by pagename
+        self.pages = 0
+        self.unsaved = 0
+        if os.path.exists(filename): os.unlink(filename)
+        self.pdf = backend.pdf_create(filename)
+        return
+
+    def add(self, pagename, pdfname):
+        """ Add the PDF for a page. Returns the list of pagenames that went
+        into the atlas, it's empty if this one has to wait for others. """
+        self.pending[pagename] = pdfname
+        return self._drain()
+
+    def skip(self, pagename):
+        """ Leave out a page that could not be printed. """
+        return self.add(pagename, None)
+
+    def _drain(self):
+        added = []
+        while self.next < len(self.order) and self.order[self.next] in self.pending:
+            pagename = self.order[self.next]
+            pdfname = self.pending.pop(pagename)
+            if pdfname:
+                self.pdf.appendPages(pdfname)
+                self.pages += 1
+                self.d_pagenumber[pagename] = self.pages
+                self.unsaved += 1
+                added.append(pagename)
+                if self.unsaved >= self.flush_every:
+                    self.pdf.saveAndClose()
+                    self.pdf = self.backend.pdf_open(self.filename)
+                    self.unsaved = 0
+            self.next += 1
+        return added
+
+    def close(self):
+        """ Save the atlas and write its contents file.
+        Pages that never came in are left out. Returns the number of pages. """
+        for pagename in self.order[self.next:]:
+            if not pagename in self.pending:
+                self.pending[pagename] = None
+        self._drain()
+        self.pdf.saveAndClose()
+        self.pdf = None
+        with open(contents_file(self.filename), "w") as fp:
+            fp.write(self.contents())
+        return self.pages
+
+    def contents(self):
+        """ Return the table of contents as text. """
+        lines = []
+        for key, names in self.townships:
+            names = [pagename for pagename in names if pagename in self.d_pagenumber]
+            if not names: continue
+            if key:
+                lines.append("Township %d Range %d%s" % (key[0], key[1], ("page %d" % self.d_pagenumber[names[0]]).rjust(30)))
+            else:
+                lines.append("Other maps")
+            for pagename in names:
+                lines.append("    %-20s %5d" % (pagename, self.d_pagenumber[pagename]))
+        return "\n".join(lines) + "\n"
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    import tempfile, shutil
+    from backend import memorybackend
+
+    folder = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(folder, "atlas.pdf")
+        pagenames = ["8 10 5", "8 9 1", "8 10", "8 10 5CD", "7 10 36", "8 10 5CD D1"]
+        be = memorybackend()
+        a = atlas(filename, pagenames, be, flush_every=2)
+        assert a.order == ["7 10 36", "8 9 1", "8 10", "8 10 5", "8 10 5CD", "8 10 5CD D1"]
+
+        # Out of order, the way workers finish them.
+        assert a.add("8 10", "8_10.pdf") == []
+        assert a.add("7 10 36", "7_10_36.pdf") == ["7 10 36"]
+        assert a.skip("8 9 1") == ["8 10"]
+        assert a.add("8 10 5CD", "8_10_5CD.pdf") == []
+        assert a.add("8 10 5", "8_10_5.pdf") == ["8 10 5", "8 10 5CD"]
+        assert not a.pending
+        assert a.close() == 4
+        assert be.pdfs[filename] == ["7_10_36.pdf", "8_10.pdf", "8_10_5.pdf", "8_10_5CD.pdf"]
+
+        with open(contents_file(filename)) as fp:
+            text = fp.read()
+        print(text)
+        assert "Township 8 Range 10" in text
+        assert not "8 9 1" in text
+
+        # The same scratch file over and over, each page goes in as soon as it's printed.
+        scratch = os.path.join(folder, "scratch.pdf")
+        pagenames = ["8 10 %d" % s for s in range(1, 37)]
+        a = atlas(filename, pagenames, be, flush_every=10)
+        for pagename in a.order:
+            assert a.add(pagename, scratch) == [pagename]
+        assert a.close() == 36
+        assert len(be.pdfs[filename]) == 36
+    finally:
+        shutil.rmtree(folder)
+
+    print("Unit tests completed.")
+# That's all!
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+The few things the layout code asks of ArcMap, in one place.
+
+    list_elements(doc)          layout elements
+    list_dataframes(doc)        dataframes
+    list_layers(doc, df)        layers in a dataframe
+    page_size(doc)              (width, height)
+    set_page(doc, pagename)     go to a data driven page
+    page_scale(doc)             scale of the data driven pages dataframe
+    layer_extent(layer)         (xmin, ymin, xmax, ymax) of a layer with its query
+    feature_count(layer)        features in a layer with its query
+    set_extent(df, box)         pan and zoom a dataframe
+    set_scale(df, scale)        zoom a dataframe to a scale
+    refresh()                   redraw
+    export(doc, output_type, filename, resolution)
+    pdf_create(filename)        new multipage PDF, with appendPages() and saveAndClose()
+    pdf_open(filename)          an existing one
+
+Queries, positions, text and font sizes are plain attributes on the
+objects these return, so they get set the same way with either backend.
+
+arcpybackend does it with arcpy.mapping. memorybackend keeps a pretend
+map document in memory so the layout code can be run (and timed) on
+a machine without ArcMap.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+
+class arcpybackend(object):
+    """ arcpy.mapping, ArcMap 10.x """
+
+    def __init__(self):
+        import arcpy
+        from arcpy import mapping
+        self.arcpy = arcpy
+        self.mapping = mapping
+        return
+
+    def list_elements(self, mxd):
+        return self.mapping.ListLayoutElements(mxd)
+
+    def list_dataframes(self, mxd):
+        return self.mapping.ListDataFrames(mxd)
+
+    def list_layers(self, mxd, df):
+        return self.mapping.ListLayers(mxd, "", df)
+
+    def page_size(self, mxd):
+        return (mxd.pageSize.width, mxd.pageSize.height)
+
+    def set_page(self, mxd, pagename):
+        ddp = mxd.dataDrivenPages
+        ddp.currentPageID = ddp.getPageIDFromName(pagename)
+        return
+
+    def page_scale(self, mxd):
+        return mxd.dataDrivenPages.dataFrame.scale
+
+    def layer_extent(self, layer):
+        e = layer.getExtent()
+        return (e.XMin, e.YMin, e.XMax, e.YMax)
+
+    def feature_count(self, layer):
+        return int(self.arcpy.GetCount_management(layer).getOutput(0))
+
+    def set_extent(self, df, box):
+        df.extent = self.arcpy.Extent(*box)
+        return
+
+    def set_scale(self, df, scale):
+        df.scale = scale
+        return
+
+    def refresh(self):
+        self.arcpy.RefreshActiveView()
+        return
+
+    def export(self, mxd, output_type, filename, resolution=None):
+        kwargs = {"resolution": resolution} if resolution else {}
+        if output_type == 'PDF':
+            self.mapping.ExportToPDF(mxd, filename, **kwargs)
+        else:
+            self.mapping.ExportToJPEG(mxd, filename, **kwargs)
+        return
+
+    def pdf_create(self, filename):
+        return self.mapping.PDFDocumentCreate(filename)
+
+    def pdf_open(self, filename):
+        return self.mapping.PDFDocumentOpen(filename)
+
+# =============================================================================
+# An in-memory map document
+
+class memoryobject(object):
+    """ Something in the document. Counts writes to its attributes,
+    each one would make ArcMap redraw. """
+    writes = 0
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __setattr__(self, name, value):
+        self.__dict__[name] = value
+        memoryobject.writes += 1
+
+class memoryelement(memoryobject):
+    def __init__(self, type, name, x=0, y=0, width=1, height=1, text=""):
+        memoryobject.__init__(self, type=type, name=name,
+                              elementPositionX=x, elementPositionY=y,
+                              elementWidth=width, elementHeight=height,
+                              text=text, fontSize=10)
+
+class memorylayer(memoryobject):
+    def __init__(self, name, extents=None, counts=None):
+        """ extents  function that returns the extent for a definition query
+            counts   function that returns the feature count for a definition query """
+        memoryobject.__init__(self, name=name, definitionQuery="", extents=extents, counts=counts)
+
+class memorydataframe(memoryelement):
+    def __init__(self, name, layers, x=0, y=0, width=1, height=1):
+        memoryelement.__init__(self, "DATAFRAME_ELEMENT", name, x, y, width, height)
+        self.__dict__.update(layers=layers, extent=None, scale=0)
+
+class memorydocument(object):
+    """ A map document with a page, elements (dataframes are elements too)
+    and data driven pages. """
+    def __init__(self, page_size, elements, filePath=None, scales=None):
+        """ scales  dict of map scales indexed by pagename """
+        self.filePath = filePath
+        self.page     = page_size
+        self.scales   = scales or {}
+        self.elements = elements
+        self.pagename = None
+        self.exported = []
+
+class memorypdf(object):
+    """ A multipage PDF, its pages are the names of the files they came from.
+    'files' is where it's kept when it's saved. """
+    def __init__(self, files, filename, pages=()):
+        self.files    = files
+        self.filename = filename
+        self.pages    = list(pages)
+        self.pageCount = len(self.pages)
+
+    def appendPages(self, filename):
+        self.pages.append(filename)
+        self.pageCount += 1
+
+    def saveAndClose(self):
+        self.files[self.filename] = self.pages
+
+class memorybackend(object):
+    """ The backend for a memorydocument. 'delay' is seconds to wait for each call,
+    to make it act more like a slow COM round trip. """
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = 0
+        self.pdfs  = {} # pages of saved PDFs indexed by filename
+
+    def _call(self):
+        self.calls += 1
+        if self.delay:
+            from time import sleep
+            sleep(self.delay)
+
+    def list_elements(self, doc):
+        self._call()
+        return list(doc.elements)
+
+    def list_dataframes(self, doc):
+        self._call()
+        return [e for e in doc.elements if e.type == "DATAFRAME_ELEMENT"]
+
+    def list_layers(self, doc, df):
+        self._call()
+        return list(df.layers)
+
+    def page_size(self, doc):
+        return doc.page
+
+    def set_page(self, doc, pagename):
+        self._call()
+        doc.pagename = pagename
+
+    def page_scale(self, doc):
+        return doc.scales.get(doc.pagename, 0)
+
+    def layer_extent(self, layer):
+        self._call()
+        if layer.extents:
+            return layer.extents(layer.definitionQuery)
+        return (0, 0, 0, 0)
+
+    def feature_count(self, layer):
+        self._call()
+        if layer.counts:
+            return layer.counts(layer.definitionQuery)
+        return 1
+
+    def set_extent(self, df, box):
+        self._call()
+        df.extent = tuple(box)
+
+    def set_scale(self, df, scale):
+        self._call()
+        df.scale = scale
+
+    def refresh(self):
+        self._call()
+
+    def export(self, doc, output_type, filename, resolution=None):
+        self._call()
+        doc.exported.append((doc.pagename, output_type, filename, resolution))
+
+    def pdf_create(self, filename):
+        return memorypdf(self.pdfs, filename)
+
+    def pdf_open(self, filename):
+        return memorypdf(self.pdfs, filename, self.pdfs[filename])
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    sections = memorydataframe("SectionsDF", [memorylayer("Sections", lambda q: (0,0,len(q),1))], 30, 16, 5, 3)
+    doc = memorydocument((36, 24), [memoryelement("TEXT_ELEMENT", "PlotDate"), sections])
+    be = memorybackend()
+    assert [e.name for e in be.list_elements(doc)] == ["PlotDate", "SectionsDF"]
+    assert be.list_dataframes(doc) == [sections]
+    layer = be.list_layers(doc, sections)[0]
+    n = memoryobject.writes
+    layer.definitionQuery = "TOWN = '8'"
+    assert memoryobject.writes == n + 1
+    assert be.layer_extent(layer) == (0, 0, 10, 1)
+    be.set_extent(sections, (1, 2, 3, 4))
+    assert sections.extent == (1, 2, 3, 4)
+    n = be.calls
+    be.set_scale(sections, 4800)
+    assert sections.scale == 4800 and be.calls == n + 1
+    be.set_page(doc, "8 10 5")
+    assert be.page_scale(doc) == 0
+    assert be.feature_count(layer) == 1
+    counted = memorylayer("Sections", counts=lambda q: len(q))
+    counted.definitionQuery = "TOWN = '8'"
+    assert be.feature_count(counted) == 10
+    be.export(doc, "PDF", "8_10_5.pdf")
+    be.export(doc, "JPEG", "8_10_5.jpg", 96)
+    assert doc.exported == [("8 10 5", "PDF", "8_10_5.pdf", None), ("8 10 5", "JPEG", "8_10_5.jpg", 96)]
+    pdf = be.pdf_create("atlas.pdf")
+    pdf.appendPages("8_10_5.pdf")
+    pdf.saveAndClose()
+    pdf = be.pdf_open("atlas.pdf")
+    pdf.appendPages("8_10_6.pdf")
+    assert pdf.pageCount == 2
+
+    print("Unit tests completed.")
+# That's all!
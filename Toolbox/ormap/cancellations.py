@@ -5,8 +5,121 @@ Created on Mon Dec 18 09:54:02 2017
 """
 from __future__ import print_function
 import xlrd
-import re
+import os, re, csv, tempfile
+import time
+from hashlib import md5
+from itertools import islice
 from collections import defaultdict
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    # openpyxl can stream an xlsx file, xlrd has to load all of it.
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+CHUNKSIZE = 10000 # rows read between progress reports
+
+def _text(value):
+    """ Return a cell value as text, numbers like 100.0 become "100". """
+    if value is None:
+        return u""
+    if isinstance(value, float) and value.is_integer():
+        return u"%d" % value
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return u"%s" % value
+
+def _rows_xlrd(filename):
+    wb = xlrd.open_workbook(filename, on_demand=True)
+    ws = wb.sheet_by_index(0)
+    for row_index in range(1, ws.nrows): # Skip column headers
+        yield (ws.cell_value(row_index, 0), ws.cell_value(row_index, 1))
+    wb.release_resources()
+
+def _rows_openpyxl(filename):
+    wb = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+    ws = wb.worksheets[0]
+    for cells in ws.iter_rows(min_row=2, max_col=2): # Skip column headers
+        values = [c.value for c in cells] + [None, None]
+        yield (values[0], values[1])
+    if hasattr(wb, "close"): wb.close()
+
+def _rows_csv(filename, offset=0, pos=None):
+    """ 'offset' is where to start in the file, 0 means at the column headers.
+    After each row pos[0] is set to the offset of the next one. """
+    with open(filename, "rb") as fp:
+        fp.seek(offset)
+        consumed = [offset]
+        def lines():
+            while True:
+                line = fp.readline()
+                if not line: return
+                consumed[0] += len(line)
+                yield line.decode("utf-8-sig") if bytes is not str else line
+        reader = csv.reader(lines())
+        if not offset:
+            next(reader, None) # Skip column headers
+        for row in reader:
+            if pos is not None: pos[0] = consumed[0]
+            row = row + [u"", u""]
+            yield (row[0], row[1])
+
+def _hash_bytes(filename, length):
+    """ Return the md5 of the first 'length' bytes of a file. """
+    h = md5()
+    with open(filename, "rb") as fp:
+        while length > 0:
+            data = fp.read(min(length, 1 << 20))
+            if not data: break
+            h.update(data)
+            length -= len(data)
+    return h.hexdigest()
+
+def is_csv(filename):
+    return os.path.splitext(filename)[1].lower() == ".csv"
+
+def read_rows(filename, start=0, offset=0, pos=None, report=None):
+    """ Yield (mapnum, taxlot) text tuples from the first two columns of
+    a spreadsheet (first worksheet) or a CSV file, skipping the header row
+    and then 'start' data rows.
+
+    CSV files and xlsx files (with openpyxl) are read a row at a time so
+    memory use does not grow with the size of the file. A CSV file can also
+    start at byte 'offset', and pos[0] is kept at the offset of the next row.
+    Anything else is read by xlrd, which loads the whole workbook,
+    and 'report' is told so. """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".csv":
+        rows = _rows_csv(filename, offset, pos)
+    elif ext in (".xlsx", ".xlsm") and openpyxl:
+        rows = _rows_openpyxl(filename)
+    else:
+        if report:
+            if ext in (".xlsx", ".xlsm"):
+                report("openpyxl is not installed, all of \"%s\" gets loaded into memory by xlrd." % filename)
+            else:
+                report("All of \"%s\" gets loaded into memory by xlrd, save it as xlsx or CSV to stream it." % filename)
+        rows = _rows_xlrd(filename)
+    for (mapnum, taxlot) in islice(rows, start, None):
+        yield (_text(mapnum).strip(), _text(taxlot).strip())
+
+def _row_bytes(row):
+    """ Return a row as bytes, for hashing. """
+    return (u"%s\t%s\n" % row).encode("utf-8")
+
+def sort_key(taxlotno):
+    """ Return a key for sorting a taxlot number, (number, rest), like "90A" => (90, "A").
+    It sorts the same as make_sortable() without needing a regular expression. """
+    taxlotno = taxlotno.strip()
+    i = 0
+    while i < len(taxlotno) and taxlotno[i].isdigit():
+        i += 1
+    if i:
+        return (int(taxlotno[:i]), taxlotno[i:].strip())
+    return (0, taxlotno)
 
 def make_sortable(taxlotno):
     """ Given a taxlot number, reformat it into an ASCII sortable value. """
@@ -20,45 +133,294 @@ def make_sortable(taxlotno):
     return sortable
 
 class cancellations(object):
-    """ I made this into an object so that it could read the spreadsheet and then use a cached copy of it. """
+    """ I made this into an object so that it could read the spreadsheet and then use a cached copy of it.
+    The "spreadsheet" can also be a CSV file.
 
-    d_cancelled = defaultdict(list) # indexed by mapnum, containing lists of taxlots
+    Nothing is read until the first lookup. After that the table stays as
+    it is until refresh() is called (once for each print batch, checking
+    costs an os.stat on a network share). If rows were only added to the
+    end of a CSV file just those rows are read. An xlsx or xls file has no
+    incremental read, it's parsed from the top every time it changes and
+    only the work of rebuilding the table for unchanged rows is saved. """
 
-    def __init__(self, xlsfile = "K:\\taxmaped\\Clatsop\\towned\\cancelled.xlsx"):
-        self.read_xls(xlsfile)
+    snapshot_version = 6 # Change this if the snapshot format changes.
+
+    def __init__(self, xlsfile = "K:\\taxmaped\\Clatsop\\towned\\cancelled.xlsx", cachedir = None, report = print):
+        """ The spreadsheet is usually on a network share, so a copy of what
+        was read from it is saved in 'cachedir' (defaults to TEMP) and reused
+        until the spreadsheet changes.
+        Progress and problems are sent to 'report', pass aprint in ArcMap. """
+        self.xlsfile  = xlsfile
+        self.cachedir = cachedir or tempfile.gettempdir()
+        self.report   = report
+        self.d_index  = {}    # indexed by mapnum, sorted tuples of taxlots with no duplicates
+        self.stamp    = None  # (path, size, mtime) of the spreadsheet when it was read
+        self.rows     = 0     # number of data rows read so far
+        self.prefix   = None  # md5 of the rows read so far, to check that none of them were changed
+        self.offset   = 0     # for a CSV file, where the next row starts (prefix is the md5 of the bytes before it)
+        self.changed  = set() # map numbers that got new rows in the last read
+        self.read_stats = (0, 0.0) # (rows, seconds) for the last read
+        return
+
+    def snapshot_name(self, xlfile):
+        """ Return the name of the local snapshot file for a spreadsheet. """
+        key = md5(os.path.normcase(os.path.abspath(xlfile)).encode("utf-8")).hexdigest()
+        return os.path.join(self.cachedir, "cancelled_%s.snapshot" % key)
+
+    def _source_stamp(self, xlfile):
+        st = os.stat(xlfile)
+        return (os.path.normcase(os.path.abspath(xlfile)), st.st_size, st.st_mtime)
+
+    def load_snapshot(self, xlfile):
+        """ Load the table from the local snapshot.
+        Returns True if it worked, it might be out of date. """
+        try:
+            with open(self.snapshot_name(xlfile), "rb") as fp:
+                (version, stamp, rows, prefix, offset, d_index) = pickle.load(fp)
+        except Exception as e:
+            return False
+        if version != self.snapshot_version:
+            return False
+        self.d_index  = d_index
+        self.stamp    = stamp
+        self.rows     = rows
+        self.prefix   = prefix
+        self.offset   = offset
+        return True
+
+    def save_snapshot(self, xlfile):
+        """ Save the table in a local snapshot file. """
+        try:
+            snapshot = self.snapshot_name(xlfile)
+            with open(snapshot + ".tmp", "wb") as fp:
+                pickle.dump((self.snapshot_version, self.stamp, self.rows, self.prefix, self.offset,
+                             self.d_index), fp, pickle.HIGHEST_PROTOCOL)
+            if os.path.exists(snapshot): os.unlink(snapshot)
+            os.rename(snapshot + ".tmp", snapshot)
+        except Exception as e:
+            self.report("Could not save snapshot of \"%s\", %s" % (xlfile, e))
         return
 
-    def read_xls(self, xlfile):
+    def refresh(self):
+        """ Bring the table up to date with the spreadsheet.
+        Call this once for each batch of lookups, not for every one. """
+        try:
+            stamp = self._source_stamp(self.xlsfile)
+        except OSError as e:
+            if self.stamp is None:
+                self.report("Can't read cancelled taxlots, %s" % e)
+                self.stamp = ()  # Don't keep trying
+            return
+        if stamp == self.stamp:
+            return
+        if self.stamp is None and self.load_snapshot(self.xlsfile) and stamp == self.stamp:
+            return
+
+        if not (self.rows and self.read_xls(self.xlsfile, start=self.rows)):
+            # First time, or rows were changed or deleted, so read it all.
+            self.d_index = {}
+            self.rows = 0
+            self.prefix = None
+            self.offset = 0
+            self.read_xls(self.xlsfile)
+        self.stamp = stamp
+        self.save_snapshot(self.xlsfile)
+        return
+
+    def read_xls(self, xlfile, start=0, report=None):
         """ Loads cancelled taxlot numbers into an internal table. 
- Assumes the Excel file has its data in the first
- two columns (mapnum,cancelled_taxlot) in its first worksheet. """
-        d_sortable = {} # Use a dict to squash duplicates
-        wb = xlrd.open_workbook(xlfile)
-        #print(wb.get_sheet_names()[0])
-        ws = wb.sheet_by_index(0)
-        for row_index in range(1, ws.nrows): # Skip column headers
-            mapnum = ws.cell(row_index, 0).value
-            if mapnum:
-                taxlot = ws.cell(row_index, 1).value.strip()
-                self.d_cancelled[mapnum].append(taxlot)
+ Assumes the Excel (or CSV) file has its data in the first
+ two columns (mapnum,cancelled_taxlot) in its first worksheet.
+
+ Rows are streamed and added to the table in chunks, with the
+ rate reported through 'report' (defaults to the one this object
+ was made with) after each one.
+
+ If 'start' is not 0, only rows after the first 'start' rows are added.
+ That only works if rows were added to the end of the sheet, so
+ False is returned (and nothing is changed) if there are no new rows or
+ if any of the first 'start' rows is not the same as last time.
+ A spreadsheet has to be read from the top to check that, a CSV file
+ is checked by hashing its bytes and then only the new rows are read. """
+
+        if report is None: report = self.report
+        pos = [0]
+        h = md5()
+        if is_csv(xlfile):
+            if start:
+                if not self.offset or _hash_bytes(xlfile, self.offset) != self.prefix:
+                    return False
+                pos = [self.offset]
+            rows = read_rows(xlfile, offset=pos[0], pos=pos)
+        else:
+            rows = read_rows(xlfile, report=report)
+        if start and not is_csv(xlfile):
+            # All the rows we got last time have to still be there, unchanged.
+            n = 0
+            for row in islice(rows, start):
+                h.update(_row_bytes(row))
+                n += 1
+            if n < start or h.hexdigest() != self.prefix:
+                return False
+
+        t0 = time.time()
+        count = 0
+        d_keyed = {} # indexed by mapnum, {sort_key: taxlot} for maps that got new rows
+        while True:
+            chunk = list(islice(rows, CHUNKSIZE))
+            if not chunk: break
+            for (mapnum, taxlot) in chunk:
+                h.update(_row_bytes((mapnum, taxlot)))
+                if not mapnum: continue
+                try:
+                    d = d_keyed[mapnum]
+                except KeyError:
+                    d = d_keyed[mapnum] = dict((sort_key(t), t) for t in self.d_index.get(mapnum, ()))
+                d[sort_key(taxlot)] = taxlot # This will nuke duplicate taxlots.
+            count += len(chunk)
+            if len(chunk) == CHUNKSIZE and report:
+                report("Read %d rows, %d rows/second" % (count, count / max(time.time()-t0, 0.001)))
+
+        if start and not count:
+            return False
+        self.merge(d_keyed)
+        seconds = time.time() - t0
+        self.rows = start + count
+        if is_csv(xlfile):
+            self.offset = pos[0]
+            self.prefix = _hash_bytes(xlfile, self.offset)
+        else:
+            self.prefix = h.hexdigest()
+        self.read_stats = (count, seconds)
+        if report and count >= CHUNKSIZE:
+            report("Read %d cancelled taxlot rows in %.1f seconds, %d rows/second"
+                   % (count, seconds, count / max(seconds, 0.001)))
+        return True
+
+    def merge(self, d_keyed):
+        """ Replace the taxlots for each map in 'd_keyed' (a dict of {sort_key: taxlot}
+        indexed by map number) with a sorted tuple of them. """
+        self.changed = set(d_keyed)
+        for mapnum, d in d_keyed.items():
+            # This will save the taxlots (not the "sortable" taxlots)
+            self.d_index[mapnum] = tuple(d[k] for k in sorted(d))
+        return
 
     def get_list(self, mapnum):
-        """ Returns the (sorted) list of taxlots for a given map number. 
+        """ Returns the (sorted) tuple of taxlots for a given map number. 
         Note that mapnum has to be in dotted format T.R.Sqq, eg 8.9.10AB """
-        try:
-            l = self.d_cancelled[mapnum]
-        except KeyError:
-            return None
-        d_sortable = {} # This will nuke duplicate taxlots.
-        for taxlot in l:
-            d_sortable[make_sortable(taxlot)] = taxlot
-        # This will return the list of taxlots (not the list of "sortable" taxlots)
-        return [d_sortable[k] for k in sorted(d_sortable)]   
+        if self.stamp is None: self.refresh()
+        return self.d_index.get(mapnum, ())
+
+    def get_lists(self, mapnums):
+        """ Returns a dict of sorted taxlot tuples indexed by map number, for many map numbers at once. """
+        if self.stamp is None: self.refresh()
+        return dict((mapnum, self.d_index.get(mapnum, ())) for mapnum in mapnums)
 
 # =============================================================================
 if __name__ == "__main__":
     # unit tests
-    can = cancellations()
+    import sys, time, shutil
+    if len(sys.argv) < 2:
+        # Make up a spreadsheet to test with.
+        import openpyxl
+        folder = tempfile.mkdtemp()
+        xlsfile = os.path.join(folder, "cancelled.xlsx")
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(["MapNum", "Taxlot"])
+        for mapnum, taxlot in [("8.10.8BB", "100"), ("8.10.8BB", "1000"), ("8.10.8BB", "200"),
+                               ("8.10.8BB", "200"), ("8.10.8BB", "90A"), ("8.10.8", "1500"),
+                               ("8.10.8", " 301 ")]:
+            ws.append([mapnum, taxlot])
+        wb.save(xlsfile)
+    else:
+        folder = None
+        xlsfile = sys.argv[1]
+
+    t0 = time.time()
+    can = cancellations(xlsfile)
+    t1 = time.time()
+    can.get_list("8.10.8BB")
+    t2 = time.time()
+    other = cancellations(xlsfile)
+    other.get_list("8.10.8BB")
+    t3 = time.time()
+    print("Create %.3f s, read spreadsheet %.3f s, read snapshot %.3f s" % (t1-t0, t2-t1, t3-t2))
+    assert os.path.exists(can.snapshot_name(xlsfile))
+    assert other.d_index is not can.d_index
+    if folder:
+        assert can.get_list("8.10.8BB") == ("90A", "100", "200", "1000"), can.get_list("8.10.8BB")
+        assert can.get_lists(["8.10.8", "8.10.25"]) == {"8.10.8": ("301", "1500"), "8.10.25": ()}
+        for taxlot in ["90A", "100", "200", "1000", "A", "", "12 B"]:
+            assert (sort_key(taxlot) < sort_key("101")) == (make_sortable(taxlot) < make_sortable("101")), taxlot
+
+        # Add some rows, only they should get read.
+        time.sleep(1)
+        ws.append(["8.10.8BB", "300"])
+        ws.append(["8.10.25", "100"])
+        wb.save(xlsfile)
+        can.refresh()
+        assert can.get_list("8.10.8BB") == ("90A", "100", "200", "300", "1000"), can.get_list("8.10.8BB")
+        assert can.read_stats[0] == 2, can.read_stats # only the new rows were read
+        assert can.changed == set(["8.10.8BB", "8.10.25"])
+        assert can.rows == 9, can.rows
+        assert can.get_list("8.10.8") == ("301", "1500")
+
+        # Change a row in the middle, it has to read it all again.
+        time.sleep(1)
+        ws.cell(row=2, column=2).value = "101"
+        wb.save(xlsfile)
+        can.refresh()
+        assert can.get_list("8.10.8BB") == ("90A", "101", "200", "300", "1000"), can.get_list("8.10.8BB")
+        assert can.rows == 9
+
+        # Change a row and add one, it still has to read it all again.
+        time.sleep(1)
+        ws.cell(row=7, column=2).value = "999" # was 8.10.8 1500
+        ws.append(["8.10.8", "2000"])
+        wb.save(xlsfile)
+        can.refresh()
+        assert can.get_list("8.10.8") == ("301", "999", "2000"), can.get_list("8.10.8")
+        assert can.rows == 10
+        # and the snapshot has the new values too.
+        other = cancellations(xlsfile)
+        assert other.get_list("8.10.8") == ("301", "999", "2000"), other.get_list("8.10.8")
+
+        os.unlink(can.snapshot_name(xlsfile))
+
+        # A big CSV file, streamed in chunks
+        csvfile = os.path.join(folder, "cancelled.csv")
+        with open(csvfile, "w") as fp:
+            fp.write("MapNum,Taxlot\n")
+            for i in range(50000):
+                fp.write("%d.%d.%d,%d\n" % (8, 10, i % 36 + 1, i))
+        big = cancellations(csvfile, cachedir=folder)
+        assert len(big.get_list("8.10.1")) == 50000 // 36 + 1
+        (n, seconds) = big.read_stats
+        print("CSV %d rows in %.2f s" % (n, seconds))
+        with open(csvfile, "a") as fp:
+            fp.write("8.10.1,50000A\n")
+        time.sleep(1)
+        assert big.get_list("8.10.1")[-1] == "49968", "read again without a refresh()"
+        big.refresh()
+        assert big.get_list("8.10.1")[-1] == "50000A"
+        assert big.read_stats[0] == 1
+        assert big.read_stats[1] < seconds / 5, big.read_stats # the old rows were not parsed again
+
+        # An edit above the new rows in a CSV file
+        with open(csvfile, "r+") as fp:
+            fp.seek(len("MapNum,Taxlot\n"))
+            fp.write("8.10.1,9")  # was 8.10.1,0
+        with open(csvfile, "a") as fp:
+            fp.write("8.10.2,50001\n")
+        time.sleep(1)
+        big.refresh()
+        assert big.get_list("8.10.1")[0] == "9" and not "0" in big.get_list("8.10.1")
+        assert big.rows == 50002
+
+        shutil.rmtree(folder)
+
     for mapnum in ["8.10.8BB", "8.10.8", "8.10.25"]:
         lst = can.get_list(mapnum)
         print(mapnum, "returned", len(lst))
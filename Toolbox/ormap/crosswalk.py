@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+A crosswalk between the different ways of writing a map number.
+
+    pagename  "8 10 5CD D1"                (DDP page name)
+    ormapnum  "0408.00N10.00W05CD--D001"   (ORMAPNUM field)
+    dotted    "8.10.5CD D1"                (cancelled taxlots spreadsheet)
+    sort key  an integer for putting maps in order
+
+It's built once from the list of pagenames in the mapindex and saved in
+a file so the toolbox does not have to parse map numbers over and over.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import os
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+from ormapnum import ORMapNumber
+from mapnum import sortkeys
+import filestamp
+
+def index_stamp(source):
+    """ Return a value that changes when maps are added to or deleted from
+    the DDP index, (row count, highest OBJECTID). Only the index feature
+    class is read, so edits to taxlots in the same geodatabase don't change it.
+    A pagename edited in place is not noticed.
+    Falls back on filestamp.stamp() if the feature class can't be read. """
+    try:
+        import arcpy
+        count = 0
+        top = -1
+        with arcpy.da.SearchCursor(source, ["OID@"]) as cursor:
+            for (oid,) in cursor:
+                count += 1
+                if oid > top: top = oid
+        return (count, top)
+    except Exception:
+        return filestamp.stamp(source)
+
+class crosswalk(object):
+    """ Lookups between pagename, ORMAPNUM, dotted format and sort key. """
+
+    version = 2 # Change this if the file format changes, so old files get rebuilt.
+
+    def __init__(self, pagenames=(), source=None, stamp=index_stamp):
+        """ pagenames  list of DDP page names
+            source     the data source they came from, for staleness checks
+            stamp      what to check it with, see index_stamp() """
+        self.source = source
+        self.stamp  = stamp(source) if source else None
+        self.d_orm      = {} # ORMapNumber indexed by pagename
+        self.d_sortkey  = {} # sort key indexed by pagename
+        self.d_pagename = {} # pagename indexed by ormapnum, dotted and pagename
+        pagenames = list(pagenames)
+        for pagename, key in zip(pagenames, sortkeys(pagenames)):
+            try:
+                orm = ORMapNumber.expand(pagename)
+            except ValueError as e:
+                print("crosswalk: %s" % e)
+                continue
+            self._add(pagename, orm, int(key))
+        return
+
+    def _add(self, pagename, orm, sortkey):
+        self.d_orm[pagename]     = orm
+        self.d_sortkey[pagename] = sortkey
+        self.d_pagename[pagename]        = pagename
+        self.d_pagename[orm.ormapnumber] = pagename
+        self.d_pagename[orm.dotted]      = pagename
+        self.d_pagename[orm.short]       = pagename
+
+    def __len__(self):
+        return len(self.d_orm)
+
+    def __contains__(self, mapnumber):
+        return mapnumber in self.d_pagename
+
+    def pagename(self, mapnumber):
+        """ Return the pagename for a map number in any format, or None. """
+        return self.d_pagename.get(mapnumber)
+
+    def orm(self, mapnumber):
+        """ Return the ORMapNumber for a map number in any format, or None. """
+        return self.d_orm.get(self.d_pagename.get(mapnumber))
+
+    def ormapnumber(self, mapnumber):
+        orm = self.orm(mapnumber)
+        if orm: return orm.ormapnumber
+        return None
+
+    def dotted(self, mapnumber):
+        orm = self.orm(mapnumber)
+        if orm: return orm.dotted
+        return None
+
+    def sortkey(self, mapnumber):
+        return self.d_sortkey.get(self.d_pagename.get(mapnumber))
+
+    def pagenames(self):
+        """ Return all the pagenames, in map number order. """
+        return sorted(self.d_orm, key=self.d_sortkey.get)
+
+    def is_stale(self, stamp=index_stamp):
+        """ Return True if the data source has changed since this was built. """
+        if not self.source:
+            return False
+        return filestamp.is_stale(self.source, self.stamp, stamp)
+
+    def save(self, filename):
+        """ Write the crosswalk to a file.
+        Only the ORMapNumber fields are stored so loading it needs no parsing. """
+        rows = [(pagename, tuple(getattr(orm, f) for f in ORMapNumber._fields), self.d_sortkey[pagename])
+                for pagename, orm in self.d_orm.items()]
+        tmpname = filename + ".tmp"
+        with open(tmpname, "wb") as fp:
+            pickle.dump((self.version, self.source, self.stamp, rows), fp, pickle.HIGHEST_PROTOCOL)
+        if os.path.exists(filename): os.unlink(filename)
+        os.rename(tmpname, filename)
+        return
+
+    @classmethod
+    def load(cls, filename):
+        """ Read a crosswalk from a file written by save().
+        Returns None if the file is missing or can't be used. """
+        try:
+            with open(filename, "rb") as fp:
+                (version, source, stamp, rows) = pickle.load(fp)
+        except Exception as e:
+            return None
+        if version != cls.version:
+            return None
+        cw = cls()
+        cw.source = source
+        cw.stamp  = stamp
+        for pagename, fields, sortkey in rows:
+            cw._add(pagename, ORMapNumber._from_fields(*fields), sortkey)
+        return cw
+
+def load_or_build(filename, source, list_pagenames, stamp=index_stamp):
+    """ Return the crosswalk saved in 'filename' if it is up to date with 'source',
+    otherwise call list_pagenames() to get the pagenames, build a new one and save it. """
+    cw = crosswalk.load(filename)
+    if cw is not None and cw.source == source and not cw.is_stale(stamp):
+        return cw
+    cw = crosswalk(list_pagenames(), source, stamp)
+    try:
+        cw.save(filename)
+    except Exception as e:
+        print("Could not save crosswalk \"%s\", %s" % (filename, e))
+    return cw
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    import tempfile, shutil
+
+    pagenames = ["8 10", "8 10 5", "8 10 5CD", "8 10 5CD D1", "8 10 5CD D2", "8 09 25", "10 07 10BC", "7 08 1AB S1"]
+
+    cw = crosswalk(pagenames)
+    assert cw.pagename("0408.00N10.00W05CD--D001") == "8 10 5CD D1"
+    assert cw.pagename("8.10.5CD D1") == "8 10 5CD D1"
+    assert cw.dotted("8 09 25") == "8.9.25"
+    assert cw.ormapnumber("8 10") == "0408.00N10.00W0000--0000"
+    assert cw.orm("8 10 5CD") is ORMapNumber.expand("8 10 5CD")
+    assert cw.sortkey("8 10 5CD D1") < cw.sortkey("8 10 5CD D2")
+    print(cw.pagenames())
+
+    folder = tempfile.mkdtemp(suffix=".gdb")
+    try:
+        filename = os.path.join(folder, "..", os.path.basename(folder) + ".crosswalk")
+        calls = []
+        def lister():
+            calls.append(1)
+            return pagenames
+        index = {"rows": len(pagenames)}
+        def stamp(source):
+            return (index["rows"], index["rows"]) # (row count, highest OBJECTID)
+        cw = load_or_build(filename, folder, lister, stamp)
+        cw = load_or_build(filename, folder, lister, stamp)
+        assert len(calls) == 1, "crosswalk was rebuilt when it was not stale"
+        assert len(cw) == len(pagenames)
+        assert cw.orm("8.10.5CD D2") is ORMapNumber.expand("8 10 5CD D2")
+
+        # Editing something else in the geodatabase does not matter.
+        with open(os.path.join(folder, "a00000001.gdbtable"), "w") as fp:
+            fp.write("edited")
+        cw = load_or_build(filename, folder, lister, stamp)
+        assert len(calls) == 1, "crosswalk was rebuilt for an edit to another feature class"
+        assert not cw.is_stale(stamp)
+
+        # Adding a map to the index does.
+        index["rows"] += 1
+        assert cw.is_stale(stamp)
+        cw = load_or_build(filename, folder, lister, stamp)
+        assert len(calls) == 2, "crosswalk was not rebuilt when it was stale"
+        os.unlink(filename)
+    finally:
+        shutil.rmtree(folder)
+
+    print("Unit tests completed.")
+# That's all!
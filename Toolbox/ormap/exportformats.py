@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Output formats for printing, and where the time goes.
+
+A print job can ask for more than one format, like "PDF;JPEG:96" for
+the web site and thumbnails. Each page is set up once and then exported
+in each format. Files for the same page only differ in their
+extension, or a resolution tag when one type is asked for twice,
+    ormap8_10_5.pdf  ormap8_10_5.jpg
+    ormap8_10_5_96dpi.jpg  ormap8_10_5_300dpi.jpg
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+
+EXTENSIONS = {"PDF": ".pdf", "JPEG": ".jpg"}
+
+def parse_formats(output_types):
+    """ Return a list of (output_type, ext, resolution) from something like "PDF;JPEG:96",
+    or a list like ["PDF", "JPEG:96"]. Resolution is None if it's not given.
+    Raises ValueError for a format we can't export. """
+    if isinstance(output_types, (list, tuple)):
+        items = output_types
+    else:
+        items = output_types.split(';')
+    l = []
+    for item in items:
+        item = item.strip("\"' ")
+        if not item: continue
+        (output_type, sep, resolution) = item.partition(':')
+        output_type = output_type.strip().upper()
+        if output_type == "JPG": output_type = "JPEG"
+        if output_type == "PRINTER": output_type = "JPEG" # there's no printer export, it always made JPEGs
+        if not output_type in EXTENSIONS:
+            raise ValueError("Can't export to \"%s\"." % item)
+        resolution = int(resolution) if resolution.strip() else None
+        if not (output_type, resolution) in [(t, r) for t, e, r in l]:
+            l.append((output_type, EXTENSIONS[output_type], resolution))
+
+    # Tell apart the files when the same type is wanted at different resolutions.
+    types = [t for t, e, r in l]
+    return [(t, ("_%ddpi" % r + e) if r and types.count(t) > 1 else e, r) for t, e, r in l]
+
+def describe(output_type, resolution):
+    if resolution:
+        return "%s %d dpi" % (output_type, resolution)
+    return output_type
+
+class exporttimer(object):
+    """ Adds up the seconds spent setting up pages and in each exporter. """
+
+    def __init__(self):
+        self.setup   = []
+        self.d_export = {} # lists of seconds indexed by (output_type, resolution)
+        return
+
+    def add_setup(self, seconds):
+        self.setup.append(seconds)
+
+    def add_export(self, output_type, resolution, seconds):
+        self.d_export.setdefault((output_type, resolution), []).append(seconds)
+
+    def summary(self):
+        """ Return a line about where the time went. """
+        if not self.setup:
+            return "No pages set up."
+        parts = ["%d pages, setup %.2f s/page" % (len(self.setup), sum(self.setup) / len(self.setup))]
+        for (output_type, resolution), seconds in sorted(self.d_export.items(), key=lambda i: str(i[0])):
+            parts.append("%s %.2f s/page" % (describe(output_type, resolution), sum(seconds) / len(seconds)))
+        return ", ".join(parts) + "."
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    assert parse_formats("PDF") == [("PDF", ".pdf", None)]
+    assert parse_formats("Printer") == [("JPEG", ".jpg", None)]
+    assert parse_formats("\"PDF\";jpg:96") == [("PDF", ".pdf", None), ("JPEG", ".jpg", 96)]
+    assert parse_formats(["JPEG:96", "JPEG:300", "PDF", "JPEG:96"]) == \
+        [("JPEG", "_96dpi.jpg", 96), ("JPEG", "_300dpi.jpg", 300), ("PDF", ".pdf", None)]
+    try:
+        parse_formats("PDF;TIFF")
+        assert False
+    except ValueError as e:
+        print(e)
+
+    t = exporttimer()
+    assert t.summary() == "No pages set up."
+    for i in range(4):
+        t.add_setup(.5)
+        t.add_export("PDF", None, 2)
+        t.add_export("JPEG", 96, .25)
+    print(t.summary())
+    assert t.summary() == "4 pages, setup 0.50 s/page, JPEG 96 dpi 0.25 s/page, PDF 2.00 s/page."
+
+    print("Unit tests completed.")
+# That's all!
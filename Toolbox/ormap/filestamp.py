@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Cheap "has this data changed?" checks for files and file geodatabases.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import os
+
+WORKSPACES = (".gdb", ".mdb", ".sde")
+MISSING = ("missing",) # stamp of data that is not there
+
+def workspace(path):
+    """ Return the geodatabase part of a data source path, or None if it's not in one.
+    For "C:/GeoModel/ORMAP.gdb/TaxlotsFD/MapIndex" that's "C:/GeoModel/ORMAP.gdb". """
+    while path:
+        if os.path.splitext(path)[1].lower() in WORKSPACES:
+            return path
+        parent = os.path.dirname(path)
+        if parent == path: break
+        path = parent
+    return None
+
+def container(path):
+    """ Return the part of a data source path that is on disk, the geodatabase
+    or for a shapefile the file itself. It does not have to exist.
+    Returns None for an SDE connection, there's nothing on disk to look at. """
+    ws = workspace(path)
+    if ws:
+        if ws.lower().endswith(".sde"):
+            return None
+        return ws
+    return path
+
+def stamp(path):
+    """ Return a value that will change when the data at 'path' changes.
+
+    For a file it's the size and modification time. For a folder,
+    (like a file geodatabase) it's the newest modification time, total
+    size and count of the files in it, ArcGIS rewrites some of them
+    on every edit.
+
+    Returns MISSING if the data is not there (so it's always stale)
+    and None if it's not on a disk at all. """
+
+    c = container(path)
+    if not c:
+        return None
+    if not os.path.exists(c):
+        return MISSING
+    if os.path.isfile(c):
+        st = os.stat(c)
+        return (int(st.st_mtime), st.st_size, 1)
+
+    newest = size = count = 0
+    for f in os.listdir(c):
+        try:
+            st = os.stat(os.path.join(c, f))
+        except OSError:
+            continue # file went away (lock files do that)
+        if f.endswith(".lock"): continue
+        newest = max(newest, int(st.st_mtime))
+        size  += st.st_size
+        count += 1
+    return (newest, size, count)
+
+def is_stale(path, saved_stamp, stamp=stamp):
+    """ Return True if the data at 'path' has changed since 'saved_stamp' was taken.
+    If we can't tell (data is not on a disk) then assume it has not changed.
+    'stamp' can be a stamper() to check several things in one geodatabase. """
+    current = stamp(path)
+    if current is None:
+        return False
+    return current != saved_stamp
+
+class stamper(object):
+    """ Works like stamp() but only looks at each geodatabase once. """
+
+    def __init__(self):
+        self.d_stamp = {} # indexed by container
+        self.looked = 0
+        return
+
+    def __call__(self, path):
+        c = container(path)
+        if not c in self.d_stamp:
+            self.d_stamp[c] = stamp(path)
+            self.looked += 1
+        return self.d_stamp[c]
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    import tempfile, shutil, time
+
+    folder = tempfile.mkdtemp(suffix=".gdb")
+    try:
+        fc = os.path.join(folder, "TaxlotsFD", "MapIndex")
+        assert container(fc) == folder
+        s0 = stamp(fc)
+        print("empty", s0)
+
+        with open(os.path.join(folder, "a00000001.gdbtable"), "w") as fp:
+            fp.write("something")
+        assert is_stale(fc, s0)
+        s1 = stamp(fc)
+        assert not is_stale(fc, s1)
+        print("written", s1)
+
+        assert stamp("Database Connections/nowhere.sde/MapIndex") is None
+        assert not is_stale("Database Connections/nowhere.sde/MapIndex", None)
+
+        # A gdb that went away is stale, and we don't look at the folder it was in.
+        gone = os.path.join(folder, "gone.gdb", "TaxlotsFD", "MapIndex")
+        assert container(gone) == os.path.join(folder, "gone.gdb")
+        assert stamp(gone) == MISSING
+        assert is_stale(gone, s1)
+
+        st = stamper()
+        assert st(fc) == s1 and not is_stale(os.path.join(folder, "PLSS", "Sections"), s1, st)
+        assert st.looked == 1
+    finally:
+        shutil.rmtree(folder)
+
+    print("Unit tests completed.")
+# That's all!
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Time the page layout code against the in-memory backend.
+
+Builds a pretend map document with the dataframes and layers named in
+ORMAP_config and a county's worth of sections, then plans and applies
+a few thousand pages. Then it sets up some of them the way ZoomToMapNumber
+and unplanned pages are, one at a time with the layers counted instead
+of cached. Run it after changing the layout code to see if pages got
+more expensive.
+
+    python layoutbench.py [pages] [delay]
+
+'delay' is seconds added to each backend call, to act more like ArcMap.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import os, sys, time
+from backend import memorybackend, memorydocument, memoryelement, memorydataframe, memorylayer, memoryobject
+from layoutindex import layoutindex
+from locatorcache import locatorcache
+from locatorqueries import compile_locators
+from pageplan import take_snapshot, planner, apply_plan, update_page
+from ormapnum import ORMapNumber
+from mapnum import sort_mapnumbers
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import ORMAP_config as ORMAP
+
+SCALES = [120, 240, 360, 480, 600, 720, 1200, 2400, 4800, 24000]
+
+def make_document(locators, scales=None):
+    """ Return a memorydocument laid out like the county map template.
+    'scales' is a dict of map scales indexed by pagename. """
+    elements = [memoryelement("TEXT_ELEMENT", "PlotDate", 1, 1, 3, .2)]
+    y = 20
+    for dfname,layers,extlayername,extfields,scale,fcount,fcfields in locators:
+        elements.append(memorydataframe(dfname, [memorylayer(name, counts=lambda q: 1) for name,template in layers], 30, y, 5, 3))
+        y -= 4
+    for i, scale in enumerate(SCALES):
+        elements.append(memoryelement("MAPSURROUND_ELEMENT", "scalebar%d" % scale, 40, i, 4, .5))
+    elements.append(memoryelement("MAPSURROUND_ELEMENT", "scalebardefault", 20, 1, 4, .5))
+    elements.append(memoryelement("GRAPHIC_ELEMENT", "cancelled", 30, 6, 4, 3))
+    for i in range(1, 5):
+        elements.append(memoryelement("TEXT_ELEMENT", "can%d" % i, 30 + i, 6, 1, 3))
+    return memorydocument((36, 24), elements, scales=scales)
+
+def make_county():
+    """ Return (pagenames, scales, rows for the section cache). """
+    pagenames = []
+    d_scale = {}
+    rows = []
+    for t in range(4, 10):
+        for r in range(6, 11):
+            pagename = "%d %02d" % (t, r)
+            pagenames.append(pagename)
+            d_scale[pagename] = 24000
+            for s in range(1, 37):
+                x = r*6 + s % 6
+                y = t*6 + s // 6
+                rows.append((t, r, s, (x*5280, y*5280, (x+1)*5280, (y+1)*5280)))
+                pagename = "%d %02d %d" % (t, r, s)
+                pagenames.append(pagename)
+                d_scale[pagename] = 4800
+                for q in "ABCD":
+                    pagenames.append(pagename + q)
+                    d_scale[pagename + q] = 2400
+                    for qq in "ABCD":
+                        pagenames.append(pagename + q + qq)
+                        d_scale[pagename + q + qq] = 1200
+    return sort_mapnumbers(pagenames), d_scale, rows
+
+def run(npages=2000, delay=0):
+    """ Plan and apply pages, then set up some one at a time,
+    return a dict of timings and counts. """
+    locators = compile_locators(ORMAP)
+    pagenames, d_scale, rows = make_county()
+    doc = make_document(locators, d_scale)
+    be = memorybackend(delay)
+    layout = layoutindex(doc, be)
+
+    pagenames = pagenames[:npages]
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nowhere.gdb", "Sections")
+    caches = {}
+    for dfname,layers,extlayername,extfields,scale,fcount,fcfields in locators:
+        if extfields:
+            n = len(extfields)
+            caches[(dfname, "extent")] = locatorcache(source, extfields, [r[:n] + r[-1:] for r in rows])
+        if fcfields:
+            n = len(fcfields)
+            caches[(dfname, "count")] = locatorcache(source, fcfields, [r[:n] for r in rows])
+
+    d_cancelled = {"8.10.5CD": ("100", "200", "300")}
+    p = planner(take_snapshot(layout, be.page_size(doc)), locators, caches,
+                lambda dotted: d_cancelled.get(dotted, ()), ORMAP.MaxCancelledRows, "PLOT DATE: 1/02/2019")
+
+    t0 = time.time()
+    pages = [(pagename, p.plan(ORMapNumber.expand(pagename), d_scale[pagename])) for pagename in pagenames]
+    t1 = time.time()
+
+    writes0 = memoryobject.writes
+    calls0 = be.calls
+    skipped = 0
+    for pagename, ops in pages:
+        apply_plan(doc, pagename, ops, layout, be)
+        skipped += layout.skipped
+    t2 = time.time()
+    calls1 = be.calls
+    writes1 = memoryobject.writes
+
+    # Pages that were not planned ahead, without the feature count caches.
+    live = planner(take_snapshot(layout, be.page_size(doc)), locators,
+                   dict((k, lc) for k, lc in caches.items() if k[1] != "count"),
+                   lambda dotted: d_cancelled.get(dotted, ()), ORMAP.MaxCancelledRows, "PLOT DATE: 1/02/2019")
+    live_pages = pagenames[:max(1, len(pagenames) // 10)]
+    t3 = time.time()
+    for pagename in live_pages:
+        update_page(doc, pagename, ORMapNumber.expand(pagename), live, layout, be)
+    t4 = time.time()
+
+    n = float(len(pages))
+    return {"pages":   len(pages),
+            "plan_us":  (t1-t0)*1e6/n,
+            "apply_us": (t2-t1)*1e6/n,
+            "writes":  (writes1 - writes0)/n,
+            "skipped": skipped/n,
+            "calls":   (calls1 - calls0)/n,
+            "live_pages": len(live_pages),
+            "live_us":    (t4-t3)*1e6/len(live_pages),
+            "live_calls": (be.calls - calls1)/float(len(live_pages))}
+
+# =============================================================================
+if __name__ == "__main__":
+    npages = 2000
+    delay = 0
+    if len(sys.argv) > 1: npages = int(sys.argv[1])
+    if len(sys.argv) > 2: delay = float(sys.argv[2])
+
+    stats = run(npages, delay)
+    print("%(pages)d pages, plan %(plan_us).0f us/page, apply %(apply_us).0f us/page" % stats)
+    print("per page: %(writes).1f writes, %(skipped).1f skipped, %(calls).1f backend calls" % stats)
+    print("%(live_pages)d pages one at a time, %(live_us).0f us/page, %(live_calls).1f backend calls" % stats)
+
+    # Going to a page and redrawing should be nearly all the backend calls a page needs
+    # (township pages ask for an extent), more means something is listing elements or layers again.
+    assert stats["calls"] < 2.5, "%(calls).1f backend calls per page" % stats
+    assert stats["skipped"] > 0, "no writes were skipped"
+    # One at a time adds a feature count for each locator map that hides itself.
+    assert stats["live_calls"] < 5, "%(live_calls).1f backend calls per page one at a time" % stats
+
+    print("Benchmark completed.")
+# That's all!
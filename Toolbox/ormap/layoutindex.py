@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+An index of the layout elements, dataframes and layers in a map document.
+
+Every arcpy.mapping List* call goes back to ArcMap, so doing them for
+every page is slow. This does them once per document and after that
+finding an element or a layer is a dictionary lookup.
+
+Names are looked up without regard to case, the way the List*
+wildcards match them.
+
+It also remembers what was last written to each layer and dataframe,
+ArcMap redraws on every write even if nothing changed, so writing the
+same query or extent for the next page in a township can be skipped.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import os
+from fnmatch import fnmatchcase
+
+def signature(mxd):
+    """ Return a value that changes when the map document is saved. """
+    path = mxd.filePath
+    try:
+        mtime = os.path.getmtime(path)
+    except (OSError, TypeError):
+        mtime = None
+    return (path, mtime)
+
+class layoutindex(object):
+    """ Layout elements indexed by type and name, dataframes by name,
+    and layers by dataframe name and layer name. """
+
+    def __init__(self, mxd, backend=None):
+        """ mxd      an arcpy.mapping.MapDocument (or a backend.memorydocument)
+            backend  what to list things with, defaults to arcpy.mapping """
+        if backend is None:
+            from backend import arcpybackend
+            backend = arcpybackend()
+        self.mxd = mxd
+        self.signature = signature(mxd)
+        self.d_elements   = {} # lists of elements indexed by type, in layout order
+        self.d_element    = {} # element indexed by (type, lower case name)
+        self.d_dataframe  = {} # dataframe indexed by lower case name
+        self.d_layer      = {} # layer indexed by (dataframe name, layer name), both lower case
+        self.d_applied    = {} # last state written, indexed by a key like ("query", dfname, layername)
+        self.writes = self.skipped = 0 # counts for the current page
+
+        for elem in backend.list_elements(mxd):
+            self.d_elements.setdefault(elem.type, []).append(elem)
+            # Names don't have to be unique, ListLayoutElements()[0] would get the first one.
+            self.d_element.setdefault((elem.type, elem.name.lower()), elem)
+
+        for df in backend.list_dataframes(mxd):
+            self.d_dataframe.setdefault(df.name.lower(), df)
+            for layer in backend.list_layers(mxd, df):
+                self.d_layer.setdefault((df.name.lower(), layer.name.lower()), layer)
+        return
+
+    def is_stale(self, mxd):
+        """ Return True if this index can't be used for 'mxd'.
+        This looks at the file, so don't call it for every lookup. """
+        return mxd is not self.mxd or signature(mxd) != self.signature
+
+    def elements(self, elemtype, wildcard="*"):
+        """ Return the elements of one type with names that match a wildcard like "can*". """
+        if wildcard == "*":
+            return list(self.d_elements.get(elemtype, []))
+        wildcard = wildcard.lower()
+        return [e for e in self.d_elements.get(elemtype, []) if fnmatchcase(e.name.lower(), wildcard)]
+
+    def element(self, elemtype, name):
+        """ Return the named element or None. Wildcards work too. """
+        try:
+            return self.d_element[(elemtype, name.lower())]
+        except KeyError:
+            pass
+        l = self.elements(elemtype, name)
+        if l: return l[0]
+        return None
+
+    def dataframe(self, dfname):
+        """ Return the named dataframe or None. """
+        return self.d_dataframe.get(dfname.lower())
+
+    def layer(self, df, layername):
+        """ Return the named layer in a dataframe (object or name) or None. """
+        dfname = getattr(df, "name", df)
+        return self.d_layer.get((dfname.lower(), layername.lower()))
+
+    def start_page(self):
+        """ Reset the write counters. """
+        self.writes = self.skipped = 0
+        return
+
+    def unchanged(self, key, state):
+        """ Return True if 'state' is what was last written for 'key',
+        so writing it again can be skipped. """
+        if key in self.d_applied and self.d_applied[key] == state:
+            self.skipped += 1
+            return True
+        return False
+
+    def applied(self, key, state):
+        """ Remember that 'state' was written for 'key'. """
+        self.d_applied[key] = state
+        self.writes += 1
+        return
+
+    def forget(self, kind):
+        """ Forget what was written for keys starting with 'kind',
+        for when they get changed without going through here. """
+        for key in [k for k in self.d_applied if k[0] == kind]:
+            del self.d_applied[key]
+        return
+
+    def assign(self, key, obj, attr, value):
+        """ Set obj.attr = value unless that's what was last written.
+        Returns True if it was written. """
+        if self.unchanged(key, value):
+            return False
+        setattr(obj, attr, value)
+        self.applied(key, value)
+        return True
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests, with the in-memory backend
+    import tempfile
+    from backend import memorybackend, memorydocument, memoryelement, memorydataframe, memorylayer
+
+    (fd, mxdname) = tempfile.mkstemp(suffix=".mxd")
+    os.close(fd)
+
+    sections = memorydataframe("SectionsDF", [memorylayer("Sections"), memorylayer("Section - highlight")])
+    def document():
+        return memorydocument((36, 24),
+            [memoryelement("TEXT_ELEMENT", "PlotDate"), memoryelement("TEXT_ELEMENT", "can1"), memoryelement("TEXT_ELEMENT", "Can2"),
+             memoryelement("TEXT_ELEMENT", "cantitle"), memoryelement("GRAPHIC_ELEMENT", "cancelled"), sections,
+             memoryelement("MAPSURROUND_ELEMENT", "scalebar1200"), memoryelement("MAPSURROUND_ELEMENT", "ScaleBarDefault")],
+            mxdname)
+    be = memorybackend()
+
+    mxd = document()
+    try:
+        idx = layoutindex(mxd, be)
+        n = be.calls
+        assert idx.element("TEXT_ELEMENT", "PlotDate").name == "PlotDate"
+        assert idx.element("TEXT_ELEMENT", "plotdate").name == "PlotDate"
+        assert idx.element("TEXT_ELEMENT", "Nothing") is None
+        assert idx.element("GRAPHIC_ELEMENT", "can*").name == "cancelled"
+        assert [e.name for e in idx.elements("TEXT_ELEMENT", "can*")] == ["can1", "Can2", "cantitle"]
+        assert len(idx.elements("MAPSURROUND_ELEMENT")) == 2
+        assert idx.element("DATAFRAME_ELEMENT", "SectionsDF") is sections
+        assert idx.dataframe("SectionsDF") is sections
+        assert idx.dataframe("sectionsdf") is sections
+        assert idx.layer(sections, "Sections").name == "Sections"
+        assert idx.layer("SectionsDF", "Section - highlight").name == "Section - highlight"
+        assert idx.layer("SECTIONSDF", "section - HIGHLIGHT").name == "Section - highlight"
+        assert idx.layer("SectionsDF", "Township") is None
+        assert be.calls == n, "lookups should not call the backend"
+
+        layer = idx.layer("SectionsDF", "Sections")
+        idx.start_page()
+        assert idx.assign(("query", "SectionsDF", "Sections"), layer, "definitionQuery", "TOWN = '8'")
+        idx.start_page()
+        assert not idx.assign(("query", "SectionsDF", "Sections"), layer, "definitionQuery", "TOWN = '8'")
+        assert idx.assign(("query", "SectionsDF", "Sections"), layer, "definitionQuery", "TOWN = '7'")
+        assert layer.definitionQuery == "TOWN = '7'"
+        assert (idx.writes, idx.skipped) == (1, 1)
+        idx.forget("query")
+        assert idx.assign(("query", "SectionsDF", "Sections"), layer, "definitionQuery", "TOWN = '7'")
+
+        assert not idx.is_stale(mxd)
+        assert idx.is_stale(document())
+        os.utime(mxdname, (0, 0)) # saved
+        assert idx.is_stale(mxd)
+    finally:
+        os.unlink(mxdname)
+
+    print("Unit tests completed.")
+# That's all!
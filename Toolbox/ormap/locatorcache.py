@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+What the locator maps need to know about the PLSS layers, read in one pass.
+
+Deciding whether to hide a locator map used to take a GetCount on the
+layer for every page. Reading the section layer once and keeping a set
+of the township/range/section combinations in it makes it a set lookup.
+
+Panning a locator map used to take a getExtent() on the layer after
+setting its query. The extent of each combination is collected in the
+same pass, so that's a dict lookup too.
+
+The caches are saved in a file next to the MXD and read back until
+the data they came from changes. Data in SDE has no files to look at,
+so a cache of it is read again when it gets older than a set number
+of hours instead.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import os
+from time import time
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import filestamp
+
+def _text(value):
+    """ Turn a field value into text the way a query would compare it,
+    so 8, 8.0 and u"8" all come out as u"8". """
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return (u"%s" % value).strip()
+
+def _union(a, b):
+    if a is None: return b
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+class locatorcache(object):
+    """ The keys like ("8","10","5") that have features in a layer, and their extents.
+    fields  list of (fieldname, ORMapNumber attribute) that make up a key. """
+
+    def __init__(self, source, fields, rows=()):
+        """ source  data source of the layer, used for staleness checks
+            rows    tuples of the field values, optionally followed by
+                    the extent of the feature as (xmin, ymin, xmax, ymax) """
+        self.source   = source
+        self.fields   = [f for f,a in fields]
+        self.attrs    = [a for f,a in fields]
+        self.stamp    = filestamp.stamp(source)
+        self.read_at  = time()
+        self.d_extent = {} # extent of all the features with a key, indexed by key
+        n = len(self.fields)
+        for row in rows:
+            key = tuple(_text(v) for v in row[:n])
+            extent = self.d_extent.get(key)
+            if len(row) > n and row[n]:
+                extent = _union(extent, row[n])
+            self.d_extent[key] = extent
+        return
+
+    def __len__(self):
+        return len(self.d_extent)
+
+    def key(self, orm):
+        return tuple(_text(getattr(orm, a)) for a in self.attrs)
+
+    def has_features(self, orm):
+        """ Return True if the layer has features for this map number. """
+        return self.key(orm) in self.d_extent
+
+    def extent(self, orm):
+        """ Return (xmin, ymin, xmax, ymax) of the features for this map number, or None. """
+        return self.d_extent.get(self.key(orm))
+
+    def is_stale(self, max_age=None, stamp=filestamp.stamp):
+        """ Return True if the data source has changed since this was read.
+        This lists the geodatabase, so do it once per batch and not for each page,
+        and pass a filestamp.stamper() when checking several caches.
+        If there's nothing on disk to look at (SDE) it's stale when it's
+        more than 'max_age' hours old, and never if max_age is None. """
+        if self.stamp is None:
+            return max_age is not None and time() - self.read_at > max_age * 3600
+        return filestamp.is_stale(self.source, self.stamp, stamp)
+
+version = 2 # Change this if the file format changes, so old files get ignored.
+
+def save(filename, d_cache):
+    """ Write a dict of locatorcache objects to a file. """
+    rows = [(k, lc.source, list(zip(lc.fields, lc.attrs)), lc.stamp, lc.read_at, lc.d_extent)
+            for k, lc in d_cache.items()]
+    tmpname = filename + ".tmp"
+    with open(tmpname, "wb") as fp:
+        pickle.dump((version, rows), fp, pickle.HIGHEST_PROTOCOL)
+    if os.path.exists(filename): os.unlink(filename)
+    os.rename(tmpname, filename)
+    return
+
+def load(filename, max_age=None):
+    """ Read the caches written by save(), leaving out any that are stale.
+    Returns an empty dict if the file is missing or can't be used. """
+    try:
+        with open(filename, "rb") as fp:
+            (v, rows) = pickle.load(fp)
+    except Exception as e:
+        return {}
+    if v != version:
+        return {}
+    d_cache = {}
+    for k, source, fields, stamp, read_at, d_extent in rows:
+        lc = locatorcache(source, fields)
+        if lc.stamp != stamp: continue
+        lc.read_at  = read_at
+        if lc.is_stale(max_age): continue
+        lc.d_extent = d_extent
+        d_cache[k] = lc
+    return d_cache
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    import tempfile, shutil
+    from ormapnum import ORMapNumber
+
+    fields = [("TOWN", "township"), ("RANGE", "range"), ("SECTION", "section")]
+    folder = tempfile.mkdtemp(suffix=".gdb")
+    try:
+        source = os.path.join(folder, "PLSS", "Sections")
+        rows = [(u"8", u"10", u"5", (0,0,10,10)), (8, 10, 5, (10,5,20,10)), (8.0, 9.0, 1.0, (30,0,40,10)),
+                (u" 7", u"10 ", u"1", None)]
+        lc = locatorcache(source, fields, rows)
+        assert len(lc) == 3
+        assert lc.has_features(ORMapNumber.expand("8 10 5CD D1"))
+        assert lc.has_features(ORMapNumber.expand("8 09 1AB"))
+        assert lc.has_features(ORMapNumber.expand("7 10 1"))
+        assert not lc.has_features(ORMapNumber.expand("8 10 7"))
+        assert not lc.has_features(ORMapNumber.expand("8 10")) # no section 0
+        assert lc.extent(ORMapNumber.expand("8 10 5")) == (0,0,20,10)
+        assert lc.extent(ORMapNumber.expand("7 10 1")) is None
+        assert lc.extent(ORMapNumber.expand("8 10 7")) is None
+
+        townships = locatorcache(source, fields[:2], [(t, r, e) for t,r,s,e in rows])
+        assert townships.extent(ORMapNumber.expand("8 10 5CD")) == (0,0,20,10)
+
+        filename = os.path.join(folder, "..", os.path.basename(folder) + ".locators")
+        save(filename, {"sections": lc, "townships": townships})
+        d = load(filename)
+        assert sorted(d) == ["sections", "townships"]
+        assert d["sections"].extent(ORMapNumber.expand("8 09 1")) == (30,0,40,10)
+        assert d["townships"].attrs == ["township", "range"]
+
+        assert not lc.is_stale()
+        st = filestamp.stamper()
+        assert not lc.is_stale(stamp=st) and not townships.is_stale(stamp=st)
+        assert st.looked == 1
+        with open(os.path.join(folder, "a00000001.gdbtable"), "w") as fp:
+            fp.write("edited")
+        assert lc.is_stale()
+        assert load(filename) == {}
+        os.unlink(filename)
+
+        # Nothing on disk, it goes by age.
+        sde = locatorcache("C:/connections/gis.sde/ORMAP.Sections", fields, rows)
+        assert sde.stamp is None
+        assert not sde.is_stale() and not sde.is_stale(24)
+        sde.read_at -= 25 * 3600
+        assert sde.is_stale(24) and not sde.is_stale()
+        save(filename, {"sde": sde})
+        assert load(filename, max_age=24) == {}
+        assert sorted(load(filename, max_age=48)) == ["sde"]
+        assert sorted(load(filename)) == ["sde"]
+        os.unlink(filename)
+    finally:
+        shutil.rmtree(folder)
+
+    print("Unit tests completed.")
+# That's all!
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Definition queries for the locator maps, compiled once from ORMAP_config.
+
+The config has each query as a Python expression that uses "orm", like
+    '"TOWN = \'{0}\' AND RANGE = \'{1}\'".format(orm.township, orm.range)'
+Compiling it once and trying it on a sample map number means a typo
+shows up when the toolbox loads instead of on page 200 of a print run.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+from ormapnum import ORMapNumber
+
+# Map number used to check the queries
+SAMPLE = "8 10 5CD D1"
+
+class querytemplate(object):
+    """ One query expression, compiled. Call it with an ORMapNumber to get the SQL. """
+
+    def __init__(self, source, name="query"):
+        self.source = source
+        self.name = name
+        self.code = None
+        if source:
+            try:
+                self.code = compile(source, "<%s>" % name, "eval")
+            except SyntaxError as e:
+                raise ValueError("Query for \"%s\" is not valid, %s: %s" % (name, e, source))
+        return
+
+    def __call__(self, orm):
+        if self.code is None:
+            return ""
+        return eval(self.code, {}, {"orm": orm})
+
+    def check(self, orm):
+        """ Try the query on a map number, raise ValueError if it does not work. """
+        try:
+            query = self(orm)
+        except Exception as e:
+            raise ValueError("Query for \"%s\" failed on \"%s\", %s: %s" % (self.name, orm.short, e, self.source))
+        if not isinstance(query, basestring):
+            raise ValueError("Query for \"%s\" returned %r, not a string: %s" % (self.name, query, self.source))
+        return query
+
+def compile_layers(layers, prefix=""):
+    """ Compile a list of (layername, query source) tuples from the config
+    into a list of (layername, querytemplate) and check each one.
+    Raises ValueError for the first query that does not work. """
+    orm = ORMapNumber.expand(SAMPLE)
+    compiled = []
+    for layername, source in layers:
+        template = querytemplate(source, prefix + layername)
+        template.check(orm)
+        compiled.append((layername, template))
+    return compiled
+
+def compile_locators(config):
+    """ Return the locator map settings from the config module as a list of
+    (dfname, [(layername, querytemplate)...], extent layer, extent fields, scale,
+     feature count layer, feature count fields). """
+    locators = []
+    for name in ("Locator", "Section", "QSection"):
+        dfname = getattr(config, name + "DF")
+        locators.append((dfname,
+                         compile_layers(getattr(config, name + "Layers"), dfname + "/"),
+                         getattr(config, name + "ExtentLayer"),
+                         getattr(config, name + "ExtentFields", None),
+                         getattr(config, name + "Scale"),
+                         getattr(config, name + "FeatureCount"),
+                         getattr(config, name + "FeatureCountFields", None)))
+    return locators
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    import os, sys, time
+
+    q = querytemplate('"TOWN = \'{0}\' AND RANGE = \'{1}\'".format(orm.township, orm.range)', "Sections")
+    assert q(ORMapNumber.expand("8 10 5CD")) == "TOWN = '8' AND RANGE = '10'"
+    assert querytemplate("")(ORMapNumber.expand("8 10")) == ""
+    assert querytemplate(None)(ORMapNumber.expand("8 10")) == ""
+
+    for source in ['"TR=\'{0}\'".format(orm.township', # syntax error
+                   '"TR=\'{0}\'".format(orm.townsip)', # no such attribute
+                   'orm.township', # not a string
+                   ]:
+        try:
+            compile_layers([("Township", source)])
+            assert False, "\"%s\" should have failed" % source
+        except ValueError as e:
+            print(e)
+
+    # The real config
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    import ORMAP_config
+    locators = compile_locators(ORMAP_config)
+    orm = ORMapNumber.expand("8 10 5CD")
+    for dfname, layers, extlayername, extfields, scale, fcount, fcfields in locators:
+        for layername, template in layers:
+            query = template(orm)
+            assert query == eval(template.source), query
+            print("%s/%s: %s" % (dfname, layername, query))
+
+    layername, template = locators[1][1][0]
+    n = 10000
+    t0 = time.time()
+    for i in range(n):
+        eval(template.source)
+    t1 = time.time()
+    for i in range(n):
+        template(orm)
+    t2 = time.time()
+    print("eval %.1f us, compiled %.1f us" % ((t1-t0)*1e6/n, (t2-t1)*1e6/n))
+
+    print("Unit tests completed.")
+# That's all!
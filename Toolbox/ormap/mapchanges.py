@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Find the maps whose content changed since they were last printed.
+
+Every feature in the feature classes that are drawn on the maps
+(taxlots, tax codes, lines, annotation) is hashed, geometry and
+attributes together, and the hash is added to each page in the DDP
+index that the feature touches. The sum of the hashes (so the order
+the features are read in does not matter) plus the page's cancelled
+taxlots is the page's fingerprint. A page whose fingerprint is not the
+same as the one saved when it was last printed needs to be printed.
+
+Pages are found with a grid over their extents first, then the exact
+shapes are checked only for the pages in the feature's grid cells.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import os, hashlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+from mapnum import sort_mapnumbers
+from printmanifest import fingerprint
+
+MODULUS = 2**128
+
+def feature_hash(*values):
+    """ Return a feature's hash as a number. """
+    return int(hashlib.md5(repr(values).encode("utf-8")).hexdigest(), 16)
+
+def overlaps(a, b):
+    """ Return True if two boxes (xmin,ymin,xmax,ymax) touch. """
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+class pagehashes(object):
+    """ Adds up feature hashes for each page. """
+
+    def __init__(self, pages, cellsize=None):
+        """ pages     list of (pagename, box, shape)
+            cellsize  size of a grid cell, defaults to the average page width """
+        self.pages = list(pages)
+        if cellsize is None:
+            widths = [box[2] - box[0] for pagename,box,shape in self.pages]
+            cellsize = (sum(widths) / len(widths)) if widths else 1
+        self.cellsize = float(cellsize) or 1.0
+        self.d_grid = {}
+        for i, (pagename, box, shape) in enumerate(self.pages):
+            for cell in self._cells(box):
+                self.d_grid.setdefault(cell, []).append(i)
+        self.sums   = [0] * len(self.pages)
+        self.counts = [0] * len(self.pages)
+        self.features = 0
+        return
+
+    def _cells(self, box):
+        (x0, y0) = (int(box[0] // self.cellsize), int(box[1] // self.cellsize))
+        (x1, y1) = (int(box[2] // self.cellsize), int(box[3] // self.cellsize))
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield (x, y)
+
+    def add(self, box, shape, h, intersects=None):
+        """ Add a feature's hash 'h' to every page it touches.
+        'intersects(page_shape, shape)' does the exact test, without it the boxes are enough. """
+        self.features += 1
+        seen = set()
+        for cell in self._cells(box):
+            for i in self.d_grid.get(cell, ()):
+                if i in seen: continue
+                seen.add(i)
+                (pagename, pagebox, pageshape) = self.pages[i]
+                if not overlaps(box, pagebox):
+                    continue
+                if intersects and not intersects(pageshape, shape):
+                    continue
+                self.sums[i] = (self.sums[i] + h) % MODULUS
+                self.counts[i] += 1
+        return
+
+    def mark(self):
+        """ Return the sums so far, to go back to with rollback(). """
+        return (list(self.sums), list(self.counts), self.features)
+
+    def rollback(self, mark):
+        """ Forget the features added since mark() was called. """
+        (sums, counts, self.features) = mark
+        self.sums, self.counts = list(sums), list(counts)
+        return
+
+    def fingerprints(self, cancelled=None):
+        """ Return a dict of fingerprints indexed by pagename.
+        'cancelled' is a dict of cancelled taxlots indexed by pagename. """
+        d = {}
+        for i, (pagename, box, shape) in enumerate(self.pages):
+            d[pagename] = fingerprint(self.sums[i], self.counts[i], (cancelled or {}).get(pagename, ()))
+        return d
+
+def changed(saved, current):
+    """ Return the pagenames in 'current' whose fingerprint is not the one in 'saved', in map order. """
+    return sort_mapnumbers([pagename for pagename, fp in current.items() if saved.get(pagename) != fp])
+
+# =============================================================================
+# Reading the geodatabase
+
+def _box(shape):
+    e = shape.extent
+    return (e.XMin, e.YMin, e.XMax, e.YMax)
+
+def read_pages(source, pagefield):
+    """ Return a list of (pagename, box, shape) from a DDP index. """
+    import arcpy
+    pages = []
+    with arcpy.da.SearchCursor(source, [pagefield, "SHAPE@"]) as cursor:
+        for (pagename, shape) in cursor:
+            if pagename and shape:
+                pages.append((pagename, _box(shape), shape))
+    return pages
+
+def read_features(source, sr=None):
+    """ Return (box, shape, hash) for each feature in a feature class,
+    in the coordinates of 'sr' if it's given. """
+    import arcpy
+    fields = [f.name for f in arcpy.ListFields(source) if not f.type in ("Geometry", "Blob", "Raster")]
+    with arcpy.da.SearchCursor(source, fields + ["SHAPE@"], spatial_reference=sr) as cursor:
+        for row in cursor:
+            shape = row[-1]
+            if not shape: continue
+            yield (_box(shape), shape, feature_hash(row[:-1], bytes(shape.WKB)))
+
+def page_fingerprints(index_source, pagefield, sources, cancelled=None, report=print):
+    """ Read the DDP index and the feature classes and return a dict of fingerprints indexed by pagename.
+    A feature class that is missing or can't be read is reported and left out. """
+    import arcpy
+    pages = read_pages(index_source, pagefield)
+    sr = arcpy.Describe(index_source).spatialReference
+    ph = pagehashes(pages)
+    for source in sources:
+        if not arcpy.Exists(source):
+            if report: report("Feature class \"%s\" does not exist, changes to it will not be noticed. Check ChangeFeatureClasses in ORMAP_config." % source)
+            continue
+        mark = ph.mark()
+        try:
+            for (box, shape, h) in read_features(source, sr):
+                ph.add(box, shape, h, lambda page, shape: not page.disjoint(shape))
+        except Exception as e:
+            ph.rollback(mark)
+            if report: report("Can't read \"%s\", changes to it will not be noticed. %s" % (source, e))
+            continue
+        if report: report("Read %d features from \"%s\"." % (ph.features - mark[2], source))
+    return ph.fingerprints(cancelled)
+
+version = 1 # Change this if the file format changes, so old files get ignored.
+
+def save(filename, d):
+    """ Save fingerprints, a dict indexed by pagename. """
+    tmpname = filename + ".tmp"
+    with open(tmpname, "wb") as fp:
+        pickle.dump((version, d), fp, pickle.HIGHEST_PROTOCOL)
+    if os.path.exists(filename): os.unlink(filename)
+    os.rename(tmpname, filename)
+    return
+
+def load(filename):
+    """ Return the saved fingerprints, or {} if there are none. """
+    try:
+        with open(filename, "rb") as fp:
+            (v, d) = pickle.load(fp)
+        if v == version:
+            return d
+    except Exception as e:
+        pass
+    return {}
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    import tempfile, time
+
+    assert overlaps((0,0,10,10), (10,10,20,20))
+    assert not overlaps((0,0,10,10), (11,0,20,10))
+
+    # A township with 36 sections, and quarter sections in section 1.
+    pages = [("8 10", (0,0,6,6), None)]
+    for s in range(36):
+        x, y = s % 6, s // 6
+        pages.append(("8 10 %d" % (s+1), (x,y,x+1,y+1), None))
+    for q, (x, y) in zip("ABCD", [(.5,.5), (0,.5), (0,0), (.5,0)]):
+        pages.append(("8 10 1" + q, (x,y,x+.5,y+.5), None))
+
+    def fingerprints(features, cancelled=None):
+        ph = pagehashes(pages)
+        for box, values in features:
+            ph.add(box, None, feature_hash(values))
+        return ph.fingerprints(cancelled)
+
+    features = [((.1,.1,.2,.2), ("100", "8 10 1C")),   # in 1C
+                ((3.2,3.2,3.4,3.4), ("200", "8 10 22")),
+                ((.4,.6,.6,.7), ("line",))]            # across 1A and 1B
+    before = fingerprints(features)
+    assert changed(before, before) == []
+    assert changed({}, before)[:3] == ["8 10", "8 10 1", "8 10 1A"]
+
+    # The order they are read in does not matter.
+    assert fingerprints(list(reversed(features))) == before
+
+    # Edit the taxlot in 1C
+    after = fingerprints([((.1,.1,.2,.2), ("100", "8 10 1C", "edited"))] + features[1:])
+    assert changed(before, after) == ["8 10", "8 10 1", "8 10 1C"]
+
+    # Move the line
+    after = fingerprints(features[:2] + [((.6,.6,.7,.7), ("line",))])
+    assert changed(before, after) == ["8 10 1B"]
+
+    # New cancelled taxlots
+    after = fingerprints(features, {"8 10 22": ("200",)})
+    assert changed(before, after) == ["8 10 22"]
+
+    # A feature class that fails part way through is left out.
+    ph = pagehashes(pages)
+    for box, values in features[:1]:
+        ph.add(box, None, feature_hash(values))
+    mark = ph.mark()
+    ph.add((3.2,3.2,3.4,3.4), None, feature_hash("half read"))
+    ph.rollback(mark)
+    assert ph.fingerprints() == fingerprints(features[:1]) and ph.features == 1
+
+    # An exact shape test
+    ph = pagehashes(pages)
+    ph.add((0,0,6,6), "diagonal", 1, lambda page, shape: page is None)
+    assert sum(ph.counts) == len(pages)
+
+    # A county's worth of features
+    t0 = time.time()
+    ph = pagehashes(pages)
+    for i in range(100000):
+        x, y = (i % 300) / 50.0, (i // 300) / 56.0
+        ph.add((x, y, x+.01, y+.01), None, feature_hash(i))
+    print("Hashed %d features in %.2f s" % (ph.features, time.time() - t0))
+
+    filename = os.path.join(tempfile.gettempdir(), "mapchanges-unittest.changes")
+    save(filename, before)
+    assert load(filename) == before
+    os.unlink(filename)
+    assert load(filename) == {}
+
+    print("Unit tests completed.")
+# That's all!
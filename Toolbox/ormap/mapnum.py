@@ -5,6 +5,43 @@ Created on Wed Dec 27 12:09:30 2017
 """
 from __future__ import print_function
 import re
+from itertools import groupby
+
+# New dot or space format
+re_mapnum = re.compile(r'(\d+)[\s\.](\d+)([\s\.](\d+)([A-D]?[A-D]?))?(\s([DST]?\d+))?')
+
+# Offsets into a sort key, it's TTRRSSQQSSSS as a decimal number
+_T  = 10**10
+_R  = 10**8
+_S  = 10**6
+_Q  = 10**5
+_QQ = 10**4
+d_suffix = {'D':1000, 'S':2000, 'T':3000}
+UNSORTABLE = 10**12 # key for things that are not map numbers, they go at the end
+
+def sortkey(t, r, s=0, q="", sfx=""):
+    """ Return TRSQ as a long number, useful for sorting lists.
+    q is letters like "AB", sfx is a map suffix like "D1". """
+    key = t*_T + r*_R + s*_S
+    # Convert QQ from letters like AA into a number from 00 to 44
+    if q:
+        key += (ord(q[0]) - (ord("A")-1)) * _Q
+        if len(q) > 1:
+            key += (ord(q[1]) - (ord("A")-1)) * _QQ
+    if sfx:
+        key += d_suffix[sfx[0]] + int(sfx[1:])
+    return key
+
+def split_key(key):
+    """ Split a sort key into (township, section, suffix) for grouping pages.
+    'township' is township and range as one number, 8 10 is 810, 'section' is
+    township, range and section, 8 10 5 is 81005, and 'suffix' is the map
+    suffix, D1 is 1001. Keys of things that are not map numbers give
+    (UNSORTABLE, UNSORTABLE, 0). """
+    key = int(key)
+    if key >= UNSORTABLE:
+        return (UNSORTABLE, UNSORTABLE, 0)
+    return (key // _R, key // _S, key % _QQ)
 
 # =============================================================================
 class mapnum(object):
@@ -19,8 +56,7 @@ class mapnum(object):
         # Old dotted format
         #mo = re.match(r'(\d+)\.(\d+)(\.(\d+)([A-D]?[A-D]?))?(\s([DST]?\d+))?', m.upper())
 
-        # New dot or space format
-        mo = re.match(r'(\d+)[\s\.](\d+)([\s\.](\d+)([A-D]?[A-D]?))?(\s([DST]?\d+))?', m.upper())
+        mo = re_mapnum.match(m.upper())
 
         try:
             self.__t = int(mo.group(1))
@@ -58,21 +94,7 @@ class mapnum(object):
     @property
     def number(self):
         """ Return TRSQ as a long number, useful for sorting lists. """
-        s = self.__s
-        if not s: s = 0
-        
-        # Convert QQ from letters like AA into a number from 00 to 44
-        q = qq = 0
-        if len(self.__q) >= 1:
-            q = ord(self.__q[0]) - (ord("A")-1)
-            if len(self.__q) > 1:
-                qq = ord(self.__q[1]) - (ord("A")-1)
-        sfx = 0
-        if self.__mapsuffix:
-            dtyp = {'D':1000, 'S':2000, 'T':3000}
-            sfx = dtyp[self.__mapsuffix[0]] + int(self.__mapsuffix[1:]) 
-
-        return int("%2d%02d%02d%d%d%04d" % (self.__t, self.__r, s, q, qq, sfx))
+        return sortkey(self.__t, self.__r, self.__s or 0, self.__q, self.__mapsuffix)
     
     def __str__(self):
         if self.__s > 0:
@@ -83,6 +105,106 @@ class mapnum(object):
             rval += ' ' + self.__mapsuffix
         return rval
 
+# =============================================================================
+
+def _is_ormapnum(m):
+    return len(m) >= 23 and not ' ' in m.strip()
+
+# re_mapnum for a list of map numbers joined with newlines, there's a match for every line.
+# Whitespace in a map number can't be a newline, so [^\S\n] is used for \s.
+re_mapnum_lines = re.compile(r'^[^\S\n]*(?:(\d+)(?:[^\S\n]|\.)(\d+)(?:(?:[^\S\n]|\.)(\d+)([A-D]?[A-D]?))?(?:[^\S\n]([DST]?\d+))?)?[^\n]*$',
+                             re.MULTILINE)
+
+def _bytes(column):
+    """ Return a column of byte strings as an (n, width) array of byte codes, 0 padded. """
+    import numpy as np
+    column = np.ascontiguousarray(column)
+    return column.view('u1').reshape(len(column), column.dtype.itemsize).astype('i8')
+
+def _numbers(column):
+    """ Return the digits in each of a column of byte strings as an integer,
+    "" is 0 and letters are skipped, so "D12" is 12. """
+    import numpy as np
+    n = np.zeros(len(column), dtype='i8')
+    for c in _bytes(column).T:
+        digit = (c >= ord('0')) & (c <= ord('9'))
+        n = np.where(digit, n*10 + c - ord('0'), n)
+    return n
+
+def sortkeys(mapnumbers):
+    """ Return a numpy array with the sort key for each map number in a list.
+    They can be pagenames "8 10 5CD D1", dotted "8.10.5CD D1" or ORMAPNUMs.
+    Anything that's not a map number gets the key UNSORTABLE. """
+    import numpy as np
+    import ormapcodec
+
+    mapnumbers = list(mapnumbers)
+    n = len(mapnumbers)
+    keys = np.full(n, UNSORTABLE, dtype='i8')
+    if not n: return keys
+
+    # ORMAPNUMs get decoded all at once.
+    is_orm = np.array([bool(m) and _is_ormapnum(m) for m in mapnumbers], dtype='?')
+    l_orm = np.flatnonzero(is_orm)
+    if len(l_orm):
+        a = ormapcodec.unpack([mapnumbers[i] for i in l_orm])
+        q, qq = [np.where(a[col] == b'', 0, a[col].view('u1').astype('i8') - (ord("A")-1)).clip(0)
+                 for col in ('quarter', 'quarterquarter')]
+        sfxtype = a['mapsuffixtype'].view('u1')
+        sfx = np.select([sfxtype == ord('D'), sfxtype == ord('S'), sfxtype == ord('T')],
+                        [1000, 2000, 3000], 0) + np.where(sfxtype == ord('0'), 0, a['mapsuffixnumber'])
+        keys[l_orm] = np.where(a['valid'],
+                               a['township'].astype('i8')*_T + a['range'].astype('i8')*_R
+                               + a['section'].astype('i8')*_S + q*_Q + qq*_QQ + sfx,
+                               UNSORTABLE)
+
+    # Everything else in one pass of the regular expression over all of them
+    # joined into one string, anything that's not a short map number (an ORMAPNUM,
+    # an empty pagename) becomes "-" so that it can't match.
+    l_short = np.flatnonzero(~is_orm)
+    if len(l_short):
+        text = "\n".join([(mapnumbers[i] or "-").replace("\n", " ") for i in l_short]).upper()
+        found = np.array(re_mapnum_lines.findall(text), dtype='S').reshape(-1, 5)
+        assert len(found) == len(l_short)
+        (t, r, s, letters, suffix) = found.T
+        ok = t != b""
+        letters = np.array(letters, dtype='S2')
+        q, qq = [np.where(c > 0, c - (ord("A")-1), 0) for c in _bytes(letters).T]
+        sfxtype = _bytes(np.array(suffix, dtype='S1'))[:,0]
+        sfx = np.select([sfxtype == ord('D'), sfxtype == ord('S'), sfxtype == ord('T')],
+                        [1000, 2000, 3000], 0) + _numbers(suffix)
+        keys[l_short] = np.where(ok, _numbers(t)*_T + _numbers(r)*_R + _numbers(s)*_S + q*_Q + qq*_QQ + sfx,
+                                 UNSORTABLE)
+    return keys
+
+def sort_mapnumbers(mapnumbers):
+    """ Return a list of map numbers in map number order.
+    Map numbers can be in any of the formats sortkeys() knows about. """
+    import numpy as np
+    mapnumbers = list(mapnumbers)
+    order = np.argsort(sortkeys(mapnumbers), kind='mergesort') # mergesort is stable
+    return [mapnumbers[i] for i in order]
+
+def bucket_mapnumbers(mapnumbers, by="section"):
+    """ Sort map numbers and group them by "township" or "section".
+    Returns a list of (key, [mapnumbers]) where key is (township, range)
+    or (township, range, section). """
+    import numpy as np
+    divisor = {"township": _R, "section": _S}[by]
+    mapnumbers = list(mapnumbers)
+    keys = sortkeys(mapnumbers)
+    order = np.argsort(keys, kind='mergesort')
+    buckets = []
+    for bucket, items in groupby(order, key=lambda i: keys[i] // divisor):
+        if bucket * divisor >= UNSORTABLE:
+            key = None
+        elif by == "township":
+            key = (int(bucket // 100), int(bucket % 100))
+        else:
+            key = (int(bucket // 10000), int(bucket // 100 % 100), int(bucket % 100))
+        buckets.append((key, [mapnumbers[i] for i in items]))
+    return buckets
+
 # =============================================================================
 if __name__ == "__main__":
     # unit tests
@@ -102,7 +224,37 @@ if __name__ == "__main__":
     print("results")
     for t in sorted(tested, key=lambda mapnum:mapnum.number):
         print(t)
-    pass
+
+    # The arithmetic key has to be the same as the old formatted one.
+    for t in tested:
+        assert t.number == int("%2d%02d%02d%d%d%04d" % (int(t.t), int(t.r), int(t.s),
+                                (ord(t.q[0])-64) if t.q else 0,
+                                (ord(t.q[1])-64) if len(t.q) > 1 else 0,
+                                (d_suffix[t.suffix[0]] + int(t.suffix[1:])) if t.suffix else 0)), str(t)
+
+    # Bulk sorting, mixed formats
+    pagenames = ["10 7 10BC", "8 10 5CD D2", "8 10", "8.10.5CD D1", "0408.00N10.00W05CD--0000",
+                 "nonsense", "8 10 5", "0408.00N09.00W25AD--D001", "5 2 23"]
+    s = sort_mapnumbers(pagenames)
+    print(s)
+    assert s == ["5 2 23", "0408.00N09.00W25AD--D001", "8 10", "8 10 5", "0408.00N10.00W05CD--0000",
+                 "8.10.5CD D1", "8 10 5CD D2", "10 7 10BC", "nonsense"], s
+    assert list(sortkeys(["0408.00N10.00W05CD--D001"])) == [mapnum("8 10 5CD D1").number]
+    assert sort_mapnumbers(["8 10", "10 7"]) == ["8 10", "10 7"] # not "10 7" first like sorted() does
+    assert split_key(mapnum("8 10 5CD D1").number) == (810, 81005, 1001)
+    assert split_key(mapnum("8 10").number) == (810, 81000, 0)
+    assert split_key(sortkeys(["nonsense"])[0]) == (UNSORTABLE, UNSORTABLE, 0)
+
+    for key, items in bucket_mapnumbers(pagenames, by="township"):
+        print(key, items)
+    buckets = bucket_mapnumbers(pagenames)
+    assert buckets[3] == ((8,10,5), ["8 10 5", "0408.00N10.00W05CD--0000", "8.10.5CD D1", "8 10 5CD D2"]), buckets[3]
+
+    import time
+    many = [mapnum.__str__(mn) for mn in tested] * 5000
+    t0 = time.time()
+    sort_mapnumbers(many)
+    print("Sorted %d map numbers in %.3f seconds." % (len(many), time.time()-t0))
 
 # That's all!
 
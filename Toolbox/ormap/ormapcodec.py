@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Batch codec for ORMAPNUM strings.
+
+ormapnum.unpack() works on one string at a time. This does the same
+job for a whole column of ORMAPNUMs at once using numpy, so a county
+wide mapindex can be decoded or repaired in one pass.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import numpy as np
+
+# Fields in a decoded ORMAPNUM, in the order they appear in the string.
+dtype = np.dtype([
+        ('county',          'u1'),
+        ('township',        'u1'),
+        ('township_part',   'S3'),  # .00 .25 .50 .75
+        ('township_dir',    'S1'),  # N|S
+        ('range',           'u1'),
+        ('range_part',      'S3'),
+        ('range_dir',       'S1'),  # E|W
+        ('section',         'u1'),
+        ('quarter',         'S1'),  # 0|A|B|C|D
+        ('quarterquarter',  'S1'),  # 0|A|B|C|D
+        ('anomaly',         'S2'),
+        ('mapsuffixtype',   'S1'),  # 0|D|S|T
+        ('mapsuffixnumber', 'u2'),
+        ('valid',           '?'),   # False if the string could not be decoded
+        ])
+
+# Start of each field in a correctly formatted 24 character ORMAPNUM
+#   0 2 4  7 8 10 1314 16 18 20
+#   0408.00N10.00W25AD--D001
+_WIDTH = 24
+_ZERO  = ord('0')
+
+def _matrix(strings, width):
+    """ Return the strings as an (n, width) array of byte codes, space padded. """
+    a = np.array([(s or '').strip() for s in strings], dtype='S%d' % width)
+    m = a.view('u1').reshape(len(a), width).copy()
+    m[m == 0] = ord(' ')
+    return m
+
+def _digits(m, first, count):
+    """ Convert 'count' columns of ASCII digits starting at 'first' into integers. """
+    n = np.zeros(len(m), dtype='i4')
+    for col in range(first, first+count):
+        n = n*10 + (m[:,col].astype('i4') - _ZERO)
+    return n
+
+def _text(m, first, count):
+    """ Return 'count' columns starting at 'first' as a fixed width string array. """
+    return np.ascontiguousarray(m[:, first:first+count]).view('S%d' % count).ravel()
+
+def normalize(strings):
+    """ Repair the AML bugs in a sequence of ORMAPNUM strings.
+    Returns an (n, 24) array of byte codes in the standard layout.
+
+    The AML code erroneously fails to zero fill township,
+    and sometimes it puts an extra zero in range,
+    these are the same repairs that ormapnum.unpack() does. """
+
+    m = _matrix(strings, _WIDTH+2)
+    rows = np.arange(len(m))[:,None]
+
+    # township in Clatsop ALWAYS has a leading zero
+    tshift = (m[:,2] != _ZERO).astype('i4')
+
+    # range normally ends 3 characters before the dot in range_part,
+    # if the dot is one further along there is an extra zero to absorb.
+    rextra = (m[np.arange(len(m)), 11 - tshift] == ord('.')).astype('i4')
+
+    cols = np.arange(_WIDTH)[None,:]
+    src = np.where(cols >= 3, cols - tshift[:,None], cols)
+    src = np.where(cols >= 8, src + rextra[:,None], src)
+
+    n = m[rows, src]
+    n[tshift == 1, 2] = _ZERO
+    return n
+
+def unpack(strings):
+    """ Decode a sequence of ORMAPNUM strings into a numpy structured array.
+
+    Example: a = unpack([u'0408.00N10.00W25AD--D001', ...])
+             a['section'], a['quarter'], ...
+
+    Rows that can't be decoded are zeroed and have 'valid' set False. """
+
+    m = normalize(strings)
+    a = np.zeros(len(m), dtype=dtype)
+
+    # Sanity check, the digits have to be digits and the fixed characters have to be there.
+    ok = np.ones(len(m), dtype='?')
+    for col in (0,1,2,3, 8,9, 14,15, 21,22,23):
+        ok &= (m[:,col] >= _ZERO) & (m[:,col] <= _ZERO+9)
+    ok &= (m[:,4] == ord('.')) & (m[:,10] == ord('.'))
+
+    a['county']          = _digits(m, 0, 2)
+    a['township']        = _digits(m, 2, 2)
+    a['township_part']   = _text(m, 4, 3)
+    a['township_dir']    = b'N'             # FORCE to N no matter what AML code does!!!
+    a['range']           = _digits(m, 8, 2)
+    a['range_part']      = _text(m, 10, 3)
+    a['range_dir']       = b'W'             # FORCE to W no matter what AML code does!!!
+    a['section']         = _digits(m, 14, 2)
+    a['quarter']         = _text(m, 16, 1)
+    a['quarterquarter']  = _text(m, 17, 1)
+    a['anomaly']         = _text(m, 18, 2)
+    a['mapsuffixtype']   = _text(m, 20, 1)
+    a['mapsuffixnumber'] = _digits(m, 21, 3)
+
+    # This is Clatsop county based
+    ok &= (a['township'] >= 4) & (a['township'] <= 9)
+    ok &= (a['range'] >= 6) & (a['range'] <= 11)
+    ok &= (a['section'] <= 36) # section = 0 means section is not set and that's okay
+
+    a[~ok] = np.zeros(1, dtype=dtype)
+    a['valid'] = ok
+    return a
+
+def _put_digits(m, first, count, values):
+    v = values.astype('i4')
+    for col in range(first+count-1, first-1, -1):
+        m[:,col] = _ZERO + v % 10
+        v = v // 10
+
+def _put_text(m, first, count, values):
+    m[:, first:first+count] = np.ascontiguousarray(values, dtype='S%d' % count).view('u1').reshape(len(m), count)
+
+def pack(a):
+    """ Build ORMAPNUM strings from a structured array like the one unpack() returns.
+    Returns a numpy array of 24 character unicode strings. """
+
+    m = np.zeros((len(a), _WIDTH), dtype='u1')
+    _put_digits(m,  0, 2, a['county'])
+    _put_digits(m,  2, 2, a['township'])
+    _put_text  (m,  4, 3, a['township_part'])
+    _put_text  (m,  7, 1, a['township_dir'])
+    _put_digits(m,  8, 2, a['range'])
+    _put_text  (m, 10, 3, a['range_part'])
+    _put_text  (m, 13, 1, a['range_dir'])
+    _put_digits(m, 14, 2, a['section'])
+    _put_text  (m, 16, 1, a['quarter'])
+    _put_text  (m, 17, 1, a['quarterquarter'])
+    _put_text  (m, 18, 2, a['anomaly'])
+    sfx = np.where(a['mapsuffixtype'] == b'', b'0', a['mapsuffixtype'])
+    _put_text  (m, 20, 1, sfx)
+    _put_digits(m, 21, 3, a['mapsuffixnumber'])
+    return m.view('S%d' % _WIDTH).ravel().astype('U%d' % _WIDTH)
+
+def repair(strings):
+    """ Return the ORMAPNUM strings with the AML bugs fixed.
+    Strings that can't be decoded are returned as empty strings. """
+    a = unpack(strings)
+    packed = pack(a)
+    packed[~a['valid']] = u''
+    return packed
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    from ormapnum import ormapnum
+
+    samples = [
+                u'0407.00N09.00W0000--0000',
+
+                u'048.00N10.00W0000--0000',   # Dropped zero in TOWN
+                u'048.00N09.00W0000--0000',   # Dropped zero in TOWN
+                u'048.00N009.00W0000--0000',  # Dropped zero in TOWN and extra zero in RANGE
+                u'0408.00N009.00W0000--0000', # Extra zero in RANGE
+
+                u'0408.00N10.00W0000--0000',
+                u'0408.00N10.00W25AD--D001',
+                u'0409.00N10.00W0000--0000',
+                u'0408.00N10.00W25AD--0000',
+                u'0408.00N10.00W05CD--S002',
+                ]
+    a = unpack(samples)
+    packed = pack(a)
+
+    orm = ormapnum()
+    for sample, row, p in zip(samples, a, packed):
+        orm.unpack(sample)
+        assert row['valid']
+        assert row['township'] == orm.township, (sample, row)
+        assert row['range']    == orm.range, (sample, row)
+        assert row['section']  == orm.section, (sample, row)
+        assert row['mapsuffixnumber'] == orm.mapsuffixnumber, (sample, row)
+        assert p == orm.ormapnumber, "pack failed \"%s\" != \"%s\"" % (p, orm.ormapnumber)
+        print(sample.ljust(26), p)
+
+    bad = unpack([u'', u'garbage', u'0400.00N00.00W0000--0000', u'0408.00N12.00W0000--0000', u'0408.00N10.00W4000--0000'])
+    assert not bad['valid'].any()
+    assert list(repair([u'048.00N10.00W0000--0000', u''])) == [u'0408.00N10.00W0000--0000', u'']
+
+    # Big enough to see it work, a county has a few thousand maps.
+    import time
+    many = samples * 10000
+    t0 = time.time()
+    a = unpack(many)
+    packed = pack(a)
+    print("Decoded and packed %d ORMAPNUMs in %.3f seconds." % (len(many), time.time()-t0))
+
+    print("Unit tests completed.")
+# That's all!
@@ -256,7 +256,164 @@ class ormapnum(object):
         return
 
 # ---------------------------------------
-    
+
+class ORMapNumber(object):
+    """ An immutable map number.
+
+    Use ORMapNumber.unpack("0408.00N10.00W25AD--D001") or
+    ORMapNumber.expand("8 10 25AD D1") to get one. Each map number is
+    only created once; asking for the same map again returns the same object,
+    so they are cheap to use as keys in dicts and sets.
+
+    The derived strings (short, dotted, titles...) are computed the first
+    time they are asked for and remembered after that. """
+
+    _fields = ("county",
+               "township", "township_part", "township_dir",
+               "range",    "range_part",    "range_dir",
+               "section", "quarter", "quarterquarter",
+               "anomaly", "mapsuffixtype", "mapsuffixnumber")
+
+    __slots__ = _fields + ("_derived",)
+
+    _interned = {} # ORMapNumber objects indexed by 24 character ORMAPNUM
+    _parsed   = {} # ORMapNumber objects indexed by the strings they were parsed from
+    _parsed_max = 50000 # _parsed is emptied when it gets this big, a county has a few thousand maps
+
+    def __new__(cls, *args, **kwargs):
+        raise TypeError("Use ORMapNumber.unpack() or ORMapNumber.expand() to get a map number.")
+
+    @classmethod
+    def _from_fields(cls, *values):
+        """ Return the one ORMapNumber with these field values. """
+        orm = object.__new__(cls)
+        for name, value in zip(cls._fields, values):
+            object.__setattr__(orm, name, value)
+        object.__setattr__(orm, "_derived", {})
+        key = orm.ormapnumber
+        return cls._interned.setdefault(key, orm)
+
+    @classmethod
+    def _from_ormapnum(cls, orm):
+        return cls._from_fields(*[getattr(orm, name) for name in cls._fields])
+
+    @classmethod
+    def _remember(cls, s, orm):
+        """ Remember that string 's' parsed to 'orm'. Typos and odd spellings
+        are kept too, so the table is emptied when it gets too big. """
+        if len(cls._parsed) >= cls._parsed_max:
+            cls._parsed.clear()
+        return cls._parsed.setdefault(s, orm)
+
+    @classmethod
+    def unpack(cls, s):
+        """ Return the map number for a 23- or 24-character "ORTAXLOT" string.
+        Raises ValueError if it can't be decoded. """
+        try:
+            return cls._parsed[s]
+        except KeyError:
+            pass
+        orm = ormapnum()
+        try:
+            orm.unpack(s)
+        except IndexError:
+            pass # too short, caught below
+        if not orm.township:
+            raise ValueError("Can't unpack \"%s\"." % s)
+        return cls._remember(s, cls._from_ormapnum(orm))
+
+    @classmethod
+    def expand(cls, shortie):
+        """ Return the map number for a shortened string like "8.10.5CD D001" or "8 10 05CD".
+        Raises ValueError if it can't be decoded. """
+        try:
+            return cls._parsed[shortie]
+        except KeyError:
+            pass
+        orm = ormapnum()
+        orm.expand(shortie)
+        if not orm.township:
+            raise ValueError("Can't expand \"%s\"." % shortie)
+        return cls._remember(shortie, cls._from_ormapnum(orm))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ORMapNumber is immutable.")
+
+    def __reduce__(self):
+        # Pickled map numbers come back interned too.
+        return (_make_ormapnumber, tuple(getattr(self, name) for name in self._fields))
+
+    def __eq__(self, other):
+        return self is other or (isinstance(other, ORMapNumber) and self.ormapnumber == other.ormapnumber)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.ormapnumber)
+
+    def __str__(self):
+        return self.ormapnumber
+
+    def __repr__(self):
+        return "ORMapNumber(%s)" % self.short
+
+    def _get(self, name):
+        """ Return one of the derived strings, formatting it only the first time. """
+        try:
+            return self._derived[name]
+        except KeyError:
+            pass
+        orm = ormapnum()
+        for field in self._fields:
+            setattr(orm, field, getattr(self, field))
+        orm.township_frac = d_partfrac[self.township_part]
+        orm.range_frac    = d_partfrac[self.range_part]
+        value = getattr(orm, name)
+        if callable(value): value = value()
+        self._derived[name] = value
+        return value
+
+    @property
+    def ormapnumber(self):
+        return self._get("ormapnumber")
+
+    @property
+    def township_frac(self):
+        return d_partfrac[self.township_part]
+
+    @property
+    def range_frac(self):
+        return d_partfrac[self.range_part]
+
+    def qq(self):
+        return self._get("qq")
+
+    def qqtext(self):
+        return self._get("qqtext")
+
+    @property
+    def shortmaptitle(self):
+        return self._get("shortmaptitle")
+
+    @property
+    def longmaptitle(self):
+        return self._get("longmaptitle")
+
+    @property
+    def short(self):
+        return self._get("short")
+
+    @property
+    def dotted(self):
+        return self._get("dotted")
+
+def _make_ormapnumber(*values):
+    """ Used to unpickle map numbers, Python 2 can't pickle a classmethod. """
+    return ORMapNumber._from_fields(*values)
+
+# ---------------------------------------
+
 if __name__ == "__main__":
 # Unit test
 
@@ -286,10 +443,10 @@ if __name__ == "__main__":
                 ]
     for sample in samples:
         orm.unpack(sample)
-        ormapnum = orm.ormapnumber
-        if ormapnum != sample: 
-            print(" assert pack fail \"%s\" != \"%s\"" % (sample, ormapnum))
-        print(ormapnum, len(ormapnum))
+        packed = orm.ormapnumber
+        if packed != sample: 
+            print(" assert pack fail \"%s\" != \"%s\"" % (sample, packed))
+        print(packed, len(packed))
         shortie = orm.short
         dottie  = orm.dotted
         print("shortened %s dotted %s" % (shortie, dottie))
@@ -303,4 +460,31 @@ if __name__ == "__main__":
 
         print("short title: \"%s\"" % orm.shortmaptitle)
         print("long title: \"%s\"" % orm.longmaptitle)
-    
\ No newline at end of file
+    
+    # Test the immutable, interned map numbers
+    a = ORMapNumber.unpack(u'0408.00N10.00W25AD--D001')
+    b = ORMapNumber.expand("8 10 25AD D1")
+    c = ORMapNumber.expand("8.10.25AD D001")
+    assert a is b and b is c, "interning failed"
+    assert ORMapNumber.unpack(u'048.00N10.00W25AD--D001') is a
+    assert len(set([a, b, c])) == 1
+    assert a.short == "8 10 25AD D1" and a.dotted == "8.10.25AD D1"
+    assert a.longmaptitle == "SE 1/4 NE 1/4 SEC.25 \nT8N R10W WM DETAIL 1", a.longmaptitle
+    try:
+        a.township = 9
+        print(" assert immutable failed")
+    except AttributeError:
+        pass
+    try:
+        ORMapNumber.unpack(u'garbage')
+        print(" assert unpack garbage failed")
+    except ValueError:
+        pass
+    import pickle
+    assert pickle.loads(pickle.dumps(a, pickle.HIGHEST_PROTOCOL)) is a
+    # The table of parsed strings does not grow without bound.
+    for i in range(ORMapNumber._parsed_max + 10):
+        ORMapNumber.expand("8 10 25AD D%d" % (i % 100 + 1) + " " * (i // 100))
+    assert len(ORMapNumber._parsed) <= ORMapNumber._parsed_max
+    assert ORMapNumber.expand("8 10 25AD D1") is a
+    print(repr(a), a.shortmaptitle)
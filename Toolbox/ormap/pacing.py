@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Wait for an exported file to be finished instead of sleeping a fixed time.
+
+A file is ready when it exists, is not empty, and its size has stopped
+changing. How long each wait took is kept so we can see how much
+waiting is actually needed.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import os, time
+
+def wait_until_ready(filename, timeout=60, poll=.05, stable=.1):
+    """ Wait for a file to exist, be non-empty and stop growing for 'stable' seconds.
+    Returns True if it's ready, False if 'timeout' seconds went by first. """
+    t_end = time.time() + timeout
+    last = None
+    t_last = 0
+    while True:
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            size = 0
+        now = time.time()
+        if size and size == last:
+            if now - t_last >= stable:
+                return True
+        else:
+            last = size
+            t_last = now
+        if now >= t_end:
+            return False
+        time.sleep(poll)
+
+class pacer(object):
+    """ Paces a print loop. Call ready() after each export. """
+
+    def __init__(self, min_gap=0, timeout=60, stable=.1):
+        """ min_gap  least number of seconds from one export to the next
+            timeout  give up waiting for a file after this many seconds """
+        self.min_gap = min_gap
+        self.timeout = timeout
+        self.stable  = stable
+        self.waits   = [] # seconds waited for each file
+        self.timeouts = 0
+        self.t_last  = None
+        return
+
+    def ready(self, filename, t_start=None):
+        """ Wait until 'filename' is finished and the minimum gap has gone by
+        since 't_start' (when the export was started, defaults to the last call).
+        Returns True if the file is ready. """
+        t0 = time.time()
+        ok = wait_until_ready(filename, self.timeout, stable=self.stable)
+        if not ok:
+            self.timeouts += 1
+        if t_start is None:
+            t_start = self.t_last or t0
+        gap = self.min_gap - (time.time() - t_start)
+        if gap > 0:
+            time.sleep(gap)
+        self.t_last = time.time()
+        self.waits.append(self.t_last - t0)
+        return ok
+
+    def summary(self):
+        """ Return a line about the waits so far. """
+        if not self.waits:
+            return "No waits."
+        waits = sorted(self.waits)
+        return "Waited for %d files, total %.1f s, median %.2f s, longest %.2f s, %d timed out." % (
+            len(waits), sum(waits), waits[len(waits)//2], waits[-1], self.timeouts)
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    import tempfile, threading
+
+    folder = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(folder, "8_10_5.pdf")
+
+        # Nothing there
+        t0 = time.time()
+        assert not wait_until_ready(filename, timeout=.2)
+        assert time.time() - t0 < 1
+
+        # Written a piece at a time by someone else
+        def writer():
+            with open(filename, "wb") as fp:
+                for i in range(5):
+                    fp.write(b"x" * 1000)
+                    fp.flush()
+                    time.sleep(.05)
+        th = threading.Thread(target=writer)
+        th.start()
+        p = pacer(min_gap=0, timeout=5)
+        assert p.ready(filename)
+        assert os.path.getsize(filename) == 5000
+        th.join()
+
+        # Minimum gap
+        p = pacer(min_gap=.3, timeout=5)
+        t0 = time.time()
+        p.ready(filename, t0)
+        assert time.time() - t0 >= .3
+        print(p.summary())
+    finally:
+        os.unlink(filename)
+        os.rmdir(folder)
+
+    print("Unit tests completed.")
+# That's all!
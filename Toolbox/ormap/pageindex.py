@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Prefix index over DDP pagenames, for completing partial map numbers.
+
+Input can be typed like a pagename "8 10 5", dotted "8.10.5C"
+or as (part of) an ORMAPNUM "0408.00N10". A trailing "*" means
+"this map and everything under it", so "8 10 5*" is section 5
+and all its quarter, quarter-quarter and detail maps.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import re
+from bisect import bisect_left
+from mapnum import sortkeys
+
+re_ormapnum = re.compile(r'(\d\d)(\d\d)?(?:\.\d\d)?[NS]?(\d\d)?(?:\.\d\d)?[EW]?(\d\d)?([0A-D])?([0A-D])?-{0,2}([0DST])?(\d{1,3})?')
+re_suffix   = re.compile(r'^([DST])(\d*)$')
+re_section  = re.compile(r'^(\d*)([A-D]{0,2})$')
+
+# Sorts after anything that can be in a pagename
+_HIGH = "~"
+
+def _from_ormapnum(text):
+    """ Turn (the start of) an ORMAPNUM into pagename prefixes. """
+    mo = re_ormapnum.match(text)
+    if not mo:
+        return []
+    (t, r, s, q, qq, sfxtype, sfxnum) = (mo.group(2), mo.group(3), mo.group(4), mo.group(5), mo.group(6), mo.group(7), mo.group(8))
+    if not t:
+        return [("", False)]
+    prefix = "%d" % int(t)
+    if not r:
+        return [(prefix, True)]
+    prefix += " %02d" % int(r)
+    if not s or int(s) == 0:
+        return [(prefix, True)]
+    prefix += " %d" % int(s)
+    for letter in (q, qq):
+        if not letter or letter == '0':
+            return [(prefix, True)]
+        prefix += letter
+    if sfxtype and sfxtype != '0':
+        prefix += " " + sfxtype
+        if sfxnum:
+            prefix += "%d" % int(sfxnum)
+            return [(prefix, len(sfxnum) == 3)]
+    return [(prefix, True)]
+
+def prefixes(text):
+    """ Normalize what someone typed into a list of (prefix, complete) tuples.
+    'prefix' is the start of a pagename. If 'complete' is True the last
+    number in the prefix was finished so "8 10 1" won't match "8 10 12". """
+
+    text = text.upper().lstrip()
+    if re.match(r'\d{3}', text):
+        return _from_ormapnum(text.strip())
+
+    finished = text != text.rstrip() or text.endswith('*') # typed a space or a star after the last token
+    tokens = [t for t in re.split(r'[\s\.\*]+', text) if t]
+    if not tokens:
+        return [("", False)]
+
+    # Pull off a map suffix like "D1" if there is one.
+    suffix = None
+    if len(tokens) > 2 and re_suffix.match(tokens[-1]):
+        suffix = tokens.pop()
+
+    l_prefix = [""]
+    complete = False
+    for i, token in enumerate(tokens[:3]):
+        last = (i == len(tokens)-1) and suffix is None and not finished
+        if i == 0:
+            if not token.isdigit(): return []
+            parts = ["%d" % int(token)]
+            complete = not last
+        elif i == 1:
+            if not token.isdigit(): return []
+            if last and len(token) == 1:
+                # Could be the first digit of "10" or a range like "9" that needs a zero
+                parts = [" " + token, " 0" + token]
+            else:
+                parts = [" %02d" % int(token)]
+            complete = not last
+        else:
+            mo = re_section.match(token)
+            if not mo: return []
+            (digits, letters) = mo.groups()
+            if not digits: return []
+            if last and not letters and int(digits) == 0:
+                parts = [" "]
+                complete = False
+            else:
+                parts = [" %d%s" % (int(digits), letters)]
+                complete = not last or bool(letters) and len(letters) == 2
+        l_prefix = [p + part for p in l_prefix for part in parts]
+
+    if suffix:
+        mo = re_suffix.match(suffix)
+        sfx = " " + mo.group(1)
+        if mo.group(2) and int(mo.group(2)):
+            sfx += "%d" % int(mo.group(2))
+        l_prefix = [p + sfx for p in l_prefix]
+        complete = bool(mo.group(2)) and (finished or len(mo.group(2)) == 3)
+
+    return [(p, complete) for p in l_prefix]
+
+class pageindex(object):
+    """ A sorted array of pagenames, searched with bisect. """
+
+    def __init__(self, pagenames):
+        pagenames = list(pagenames)
+        keys = sortkeys(pagenames)
+        self.d_sortkey = dict(zip(pagenames, keys))
+        self.l_key = sorted((p.upper(), p) for p in pagenames)
+        self.l_upper = [k for k,p in self.l_key]
+        return
+
+    def __len__(self):
+        return len(self.l_key)
+
+    def _range(self, prefix, complete):
+        """ Return the pagenames that start with the prefix. """
+        lo = bisect_left(self.l_upper, prefix)
+        hi = bisect_left(self.l_upper, prefix + _HIGH, lo)
+        n = len(prefix)
+        if complete and prefix and prefix[-1].isdigit():
+            # "8 10 1" should not find "8 10 12"
+            return [p for k,p in self.l_key[lo:hi] if len(k) == n or not k[n].isdigit()]
+        return [p for k,p in self.l_key[lo:hi]]
+
+    def complete(self, text, limit=None):
+        """ Return pagenames that could complete the partially typed map number, in map order. """
+        d_found = {}
+        for prefix, complete in prefixes(text):
+            for p in self._range(prefix, complete):
+                d_found[p] = 1
+        found = sorted(d_found, key=self.d_sortkey.get)
+        if limit: found = found[:limit]
+        return found
+
+    def expand(self, pattern):
+        """ Return the pages for a pattern like "8 10 5*" or "8.10.5C*".
+        A pattern without a "*" is a single page, returned in a list if it exists. """
+        pattern = pattern.strip()
+        if pattern.endswith('*'):
+            return self.complete(pattern)
+        exact = self.lookup(pattern)
+        if exact: return [exact]
+        return []
+
+    def lookup(self, text):
+        """ Return the one pagename that matches text exactly, or None. """
+        for prefix, complete in prefixes(text.strip() + " "):
+            i = bisect_left(self.l_upper, prefix)
+            if i < len(self.l_upper) and self.l_upper[i] == prefix:
+                return self.l_key[i][1]
+        return None
+
+# The last index built, so tools that get called over and over don't rebuild it.
+_cached = (None, None)
+
+def index_for(pagenames):
+    """ Return a pageindex for this list of pagenames, reusing the last one if it's the same list. """
+    global _cached
+    key = tuple(pagenames)
+    if _cached[0] != key:
+        _cached = (key, pageindex(key))
+    return _cached[1]
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    import time
+
+    pagenames = ["8 10", "8 10 5", "8 10 5C", "8 10 5CD", "8 10 5CD D1", "8 10 5CD D2", "8 10 5 D1",
+                 "8 10 12", "8 10 1", "8 10 1AB", "8 09", "8 09 25", "8 09 25AD", "10 07 10BC", "8 10 D1"]
+    idx = pageindex(pagenames)
+
+    for text, expected in [
+            ("8 10 5",   ["8 10 5", "8 10 5 D1", "8 10 5C", "8 10 5CD", "8 10 5CD D1", "8 10 5CD D2"]),
+            ("8.10.5C",  ["8 10 5C", "8 10 5CD", "8 10 5CD D1", "8 10 5CD D2"]),
+            ("8 10 5CD D", ["8 10 5CD D1", "8 10 5CD D2"]),
+            ("8 10 1",   ["8 10 1", "8 10 1AB", "8 10 12"]),
+            ("8 9 ",     ["8 09", "8 09 25", "8 09 25AD"]),
+            ("10 7",     ["10 07 10BC"]),
+            ("0408.00N10.00W05CD", ["8 10 5CD", "8 10 5CD D1", "8 10 5CD D2"]),
+            ("0408.00N09", ["8 09", "8 09 25", "8 09 25AD"]),
+            ("8 10 D",   ["8 10 D1"]),
+            ("x 10", []),
+            ]:
+        found = idx.complete(text)
+        assert found == expected, "complete(\"%s\") = %s" % (text, found)
+
+    assert idx.expand("8 10 1*") == ["8 10 1", "8 10 1AB"]
+    assert idx.expand("8 10 5C*") == ["8 10 5C", "8 10 5CD", "8 10 5CD D1", "8 10 5CD D2"]
+    assert idx.expand("8.9.25*") == ["8 09 25", "8 09 25AD"]
+    assert idx.expand("8.10.5CD D001") == ["8 10 5CD D1"]
+    assert idx.expand("8 10 5CD D3") == []
+    assert idx.lookup("0408.00N10.00W05CD--D002") == "8 10 5CD D2"
+    assert idx.lookup("8 9 25ad") == "8 09 25AD"
+    assert index_for(pagenames) is index_for(list(pagenames))
+
+    # Something about the size of a county
+    many = ["%d %02d %d%s%s" % (t, r, s, q, qq) for t in range(4,10) for r in range(6,11)
+            for s in range(1,37) for q in ("", "A", "B", "C", "D") for qq in ("", "A", "B", "C", "D") if q or not qq]
+    idx = pageindex(many)
+    t0 = time.time()
+    for i in range(1000):
+        found = idx.complete("8 10 5C")
+    print("%d pages, %d found, %.3f ms per lookup" % (len(idx), len(found), (time.time()-t0)))
+
+    print("Unit tests completed.")
+# That's all!
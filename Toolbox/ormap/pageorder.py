@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Put the pages of a print batch in an order that changes the layout least.
+
+Going to another township means new queries and extents for the
+locator maps, another section means new quarter section locators,
+and another scale means swapping scalebars. Printing all the pages
+of a township together, then of a section, then of a scale (and
+suffix maps last) keeps those changes down.
+
+The order only depends on which pages are in the batch, not the order
+they were given in, so the same batch always prints the same way.
+File names come from the pagenames so they don't change.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+from mapnum import sortkeys, split_key, UNSORTABLE
+
+def _parts(pagenames, d_scale):
+    """ Return (township, section, scale, suffix, key) for each page. """
+    keys = sortkeys(pagenames)
+    parts = []
+    for pagename, key in zip(pagenames, keys):
+        key = int(key)
+        (township, section, suffix) = split_key(key)
+        scale = (d_scale.get(pagename) or 0) if key < UNSORTABLE else 0
+        parts.append((township, section, scale, suffix, key))
+    return parts
+
+def transitions(pagenames, d_scale):
+    """ Return a dict with the number of times printing the pages in this
+    order changes "township", "section" and "scale". """
+    d = {"township": 0, "section": 0, "scale": 0}
+    last = None
+    for p in _parts(pagenames, d_scale):
+        if last is not None:
+            if p[0] != last[0]: d["township"] += 1
+            if p[1] != last[1]: d["section"]  += 1
+            if p[2] != last[2]: d["scale"]    += 1
+        last = p
+    return d
+
+def optimize(pagenames, d_scale):
+    """ Return the pages sorted by township, section, scale and suffix.
+    'd_scale' is a dict of map scales indexed by pagename.
+    Things that are not map numbers go at the end in the order they came in. """
+    pagenames = list(pagenames)
+    parts = _parts(pagenames, d_scale)
+    order = sorted(range(len(pagenames)),
+                   key=lambda i: parts[i] + ((pagenames[i],) if parts[i][0] < UNSORTABLE else (i,)))
+    return [pagenames[i] for i in order]
+
+def report(before, after, d_scale):
+    """ Return a line about the transitions avoided by printing in order 'after' instead of 'before'. """
+    b = transitions(before, d_scale)
+    a = transitions(after, d_scale)
+    avoided = sum(b.values()) - sum(a.values())
+    return "Page order avoids %d layout changes (township %d -> %d, section %d -> %d, scale %d -> %d)." % (
+        avoided, b["township"], a["township"], b["section"], a["section"], b["scale"], a["scale"])
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    import random
+
+    d_scale = {"8 10": 24000, "8 10 5": 4800, "8 10 5C": 2400, "8 10 5CD": 1200, "8 10 5CD D1": 1200,
+               "8 10 5D": 2400, "8 10 5DA": 1200, "8 10 6": 4800, "7 10 36": 4800, "7 10 36A": 2400}
+    typed = ["8 10 5CD", "7 10 36", "8 10 5C", "8 10 5CD D1", "8 10 6", "8 10", "8 10 5DA", "7 10 36A", "8 10 5D", "8 10 5"]
+
+    best = optimize(typed, d_scale)
+    print(best)
+    assert best == ["7 10 36A", "7 10 36", "8 10", "8 10 5CD", "8 10 5DA", "8 10 5CD D1",
+                    "8 10 5C", "8 10 5D", "8 10 5", "8 10 6"]
+    assert transitions(best, d_scale) == {"township": 1, "section": 3, "scale": 5}
+
+    # Same pages, same order, however they came in.
+    shuffled = list(typed)
+    random.shuffle(shuffled)
+    assert optimize(shuffled, d_scale) == best
+
+    print(report(typed, best, d_scale))
+    b = transitions(typed, d_scale)
+    assert sum(b.values()) > sum(transitions(best, d_scale).values())
+
+    # Not map numbers, no scales
+    assert optimize(["index", "8 10 5", "cover"], {}) == ["8 10 5", "index", "cover"]
+    assert transitions([], {}) == {"township": 0, "section": 0, "scale": 0}
+
+    print("Unit tests completed.")
+# That's all!
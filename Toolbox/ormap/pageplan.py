@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""
+Work out the page layout for a list of maps ahead of time.
+
+Setting up a page means picking the scalebar, writing the locator
+queries, deciding which locator maps to show, stacking them, and
+filling in the cancelled taxlot table. None of that needs ArcMap
+once we have a snapshot of where the elements are on the layout,
+so it's done here in plain Python and the result is a list of
+operations for each page that just get pushed into the MXD.
+
+Operations are tuples,
+    ("element", type, name, attribute, value)
+    ("query",   dfname, layername, query)
+    ("extent",  dfname, layername, (xmin,ymin,xmax,ymax) or None, scale)
+An extent of None means ask the layer for its extent.
+
+Each page is planned on its own, so any list of pages can be planned
+in any order or split up between processes.
+
+This is the only page layout code, a page that was not planned ahead
+(like one picked in ZoomToMapNumber) is planned by update_page() when
+it's shown, asking the layers for anything that is not cached.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import os, re
+from spans import span
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+GAP = .15 # space between stacked locator maps, in page units
+
+def make_table(seq, columns):
+    """ Break the sequence into 'n' columns and return them. """
+    table = ""
+    maxy = (len(seq)+columns-1)/columns
+    i = 0
+    columns = []
+    for item in seq:
+        table += str(item).ljust(6) + "\n"
+        i += 1
+        if not i % maxy:
+            columns.append(table)
+            table = ""
+    if table:
+        columns.append(table)
+
+    return maxy,columns
+
+def take_snapshot(layout, page_size):
+    """ Return what the planner needs to know about a layout, as a dict.
+    layout     a layoutindex
+    page_size  (width, height) of the page """
+    geometry = {}
+    order = {}
+    for elemtype, elements in layout.d_elements.items():
+        order[elemtype] = [e.name for e in elements]
+        for e in elements:
+            geometry.setdefault((elemtype, e.name),
+                (e.elementPositionX, e.elementPositionY, e.elementWidth, e.elementHeight))
+    return {"page": tuple(page_size), "geometry": geometry, "order": order}
+
+def on_page(geometry, page):
+    """ Return True if an element at (x, y, width, height) is visible on the page. """
+    (x, y, w, h) = geometry
+    return (x > -w and x < page[0]) and (y > -h and y <= page[1])
+
+class planner(object):
+    """ Plans pages for one layout. """
+
+    def __init__(self, snapshot, locators, caches, cancelled, max_rows, plot_date):
+        """ snapshot   from take_snapshot()
+            locators   from locatorqueries.compile_locators()
+            caches     dict of locatorcache objects indexed by (dfname, "extent"|"count")
+            cancelled  function that returns the cancelled taxlots for a dotted map number
+            max_rows   cancelled taxlot rows that fit in 10 point type
+            plot_date  text for the PlotDate element """
+        self.snapshot  = snapshot
+        self.locators  = locators
+        self.caches    = caches
+        self.cancelled = cancelled
+        self.max_rows  = max_rows
+        self.plot_date = plot_date
+        self.page      = snapshot["page"]
+        self.geometry  = snapshot["geometry"]
+
+        # Scalebars, and where the one on the page is now.
+        self.scalebars = dict((name.lower(), name) for name in snapshot["order"].get("MAPSURROUND_ELEMENT", [])
+                              if "scalebar" in name.lower())
+        self.sb_slot = None
+        self.sb_home = {}
+        for lcname, name in sorted(self.scalebars.items()):
+            g = self.geometry[("MAPSURROUND_ELEMENT", name)]
+            if on_page(g, self.page) and not self.sb_slot:
+                self.sb_slot = g[:2]
+                self.sb_home[name] = (self.page[0] + 1, g[1])
+            else:
+                self.sb_home[name] = g[:2]
+
+        self.can_group = [name for name in snapshot["order"].get("GRAPHIC_ELEMENT", []) if name.lower().startswith("can")][:1]
+        self.can_cols  = [name for name in snapshot["order"].get("TEXT_ELEMENT", []) if re.search(r'^can\d+$', name)]
+        return
+
+    def plan(self, orm, scale, count=None):
+        """ Return the list of operations for a page, or None if it can't be
+        planned ahead (a locator map needs information that is not cached).
+        'count(dfname, layername, queries)' returns the features in a layer
+        once 'queries', a list of (layername, query), are set on the dataframe.
+        It's used when there's no cache to say if a locator map has features. """
+        ops = []
+        self._scalebar(ops, scale)
+        if ("TEXT_ELEMENT", "PlotDate") in self.geometry:
+            ops.append(("element", "TEXT_ELEMENT", "PlotDate", "text", self.plot_date))
+        xy = self._locators(ops, orm, count)
+        if xy is None:
+            return None
+        self._cancelled(ops, orm, xy)
+        return ops
+
+    def _move(self, ops, elemtype, name, x, y):
+        ops.append(("element", elemtype, name, "elementPositionX", x))
+        ops.append(("element", elemtype, name, "elementPositionY", y))
+
+    def _scalebar(self, ops, scale):
+        sbname = "scalebar%d" % scale
+        if not sbname in self.scalebars:
+            sbname = "scalebardefault"
+            if not sbname in self.scalebars:
+                return
+        if not self.sb_slot:
+            return
+        # Everything goes home except the one we want.
+        chosen = self.scalebars[sbname]
+        for name in sorted(self.sb_home):
+            if name == chosen:
+                self._move(ops, "MAPSURROUND_ELEMENT", name, *self.sb_slot)
+            else:
+                self._move(ops, "MAPSURROUND_ELEMENT", name, *self.sb_home[name])
+        return
+
+    def _locators(self, ops, orm, count=None):
+        """ Add the locator map operations, return (x,y) for the next stacked element. """
+        x = y = 0
+        for dfname,layers,extlayername,extfields,scale,fcount,fcfields in self.locators:
+            queries = [(layername, template(orm)) for layername, template in layers]
+            for layername, query in queries:
+                ops.append(("query", dfname, layername, query))
+
+            if extlayername:
+                box = None
+                lc = self.caches.get((dfname, "extent"))
+                if lc is not None:
+                    box = lc.extent(orm)
+                ops.append(("extent", dfname, extlayername, box, scale))
+
+            visibility = True
+            if fcount:
+                lc = self.caches.get((dfname, "count"))
+                if lc is not None:
+                    visibility = lc.has_features(orm)
+                elif count is not None:
+                    visibility = count(dfname, fcount, queries) > 0
+                else:
+                    return None
+
+            g = self.geometry.get(("DATAFRAME_ELEMENT", dfname))
+            if g:
+                (ex, ey, ew, eh) = g
+                if x != 0 and y != 0:
+                    (ex, ey) = (x, y)
+                if not visibility:
+                    (ex, ey) = (self.page[0] + 2, y)
+                self._move(ops, "DATAFRAME_ELEMENT", dfname, ex, ey)
+                if on_page((ex, ey, ew, eh), self.page):
+                    x = ex
+                    y = ey - (eh + GAP)
+        return (x, y)
+
+    def _cancelled(self, ops, orm, xy):
+        if not self.can_group:
+            return
+        (x, y) = xy
+        taxlots = self.cancelled(orm.dotted)
+        if len(taxlots) == 0:
+            # Move the cancelled taxlot table off the layout
+            x = self.page[0] + 3
+        self._move(ops, "GRAPHIC_ELEMENT", self.can_group[0], x, y)
+
+        columns = []
+        fontsize = 10
+        if len(taxlots) and self.can_cols:
+            max_y, columns = make_table(taxlots, len(self.can_cols))
+            if max_y > self.max_rows: fontsize = 8
+        for i, name in enumerate(self.can_cols):
+            if i < len(columns):
+                ops.append(("element", "TEXT_ELEMENT", name, "text", columns[i]))
+                ops.append(("element", "TEXT_ELEMENT", name, "fontSize", fontsize))
+            else:
+                # Some text (even just a single space) so ArcMap does not "lose" it.
+                ops.append(("element", "TEXT_ELEMENT", name, "text", " "))
+        return
+
+def apply_plan(doc, pagename, ops, layout, backend, report=print):
+    """ Go to a page and push its operations into the map document.
+    doc      map document
+    pagename page to go to, None stays on the page it's on
+    layout   layoutindex for the document, writes that would not change anything are skipped
+    backend  from the backend module """
+    if pagename is not None:
+        backend.set_page(doc, pagename)
+    layout.start_page()
+    for op in ops:
+        if op[0] == "element":
+            (kind, elemtype, name, attr, value) = op
+            elm = layout.element(elemtype, name)
+            if elm: layout.assign(op[:4], elm, attr, value)
+        elif op[0] == "query":
+            (kind, dfname, layername, query) = op
+            layer = layout.layer(dfname, layername)
+            if not layer:
+                report("Can't find layer \"%s\"/\"%s\"." % (dfname, layername))
+                continue
+            try:
+                layout.assign(("query", dfname, layername), layer, "definitionQuery", query)
+            except Exception as e:
+                report("Can't set query \"%s\" on layer \"%s\"/\"%s\". \"%s\"" % (query, dfname, layername, e))
+        elif op[0] == "extent":
+            (kind, dfname, layername, box, scale) = op
+            df = layout.dataframe(dfname)
+            if not df: continue
+            if box is None:
+                box = backend.layer_extent(layout.layer(df, layername))
+            state = tuple(box) + (scale,)
+            if not layout.unchanged(("extent", dfname), state):
+                backend.set_extent(df, box)
+                if scale: backend.set_scale(df, scale)
+                layout.applied(("extent", dfname), state)
+    with span("RefreshActiveView"):
+        backend.refresh()
+    return
+
+def update_page(doc, pagename, orm, p, layout, backend, report=print):
+    """ Go to a page, plan it with planner 'p' and apply the plan.
+    This is for pages that were not planned ahead, the map scale comes from
+    the page and locator maps without a feature count cache count the
+    features in their layer. """
+    backend.set_page(doc, pagename)
+    scale = int(round(backend.page_scale(doc) or 0))
+
+    def count(dfname, layername, queries):
+        for name, query in queries:
+            layer = layout.layer(dfname, name)
+            if layer: layout.assign(("query", dfname, name), layer, "definitionQuery", query)
+        layer = layout.layer(dfname, layername)
+        if not layer:
+            report("Can't find layer \"%s\"/\"%s\"." % (dfname, layername))
+            return 1
+        try:
+            return backend.feature_count(layer)
+        except Exception as e:
+            report("Can't count features in \"%s\"/\"%s\", %s" % (dfname, layername, e))
+            return 1
+
+    layout.start_page()
+    ops = p.plan(orm, scale, count)
+    apply_plan(doc, None, ops, layout, backend, report)
+    return
+
+version = 1 # Change this if the file format changes, so old files get ignored.
+
+def save_plan(filename, fingerprint, pages):
+    """ Write a plan, a list of (pagename, operations), to a file.
+    'fingerprint' identifies the inputs it was made from. """
+    tmpname = filename + ".tmp"
+    with open(tmpname, "wb") as fp:
+        pickle.dump((version, fingerprint, pages), fp, pickle.HIGHEST_PROTOCOL)
+    if os.path.exists(filename): os.unlink(filename)
+    os.rename(tmpname, filename)
+    return
+
+def load_plan(filename, fingerprint):
+    """ Return the pages saved in a plan file if it was made from the same inputs, or None. """
+    try:
+        with open(filename, "rb") as fp:
+            (v, saved, pages) = pickle.load(fp)
+    except Exception as e:
+        return None
+    if v != version or saved != fingerprint:
+        return None
+    return pages
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    import sys, tempfile, time
+    from ormapnum import ORMapNumber
+    from locatorcache import locatorcache
+    from locatorqueries import compile_locators
+
+    class element(object):
+        def __init__(self, type, name, x, y, w=1, h=1):
+            self.type = type
+            self.name = name
+            self.elementPositionX = x
+            self.elementPositionY = y
+            self.elementWidth = w
+            self.elementHeight = h
+
+    class fake_layout(object):
+        d_elements = {}
+
+    page = (36, 24)
+    layout = fake_layout()
+    for e in [element("MAPSURROUND_ELEMENT", "ScaleBar1200", 30, 2), element("MAPSURROUND_ELEMENT", "ScaleBar2400", 40, 2),
+              element("MAPSURROUND_ELEMENT", "ScaleBarDefault", 40, 4),
+              element("TEXT_ELEMENT", "PlotDate", 1, 1), element("TEXT_ELEMENT", "can1", 30, 10), element("TEXT_ELEMENT", "can2", 31, 10),
+              element("TEXT_ELEMENT", "cantitle", 30, 11), element("GRAPHIC_ELEMENT", "cancelled", 30, 10, 4, 3),
+              element("DATAFRAME_ELEMENT", "LocatorDF", 30, 20, 5, 3),
+              element("DATAFRAME_ELEMENT", "SectionsDF", 30, 16, 5, 3),
+              element("DATAFRAME_ELEMENT", "QSectionsDF", 30, 12, 5, 3)]:
+        layout.d_elements.setdefault(e.type, []).append(e)
+    snap = take_snapshot(layout, page)
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    import ORMAP_config
+    locators = compile_locators(ORMAP_config)
+    fields = ORMAP_config.SectionFeatureCountFields
+    source = os.path.join(tempfile.gettempdir(), "nowhere.gdb", "Sections")
+    sections  = locatorcache(source, fields, [(8, 10, 5, (0,0,10,10)), (8, 10, 6, (10,0,20,10))])
+    townships = locatorcache(source, fields[:2], [(8, 10, (0,0,20,10))])
+    caches = {("SectionsDF", "extent"): townships, ("SectionsDF", "count"): sections,
+              ("QSectionsDF", "extent"): sections, ("QSectionsDF", "count"): sections}
+    d_cancelled = {"8.10.5CD": ("100", "200", "300")}
+    p = planner(snap, locators, caches, lambda dotted: d_cancelled.get(dotted, ()), 15, "PLOT DATE: 1/02/2019")
+
+    def ops_for(ops, kind, *target):
+        return [op[len(target)+1:] for op in ops if op[0] == kind and op[1:len(target)+1] == target]
+
+    ops = p.plan(ORMapNumber.expand("8 10 5CD"), 2400)
+    assert ops_for(ops, "element", "MAPSURROUND_ELEMENT", "ScaleBar2400") == [("elementPositionX", 30), ("elementPositionY", 2)]
+    assert ops_for(ops, "element", "MAPSURROUND_ELEMENT", "ScaleBar1200") == [("elementPositionX", 37), ("elementPositionY", 2)]
+    assert ops_for(ops, "query", "SectionsDF", "Sections") == [("TOWN = '8' AND RANGE = '10'",)]
+    assert ops_for(ops, "extent", "SectionsDF") == [("Sections", (0,0,20,10), 180000)]
+    assert ops_for(ops, "extent", "QSectionsDF") == [("Section", (0,0,10,10), 50000)]
+    # Stacked under the locator map
+    assert ops_for(ops, "element", "DATAFRAME_ELEMENT", "SectionsDF") == [("elementPositionX", 30), ("elementPositionY", 20 - 3 - GAP)]
+    assert ops_for(ops, "element", "TEXT_ELEMENT", "can1") == [("text", "100   \n200   \n"), ("fontSize", 10)]
+    assert ops_for(ops, "element", "TEXT_ELEMENT", "can2") == [("text", "300   \n"), ("fontSize", 10)]
+    assert ops_for(ops, "element", "GRAPHIC_ELEMENT", "cancelled") == [("elementPositionX", 30), ("elementPositionY", 20 - 3*3 - 3*GAP)]
+    assert ops_for(ops, "element", "TEXT_ELEMENT", "PlotDate") == [("text", "PLOT DATE: 1/02/2019")]
+
+    # Section 7 is not in the sections layer, so those locators are hidden and the table is empty
+    ops = p.plan(ORMapNumber.expand("8 10 7"), 1000)
+    assert ops_for(ops, "element", "MAPSURROUND_ELEMENT", "ScaleBarDefault") == [("elementPositionX", 30), ("elementPositionY", 2)]
+    assert ops_for(ops, "element", "DATAFRAME_ELEMENT", "QSectionsDF")[0] == ("elementPositionX", page[0] + 2)
+    assert ops_for(ops, "element", "GRAPHIC_ELEMENT", "cancelled")[0] == ("elementPositionX", page[0] + 3)
+    assert ops_for(ops, "element", "TEXT_ELEMENT", "can1") == [("text", " ")]
+
+    # Can't plan without a feature count cache, unless the layer can be asked
+    del caches[("QSectionsDF", "count")]
+    assert p.plan(ORMapNumber.expand("8 10 5"), 1200) is None
+    asked = []
+    def count(dfname, layername, queries):
+        asked.append((dfname, layername, queries))
+        return 0
+    ops = p.plan(ORMapNumber.expand("8 10 5"), 1200, count)
+    assert [(d, l, q[0]) for d, l, q in asked] == [("QSectionsDF", "Section", ("Section", "TOWN = '8' AND RANGE = '10' AND SECTION = '5'"))], asked
+    assert ops_for(ops, "element", "DATAFRAME_ELEMENT", "QSectionsDF")[0] == ("elementPositionX", page[0] + 2)
+    caches[("QSectionsDF", "count")] = sections
+
+    pagenames = ["8 10 5", "8 10 5CD", "8 10 6", "8 10 7"] * 250
+    t0 = time.time()
+    pages = [(pagename, p.plan(ORMapNumber.expand(pagename), 1200)) for pagename in pagenames]
+    print("Planned %d pages in %.3f s" % (len(pages), time.time() - t0))
+
+    filename = os.path.join(tempfile.gettempdir(), "pageplan-unittest.plan")
+    save_plan(filename, ("inputs", 1), pages)
+    assert load_plan(filename, ("inputs", 1)) == pages
+    assert load_plan(filename, ("inputs", 2)) is None
+    print("Plan file is %d bytes" % os.path.getsize(filename))
+    os.unlink(filename)
+
+    print("Unit tests completed.")
+# That's all!
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+PLSS hierarchy and adjacency for the maps in a mapindex.
+
+    "8 10 5CD D1" is a detail of "8 10 5CD"
+    "8 10 5CD"    is inside "8 10 5C"
+    "8 10 5C"     is inside "8 10 5"
+    "8 10 5"      is inside "8 10"
+
+Everything is worked out once when the index is built so that
+parent, children, siblings and neighbours are just dict lookups.
+
+Printing uses it for map numbers like "8 10 5+", section 5 and
+every map inside it.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+from ormapnum import ORMapNumber
+from mapnum import sortkeys
+
+# Levels in the hierarchy
+TOWNSHIP = 0
+SECTION  = 1
+QUARTER  = 2
+QQ       = 3
+
+# Position of a quarter inside its parent, (x,y) with (0,0) in the SW corner.
+d_quarter = {'A': (1,1), 'B': (0,1), 'C': (0,0), 'D': (1,0)}
+
+# Neighbour directions, as (dx,dy)
+directions = [("N",  (0, 1)), ("NE", (1, 1)), ("E", (1, 0)), ("SE", (1,-1)),
+              ("S",  (0,-1)), ("SW", (-1,-1)), ("W", (-1, 0)), ("NW", (-1, 1))]
+
+def cell(orm):
+    """ Return (level, x, y) for a map number.
+    x increases to the east and y to the north, in units of the map's own level
+    so neighbouring sections in different townships are still next to each other. """
+
+    # Townships count away from the baseline and ranges away from the meridian.
+    if orm.township_dir == 'S':
+        y = -orm.township
+    else:
+        y = orm.township - 1
+    if orm.range_dir == 'E':
+        x = orm.range - 1
+    else:
+        x = -orm.range
+    if not orm.section:
+        return (TOWNSHIP, x, y)
+
+    # Sections snake back and forth starting in the NE corner.
+    n = orm.section - 1
+    row = n // 6
+    if row % 2:
+        col = n % 6
+    else:
+        col = 5 - n % 6
+    x = x*6 + col
+    y = y*6 + 5 - row
+    if orm.quarter == '0':
+        return (SECTION, x, y)
+
+    (qx, qy) = d_quarter[orm.quarter]
+    x = x*2 + qx
+    y = y*2 + qy
+    if orm.quarterquarter == '0':
+        return (QUARTER, x, y)
+
+    (qx, qy) = d_quarter[orm.quarterquarter]
+    return (QQ, x*2 + qx, y*2 + qy)
+
+def parent_cell(c):
+    """ Return the cell that contains this one, or None for a township. """
+    (level, x, y) = c
+    if level == TOWNSHIP:
+        return None
+    if level == SECTION:
+        return (TOWNSHIP, x // 6, y // 6)
+    return (level-1, x // 2, y // 2)
+
+class plss(object):
+    """ Hierarchy and neighbours of the maps in a list of pagenames. """
+
+    def __init__(self, pagenames, report=print):
+        """ report  where to send messages about map numbers that can't be read """
+        pagenames = list(pagenames)
+        d_sortkey = dict(zip(pagenames, sortkeys(pagenames)))
+        self.d_cell     = {}  # cell of each pagename
+        self.d_page     = {}  # base map (no suffix) for each cell
+        self.d_parent   = {}
+        self.d_children = {}
+        self.d_neighbours = {}
+
+        suffixed = set()
+        for pagename in pagenames:
+            try:
+                orm = ORMapNumber.expand(pagename)
+            except ValueError as e:
+                if report: report("plss: %s" % e)
+                continue
+            c = cell(orm)
+            self.d_cell[pagename] = c
+            self.d_children[pagename] = []
+            if orm.mapsuffixtype == '0':
+                self.d_page[c] = pagename
+            else:
+                suffixed.add(pagename)
+
+        # The parent is the closest map that contains this one.
+        for pagename, c in self.d_cell.items():
+            parent = None
+            if pagename in suffixed:
+                parent = self._find(c)
+            if not parent:
+                parent = self._find(parent_cell(c))
+            self.d_parent[pagename] = parent
+            if parent:
+                self.d_children[parent].append(pagename)
+        for children in self.d_children.values():
+            children.sort(key=d_sortkey.get)
+
+        for pagename, c in self.d_cell.items():
+            self.d_neighbours[pagename] = self._neighbours(pagename, c)
+        return
+
+    def _find(self, c):
+        """ Return the map for this cell, or for the closest cell containing it. """
+        while c is not None:
+            try:
+                return self.d_page[c]
+            except KeyError:
+                c = parent_cell(c)
+        return None
+
+    def _neighbours(self, pagename, c):
+        ancestors = set(self.ancestors(pagename))
+        base = self.d_page.get(c)
+        d = {}
+        (level, x, y) = c
+        for direction, (dx, dy) in directions:
+            n = self._find((level, x+dx, y+dy))
+            if n and n != pagename and n != base and not n in ancestors:
+                d[direction] = n
+        return d
+
+    def __contains__(self, pagename):
+        return pagename in self.d_cell
+
+    def parent(self, pagename):
+        """ Return the map that contains this one, or None. """
+        return self.d_parent.get(pagename)
+
+    def ancestors(self, pagename):
+        """ Return the list of maps containing this one, closest first. """
+        l = []
+        p = self.d_parent.get(pagename)
+        while p:
+            l.append(p)
+            p = self.d_parent.get(p)
+        return l
+
+    def children(self, pagename):
+        """ Return the maps directly inside this one, in map order. """
+        return self.d_children.get(pagename, [])
+
+    def siblings(self, pagename):
+        """ Return the other maps that have the same parent. """
+        parent = self.d_parent.get(pagename)
+        if not parent:
+            return []
+        return [p for p in self.d_children[parent] if p != pagename]
+
+    def subtree(self, pagename):
+        """ Return this map and everything inside it, in map order.
+        For example, section 5 and all its quarter and detail maps. """
+        if not pagename in self.d_cell:
+            return []
+        l = [pagename]
+        for child in self.d_children[pagename]:
+            l.extend(self.subtree(child))
+        return l
+
+    def expand(self, text):
+        """ Return the pages for "8 10 5+" (the map and everything inside it),
+        anything without a "+" is returned as it is. """
+        if not text.endswith('+'):
+            return [text]
+        return self.subtree(text[:-1].strip())
+
+    def neighbours(self, pagename):
+        """ Return a dict of the maps around this one, indexed by direction "N", "NE", ...
+        If there's no map at the same level, the map containing that area is used.
+        Directions with nothing mapped are left out. """
+        return self.d_neighbours.get(pagename, {})
+
+# The last index built, so tools that get called over and over don't rebuild it.
+_cached = (None, None)
+
+def plss_for(pagenames, report=print):
+    """ Return a plss for this list of pagenames, reusing the last one if it's the same list. """
+    global _cached
+    key = tuple(pagenames)
+    if _cached[0] != key:
+        _cached = (key, plss(key, report))
+    return _cached[1]
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+
+    pagenames = ["8 10", "8 09", "7 10",
+                 "8 10 5", "8 10 4", "8 10 6", "8 10 8", "8 10 32", "8 10 31",
+                 "8 10 5C", "8 10 5CD", "8 10 5CD D1", "8 10 5CD D2", "8 10 5D", "8 10 5B",
+                 "8 10 D1", "7 10 1", "8 09 6"]
+    p = plss(pagenames)
+
+    assert p.parent("8 10 5CD") == "8 10 5C"
+    assert p.parent("8 10 5C") == "8 10 5"
+    assert p.parent("8 10 5") == "8 10"
+    assert p.parent("8 10") is None
+    assert p.parent("8 10 5CD D1") == "8 10 5CD"
+    assert p.parent("8 10 D1") == "8 10"
+    assert p.ancestors("8 10 5CD D2") == ["8 10 5CD", "8 10 5C", "8 10 5", "8 10"]
+    assert p.children("8 10 5") == ["8 10 5B", "8 10 5C", "8 10 5D"], p.children("8 10 5")
+    assert p.siblings("8 10 5C") == ["8 10 5B", "8 10 5D"]
+    assert p.subtree("8 10 5") == ["8 10 5", "8 10 5B", "8 10 5C", "8 10 5CD", "8 10 5CD D1", "8 10 5CD D2", "8 10 5D"], p.subtree("8 10 5")
+
+    # Section 5 is between 4 (east) and 6 (west), 8 is south of it.
+    n = p.neighbours("8 10 5")
+    assert n["E"] == "8 10 4" and n["W"] == "8 10 6" and n["S"] == "8 10 8", n
+    # North of section 5 in T8N is section 32 in T9N, not mapped, so nothing is there.
+    assert not "N" in n, n
+
+    # Section 1 is in the NE corner of T7N R10W, north of it is section 36 of T8N R10W
+    # and NE of it is T8N R9W, they are not mapped so they fall back to the townships.
+    n = p.neighbours("7 10 1")
+    print("7 10 1", n)
+    assert n == {"N": "8 10", "NW": "8 10", "NE": "8 09"}, n
+
+    # Section 31 of T8N R10W is on the south edge, below it is section 6 of T7N.
+    n = p.neighbours("8 10 31")
+    print("8 10 31", n)
+    assert n["E"] == "8 10 32" and n["S"] == "7 10", n
+
+    n = p.neighbours("8 10 5CD")
+    print("8 10 5CD", n)
+    # North of 5CD is 5CA which is only mapped as part of 5C, its parent.
+    assert n["E"] == "8 10 5D" and n["S"] == "8 10 8" and not "N" in n, n
+
+    n = p.neighbours("8 10")
+    assert n == {"E": "8 09", "S": "7 10"}, n
+
+    assert plss_for(pagenames).expand("8 10 5C+") == ["8 10 5C", "8 10 5CD", "8 10 5CD D1", "8 10 5CD D2"]
+    assert plss_for(pagenames).expand("8 10 5C") == ["8 10 5C"]
+    assert plss_for(pagenames) is plss_for(list(pagenames))
+    messages = []
+    plss(["8 10", "not a map"], messages.append)
+    assert len(messages) == 1, messages
+
+    print("Unit tests completed.")
+# That's all!
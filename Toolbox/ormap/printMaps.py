@@ -8,78 +8,289 @@ from __future__ import print_function
 import arcpy
 from arcpy import mapping as MAP
 import os, sys
-from ormap.arc_utilities import aprint, eprint
-from zoomToMapNumber import update_page_layout
-from time import sleep
-
-def print_map(mxd, pagename, output_type, output_file):
-    """Set up a page and print it. """
-            
-    arcpy.SetProgressorLabel("Exporting to %s" % output_file)
-
-    update_page_layout(mxd, pagename)
-    
-    if os.path.exists(output_file):
-        os.unlink(output_file)
-
-    msg = ""
-    if output_type == 'PDF':
+from ormap.arc_utilities import aprint, eprint, ListPagenames
+from pageindex import index_for
+from plss import plss_for
+from zoomToMapNumber import update_page_layout, plan_pages, apply_page_plan, page_inputs, mapping_backend, ORMAP
+from zoomToMapNumber import changed_pages, record_printed, get_page_scales, check_caches
+from pacing import pacer
+from printmanifest import manifest
+import printfarm
+from exportformats import parse_formats, describe, exporttimer
+from atlas import atlas
+from spans import trace, span
+import pageorder
+from time import time
+
+def print_map(mxd, pagename, formats, pathnames, ops=None, timer=None):
+    """Set up a page once and export it in each format.
+    'formats' is a list from exportformats.parse_formats() and 'pathnames' the file for each.
+    'ops' is the layout plan for the page from plan_pages(), if there is one.
+    Returns a list of True/False, one for each format, True if the export worked. """
+
+    arcpy.SetProgressorLabel("Exporting %s" % pagename)
+    trace.start_page(pagename)
+
+    t_start = time()
+    if ops:
+        apply_page_plan(mxd, pagename, ops)
+    else:
+        update_page_layout(mxd, pagename)
+    if timer: timer.add_setup(time() - t_start)
+
+    l_ok = []
+    for (output_type, ext, resolution), output_file in zip(formats, pathnames):
+        if os.path.exists(output_file):
+            os.unlink(output_file)
+        t_start = time()
+        ok = False
         try:
-            MAP.ExportToPDF(mxd, output_file)
+            with span("ExportTo" + output_type):
+                mapping_backend.export(mxd, output_type, output_file, resolution)
             msg = "Completed %s" % output_file
+            ok = True
         except Exception as e:
-            msg = "Export to PDF failed with '%s'." % e
-            pass
-    else:
+            msg = "Export to %s failed with '%s'." % (describe(output_type, resolution), e)
+        if timer: timer.add_export(output_type, resolution, time() - t_start)
+        aprint(msg)
+        l_ok.append(ok)
+    return l_ok
+
+def page_pathnames(formats, output_path, output_file, pagename, scratch=None):
+    """ Return the output file for each format, PDFs go to 'scratch' if it's given. """
+    return [scratch if scratch and t == "PDF" else printfarm.output_pathname(output_path, output_file, pagename, ext)
+            for t,ext,r in formats]
+
+def print_pages(mxd, pagenames, d_plan, formats, output_path, output_file, done, scratch=None):
+    """ Print a list of pages, calling done(pagename, l_ok, seconds) after each one,
+    'l_ok' has True or False for each format.
+    With 'scratch' every page's PDF is written to that one file, 'done' has to use it before it returns. """
+    # Instead of sleeping after each map, wait until its file is written.
+    pace = pacer(ORMAP.PrintMinGap, ORMAP.PrintTimeout)
+    timer = exporttimer()
+
+    for pagename in pagenames:
+        pathnames = page_pathnames(formats, output_path, output_file, pagename, scratch)
+        #print("Output files:", pathnames)
+        t_start = time()
+        l_ok = [False] * len(formats)
         try:
-            MAP.ExportToJPEG(mxd, output_file)
-            msg = "Completed %s" % output_file
+            l_ok = print_map(mxd, pagename, formats, pathnames, d_plan.get(pagename), timer)
+            for i, pathname in enumerate(pathnames):
+                if not l_ok[i]: continue
+                with span("wait_for_file"):
+                    ready = pace.ready(pathname, t_start)
+                if not ready:
+                    aprint("\"%s\" was not finished after %d seconds." % (pathname, ORMAP.PrintTimeout))
+                    l_ok[i] = False
         except Exception as e:
-            msg = "Export to JPEG failed with '%s'." % e
-            pass
-    aprint(msg)
+            aprint("Could not print %s, %s" % (pagename, e))
+        done(pagename, l_ok, time() - t_start)
+
+    aprint(timer.summary())
+    aprint(pace.summary())
+    return
+
+def farm_worker(worker_id, pagenames, queue, mxdname, d_plan, formats, output_path, output_file):
+    """ Print pages in a process of its own, see printfarm. """
+    mxd = MAP.MapDocument(mxdname)
+    def done(pagename, l_ok, seconds):
+        queue.put((worker_id, pagename, l_ok, seconds))
+    trace.start()
+    print_pages(mxd, pagenames, d_plan, formats, output_path, output_file, done)
+    trace.stop()
+    aprint(trace.summary())
+    if ORMAP.TraceFile:
+        trace.write("%s-worker%d" % (ORMAP.TraceFile, worker_id), worker_id + 1)
+    del mxd
     return
 
-def print_maps(mxd, pagenames, output_type, output_pathname):
-    """Set up each page and print it. """
+def print_maps(mxd, pagenames, output_type, output_pathname, atlas_file=None, atlas_only=False, saved=False):
+    """Set up each page and print it.
+    'pagenames' is a list separated by ';', wildcards like "8 10 5*" work,
+    and "CHANGED" prints the maps whose features changed since they were last printed.
+    'output_type' can be more than one format, like "PDF;JPEG:96", each page is
+    set up once and exported in all of them. The extension on 'output_pathname' is ignored.
+    'atlas_file' puts the PDF pages into one PDF as well, in map number order.
+    With 'atlas_only' the single page PDFs are not kept, each one goes into
+    the atlas and the next one is written over it.
+    'saved' is True when 'mxd' was opened from its file, not "CURRENT",
+    so it's known to be what was saved. Only then are maps printed before
+    skipped (see PrintManifest) and saved page plans used. """
+
+    try:
+        formats = parse_formats(output_type)
+    except ValueError as e:
+        eprint(str(e))
+        return
+    if not formats:
+        eprint("No output format.")
+        return
 
-    if output_type == "PDF":
-        output_ext = ".pdf"
-    else:
-        output_ext = ".jpg"
-        
     #arcpy.AddMessage("output_pathname = %s" % output_pathname)
     (output_path, output_fileext) = os.path.split(output_pathname)
     (output_file, output_ext)     = os.path.splitext(output_fileext)
 
+    if atlas_file and not "PDF" in [t for t,ext,r in formats]:
+        eprint("An atlas needs PDF output.")
+        return
+    scratch = None
+    if atlas_file:
+        pdf = [t for t,ext,r in formats].index("PDF")
+    if atlas_file and atlas_only:
+        scratch = os.path.join(os.environ.get("TEMP", output_path), "ormap-atlas-page.pdf")
+
+    def pathnames(pagename):
+        return page_pathnames(formats, output_path, output_file, pagename, scratch)
+
     l_pagenames = pagenames.split(';')
 
-    start    = 0
-    maxcount = len(l_pagenames)
-    step     = 1
-    
+    # Once for the batch, not for every page.
+    check_caches(mxd)
+
+    d_changes = None
+    if [mn for mn in l_pagenames if mn.strip("\"' ").upper() == "CHANGED"]:
+        try:
+            l_pagenames, d_changes = changed_pages(mxd)
+        except Exception as e:
+            eprint("Can't tell which maps have changed, is the map index readable? %s" % e)
+            return
+        if not l_pagenames:
+            aprint("No maps have changed.")
+            return
+
+    # Expand wildcards like "8 10 5*" and "8 10 5+" (section 5 and
+    # all the maps inside it) into the list of pages.
+    if [mn for mn in l_pagenames if '*' in mn or mn.strip("\"' ").endswith('+')]:
+        all_pagenames = ListPagenames(mxd)
+        idx = index_for(all_pagenames)
+        tree = plss_for(all_pagenames, aprint)
+        l_expanded = []
+        for mn in l_pagenames:
+            if '*' in mn:
+                l_expanded.extend(idx.expand(mn.strip("\"'")))
+            elif mn.strip("\"' ").endswith('+'):
+                l_expanded.extend(tree.expand(mn.strip("\"' ")))
+            else:
+                l_expanded.append(mn)
+        l_pagenames = l_expanded
+
     if len(l_pagenames) <= 0:
         eprint("No map numbers found to print.")
         return
 
+    # ESRI likes to wrap parameters strings in quotes, for some unknown reason.
+    l_pagenames = [mn.strip("\"'") for mn in l_pagenames]
+
+    book = None
+    if atlas_file:
+        book = atlas(atlas_file, l_pagenames, mapping_backend, ORMAP.AtlasFlushPages)
+        l_pagenames = book.order
+
+    # Skip maps that were already printed from the same inputs.
+    # Their PDFs still go in the atlas, when the single pages are kept.
+    printed = None
+    d_inputs = {}
+    if ORMAP.PrintManifest and saved and mxd.filePath and not scratch:
+        printed = manifest(os.path.join(output_path, (output_file or "ormap") + ".manifest"))
+        try:
+            # The features on each map count too, or a changed map would look up to date.
+            d_inputs = page_inputs(mxd, l_pagenames, d_changes)
+        except Exception as e:
+            aprint("Can't tell which maps are up to date, printing all of them. %s" % e)
+        current = set(pagename for pagename in l_pagenames if pagename in d_inputs and
+                      all(printed.is_current(pathname, d_inputs[pagename]) for pathname in pathnames(pagename)))
+        if current:
+            aprint("%d of %d maps are up to date." % (len(current), len(l_pagenames)))
+            l_pagenames = [pagename for pagename in l_pagenames if not pagename in current]
+            if d_changes is not None:
+                # Their files already show these features, so they are not "CHANGED" any more.
+                record_printed(mxd, d_changes, current)
+            if book:
+                for pagename in current:
+                    book.add(pagename, pathnames(pagename)[pdf])
+            if not l_pagenames:
+                if book:
+                    aprint("Atlas \"%s\" has %d pages." % (atlas_file, book.close()))
+                return
+
+    # Print in the order that changes the layout least. With a scratch file
+    # the pages have to be printed in atlas order.
+    if ORMAP.ReorderPages and not scratch and len(l_pagenames) > 1:
+        d_scale = get_page_scales(mxd)
+        l_ordered = pageorder.optimize(l_pagenames, d_scale)
+        aprint(pageorder.report(l_pagenames, l_ordered, d_scale))
+        l_pagenames = l_ordered
+
+    start    = 0
+    maxcount = len(l_pagenames)
+    step     = 1
+
     if maxcount>1:
         arcpy.SetProgressor("step", "Printing %d maps." % maxcount, start, maxcount, step)
     else:
         arcpy.SetProgressor("default", "Printing %s" % l_pagenames[0])
-        
-    t = 0
-    # ESRI likes to wrap parameters strings in quotes, for some unknown reason.
-    for mn in l_pagenames:
-        pagename = mn.strip("\"'")
-        filename = output_file + pagename.replace(' ', '_')
-        pathname = os.path.join(output_path, filename + output_ext)
-        #print("Output file:", pathname)
-        print_map(mxd, pagename, output_type, pathname)
 
-        t += 1
-        arcpy.SetProgressorPosition(t)
-        sleep(3) # Give ArcMap a chance to catch up with us. Superstition.
+    # Time each stage of setting up and exporting the pages.
+    trace.start()
+
+    # Work out all the page layouts before starting to export.
+    d_plan = plan_pages(mxd, l_pagenames, reuse=saved)
+    aprint("Planned %d of %d pages." % (len(d_plan), len(l_pagenames)))
+
+    progress = [0]
+    l_printed = []
+    def done(pagename, l_ok, seconds):
+        """ 'l_ok' has True or False for each format, one that failed
+        does not keep the others out of the manifest and the atlas. """
+        progress[0] += 1
+        arcpy.SetProgressorPosition(progress[0])
+        if all(l_ok):
+            l_printed.append(pagename)
+        if printed is not None and pagename in d_inputs:
+            for pathname, ok in zip(pathnames(pagename), l_ok):
+                if ok: printed.record(pathname, d_inputs[pagename])
+        if book:
+            if l_ok[pdf]:
+                book.add(pagename, pathnames(pagename)[pdf])
+            else:
+                book.skip(pagename)
+
+    workers = min(ORMAP.PrintWorkers, len(l_pagenames))
+    if scratch and workers > 1:
+        aprint("The single pages are not kept, so there's one worker.")
+        workers = 1
+    if workers > 1 and mxd.filePath:
+        # Each worker opens the MXD itself, so it prints what was last saved.
+        aprint("Printing with %d workers from \"%s\"." % (workers, mxd.filePath))
+        d_result = printfarm.run_farm(l_pagenames, workers, farm_worker,
+                                      (mxd.filePath, d_plan, formats, output_path, output_file),
+                                      report=aprint, on_page=done)
+        aprint(printfarm.summary(d_result))
+        failed = [pagename for pagename in l_pagenames if not printfarm.succeeded(d_result[pagename][0])]
+        if failed:
+            aprint("These maps did not print: %s" % ", ".join(failed))
+    else:
+        print_pages(mxd, l_pagenames, d_plan, formats, output_path, output_file, done, scratch)
+
+    if printed is not None:
+        printed.close()
+    if book:
+        aprint("Atlas \"%s\" has %d pages." % (atlas_file, book.close()))
+        if scratch and os.path.exists(scratch):
+            os.unlink(scratch)
+    if d_changes is not None:
+        record_printed(mxd, d_changes, l_printed)
+
+    trace.stop()
+    aprint(trace.summary())
+    if ORMAP.TraceFile:
+        try:
+            trace.write(ORMAP.TraceFile)
+        except Exception as e:
+            aprint("Could not write timings to \"%s\", %s" % (ORMAP.TraceFile, e))
 
+    t = progress[0]
     if t>1: arcpy.SetProgressorLabel("Completed %d maps." % t)
     return
 
@@ -102,7 +313,7 @@ if __name__ == '__main__':
         output_file = os.path.join(os.environ["TEMP"],"printmap-unittest-.jpg")
         output_type = "JPEG"
     mxd = MAP.MapDocument(mxdname)
-    print_maps(mxd, pagenames, output_type, output_file)
+    print_maps(mxd, pagenames, output_type, output_file, saved=(mxdname != "CURRENT"))
     del mxd
     print("Tests completed.")
 # That's all
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Split a list of pages between several processes.
+
+Each worker gets a run of pages next to each other in map order, so
+it still gets to skip locator updates between pages in the same
+township. Workers report each page on a queue as they finish it.
+If a worker dies (ArcMap does that sometimes) the pages it had not
+finished are given to a new worker, the rest of the run carries on.
+
+The worker is a function called as
+    work(worker_id, pagenames, queue, *args)
+that puts (worker_id, pagename, ok, seconds) on the queue for each page.
+'ok' is True or False, or a list of them when a page has more than one
+output file, see succeeded().
+The queue is written straight to a pipe, so a page that was reported
+is not lost if the worker dies right after.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import os, sys, time
+import multiprocessing
+from multiprocessing.queues import SimpleQueue
+
+def output_pathname(output_path, prefix, pagename, ext):
+    """ Return the file name for a page, like "C:/maps/ormap8_10_5CD.pdf".
+    It only depends on the page so it comes out the same however the work is split up. """
+    return os.path.join(output_path, prefix + pagename.replace(' ', '_') + ext)
+
+def succeeded(ok):
+    """ Return True if a page worked, every output if 'ok' is a list. """
+    if isinstance(ok, (list, tuple)):
+        return len(ok) > 0 and all(ok)
+    return bool(ok)
+
+def chunks(pagenames, n):
+    """ Split a list into 'n' runs of nearly the same length, keeping the order. """
+    n = max(1, min(n, len(pagenames)))
+    size, extra = divmod(len(pagenames), n)
+    l = []
+    start = 0
+    for i in range(n):
+        end = start + size + (1 if i < extra else 0)
+        l.append(pagenames[start:end])
+        start = end
+    return l
+
+def use_python_exe():
+    """ Inside ArcMap sys.executable is ArcMap.exe, the workers need python.exe. """
+    exe = os.path.join(sys.exec_prefix, "python.exe")
+    if os.path.exists(exe) and not sys.executable.lower().endswith("python.exe"):
+        multiprocessing.set_executable(exe)
+    return
+
+def run_farm(pagenames, nworkers, work, args=(), retries=1, report=print, on_page=None):
+    """ Run 'work' on the pages in 'nworkers' processes.
+    'report' gets progress messages, 'on_page' is called with (pagename, ok, seconds)
+    as each page is finished.
+    Returns a dict of (ok, seconds, worker_id) indexed by pagename.
+    Pages that were never finished come back with ok False and seconds None. """
+    use_python_exe()
+    queue = SimpleQueue()
+    d_result = {}
+    todo = chunks(list(pagenames), nworkers)
+    next_id = 0
+    for attempt in range(retries + 1):
+        workers = []
+        for chunk in todo:
+            p = multiprocessing.Process(target=work, args=(next_id, chunk, queue) + tuple(args))
+            p.daemon = True
+            p.start()
+            workers.append((next_id, p, chunk))
+            next_id += 1
+        total = sum(len(chunk) for chunk in todo)
+        d_done = {} # pages finished by each worker in this round
+
+        def collect():
+            while not queue.empty():
+                (worker_id, pagename, ok, seconds) = queue.get()
+                d_result[pagename] = (ok, seconds, worker_id)
+                d_done[worker_id] = d_done.get(worker_id, 0) + 1
+                if on_page:
+                    on_page(pagename, ok, seconds)
+                if report:
+                    report("Worker %d %s %s (%d/%d)" % (worker_id, "finished" if succeeded(ok) else "failed on",
+                                                       pagename, sum(d_done.values()), total))
+
+        while [w for w in workers if w[1].is_alive()]:
+            collect()
+            time.sleep(.2)
+        collect() # anything still in the queue after they all stopped
+
+        todo = []
+        for worker_id, p, chunk in workers:
+            p.join()
+            left = [pagename for pagename in chunk if not pagename in d_result]
+            if left:
+                if report: report("Worker %d stopped (exit code %s) with %d pages left." % (worker_id, p.exitcode, len(left)))
+                todo.append(left)
+        if not todo:
+            break
+
+    for chunk in todo:
+        for pagename in chunk:
+            d_result[pagename] = (False, None, None)
+    return d_result
+
+def summary(d_result):
+    """ Return a line about the results from run_farm(). """
+    ok = [r for r in d_result.values() if succeeded(r[0])]
+    seconds = sum(r[1] for r in ok)
+    workers = len(set(r[2] for r in d_result.values() if r[2] is not None))
+    return "%d of %d pages done by %d workers, %.1f seconds of work." % (len(ok), len(d_result), workers, seconds)
+
+# =============================================================================
+# Workers for the unit tests, they have to be at the top level so they can be pickled.
+
+def _test_worker(worker_id, pagenames, queue, folder, crash_on=None):
+    for pagename in pagenames:
+        t0 = time.time()
+        if pagename == crash_on and not os.path.exists(os.path.join(folder, "crashed")):
+            open(os.path.join(folder, "crashed"), "w").close()
+            os._exit(3) # like ArcMap falling over
+        with open(output_pathname(folder, "test", pagename, ".txt"), "w") as fp:
+            fp.write("%s by %d" % (pagename, worker_id))
+        queue.put((worker_id, pagename, True, time.time() - t0))
+    return
+
+if __name__ == "__main__":
+    # unit tests
+    import tempfile, shutil
+
+    assert chunks(list(range(10)), 3) == [[0,1,2,3], [4,5,6], [7,8,9]]
+    assert chunks([1,2], 8) == [[1], [2]]
+    assert succeeded(True) and succeeded([True, True])
+    assert not succeeded([True, False]) and not succeeded([]) and not succeeded(False)
+    assert output_pathname("maps", "ormap", "8 10 5CD D1", ".pdf") == os.path.join("maps", "ormap8_10_5CD_D1.pdf")
+
+    pagenames = ["8 10 %d" % s for s in range(1, 37)]
+    folder = tempfile.mkdtemp()
+    try:
+        l_done = []
+        d = run_farm(pagenames, 4, _test_worker, (folder,), report=None, on_page=lambda *args: l_done.append(args))
+        assert sorted(d) == sorted(pagenames)
+        assert sorted(p for p,ok,seconds in l_done) == sorted(pagenames)
+        assert all(r[0] for r in d.values())
+        print(summary(d))
+        for pagename in pagenames:
+            assert os.path.exists(output_pathname(folder, "test", pagename, ".txt"))
+
+        # A worker crashes partway through, its pages go to a new worker.
+        d = run_farm(pagenames, 4, _test_worker, (folder, "8 10 12"))
+        assert all(r[0] for r in d.values()), d
+        assert d["8 10 12"][2] == 4 # the replacement worker
+        print(summary(d))
+
+        # It keeps crashing and there are no retries left.
+        os.unlink(os.path.join(folder, "crashed"))
+        d = run_farm(pagenames, 4, _test_worker, (folder, "8 10 12"), retries=0, report=None)
+        assert d["8 10 12"] == (False, None, None)
+        assert d["8 10 13"] == (False, None, None) # same worker, after the crash
+        assert d["8 10 11"][0] # same worker, before the crash
+        print(summary(d))
+    finally:
+        shutil.rmtree(folder)
+
+    print("Unit tests completed.")
+# That's all!
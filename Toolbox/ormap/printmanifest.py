@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Remember which maps have been printed, and from what.
+
+A print batch writes a line to the manifest as each map is finished,
+with a fingerprint of everything the map was made from (MXD, map index
+row, cancelled taxlots, plot date) and the size and time of the file
+it wrote. If the batch dies it can be started again and the maps that
+were already done are skipped. Running the same batch again only
+prints the maps whose inputs changed or whose files went away.
+
+The file is plain text, one JSON record per line, so a line cut off
+by a crash only loses that one map.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import os, json, hashlib
+from filestamp import stamp
+
+version = 1 # Change this if the file format changes, so old files get ignored.
+
+def fingerprint(*inputs):
+    """ Return a short string that changes when any of the inputs change. """
+    return hashlib.md5(repr(inputs).encode("utf-8")).hexdigest()
+
+class manifest(object):
+    """ Printed maps, indexed by output file. """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.d_done = {} # (fingerprint, file stamp) indexed by output file
+        self.fp = None
+        self._load()
+        return
+
+    def _key(self, pathname):
+        return os.path.normcase(os.path.abspath(pathname))
+
+    def _load(self):
+        try:
+            with open(self.filename, "r") as fp:
+                header = json.loads(fp.readline())
+                if header.get("version") != version:
+                    return
+                for line in fp:
+                    try:
+                        d = json.loads(line)
+                    except ValueError:
+                        continue # cut off when the last batch died
+                    self.d_done[d["file"]] = (d["inputs"], d["stamp"])
+        except Exception as e:
+            self.d_done = {}
+        return
+
+    def __len__(self):
+        return len(self.d_done)
+
+    def is_current(self, pathname, inputs):
+        """ Return True if 'pathname' was printed from 'inputs' and has not been touched since. """
+        try:
+            (saved, saved_stamp) = self.d_done[self._key(pathname)]
+        except KeyError:
+            return False
+        if saved != inputs:
+            return False
+        return list(stamp(pathname) or ()) == saved_stamp
+
+    def record(self, pathname, inputs):
+        """ Note that 'pathname' has been printed from 'inputs'. """
+        if self.fp is None:
+            self._open()
+        key = self._key(pathname)
+        self.d_done[key] = (inputs, list(stamp(pathname) or ()))
+        self.fp.write(json.dumps({"file": key, "inputs": inputs, "stamp": self.d_done[key][1]}) + "\n")
+        self.fp.flush()
+        return
+
+    def forget(self, pathname):
+        """ Drop a map, so it gets printed next time. """
+        key = self._key(pathname)
+        if key in self.d_done:
+            del self.d_done[key]
+            self.close()
+        return
+
+    def _open(self):
+        """ Rewrite the file with only the current records, then keep it open for appending. """
+        tmpname = self.filename + ".tmp"
+        with open(tmpname, "w") as fp:
+            fp.write(json.dumps({"version": version}) + "\n")
+            for key in sorted(self.d_done):
+                (inputs, file_stamp) = self.d_done[key]
+                fp.write(json.dumps({"file": key, "inputs": inputs, "stamp": file_stamp}) + "\n")
+        if os.path.exists(self.filename): os.unlink(self.filename)
+        os.rename(tmpname, self.filename)
+        self.fp = open(self.filename, "a")
+        return
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+        return
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    import tempfile, shutil
+
+    folder = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(folder, "ormap.manifest")
+        pdf = os.path.join(folder, "ormap8_10_5.pdf")
+        inputs = fingerprint(("TestMap.mxd", 1546300800), ("8 10 5", 4800), ("100", "200"), "1/02/2019")
+        assert inputs != fingerprint(("TestMap.mxd", 1546300800), ("8 10 5", 4800), ("100",), "1/02/2019")
+
+        m = manifest(filename)
+        assert not m.is_current(pdf, inputs)
+        with open(pdf, "w") as fp: fp.write("%PDF")
+        m.record(pdf, inputs)
+        assert m.is_current(pdf, inputs)
+        assert not m.is_current(pdf, fingerprint("something else"))
+        m.close()
+
+        # Start again, it's still there.
+        m = manifest(filename)
+        assert len(m) == 1
+        assert m.is_current(pdf, inputs)
+
+        # The file was replaced by someone else.
+        with open(pdf, "w") as fp: fp.write("%PDF-1.4 something else")
+        assert not m.is_current(pdf, inputs)
+
+        # A batch that died part way through a line.
+        m.record(pdf, inputs)
+        m.close()
+        with open(filename, "a") as fp: fp.write('{"file": "ormap8_10')
+        m = manifest(filename)
+        assert m.is_current(pdf, inputs)
+
+        # Old format, start over.
+        with open(filename, "w") as fp: fp.write(json.dumps({"version": 0}) + "\n")
+        assert len(manifest(filename)) == 0
+
+        m.forget(pdf)
+        assert not m.is_current(pdf, inputs)
+    finally:
+        shutil.rmtree(folder)
+
+    print("Unit tests completed.")
+# That's all!
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Time the stages of setting up and exporting a page.
+
+Code that does something slow wraps it in a span,
+    with span("select_scalebar"):
+        ...
+or puts @timed("update_locator_maps") on the function. Spans are only
+kept while a print batch is recording, the rest of the time they cost
+two calls to time().
+
+At the end of a batch the spans can be written as JSON lines (one
+span per line) and in Chrome's trace event format (open it in
+chrome://tracing or https://ui.perfetto.dev), and summarized
+with the median and 95th percentile for each stage.
+
+@author: Brian Wilson <bwilson@co.clatsop.or.us>
+"""
+from __future__ import print_function
+import os, json, math
+from time import time
+from functools import wraps
+from contextlib import contextmanager
+
+def percentile(values, p):
+    """ Return the p'th percentile of a sorted list, the nearest rank kind. """
+    if not values:
+        return 0
+    i = int(math.ceil(p / 100.0 * len(values))) - 1
+    return values[max(0, min(i, len(values) - 1))]
+
+class tracer(object):
+    """ Collects spans for pages. """
+
+    def __init__(self):
+        self.recording = False
+        self.pagename = None
+        self.depth = 0
+        self.spans = [] # (pagename, name, start, seconds, depth)
+        return
+
+    def start(self):
+        """ Start recording, forgetting any spans from before. """
+        self.spans = []
+        self.pagename = None
+        self.recording = True
+        return
+
+    def stop(self):
+        self.recording = False
+        return
+
+    def start_page(self, pagename):
+        """ Spans from now on belong to this page. """
+        self.pagename = pagename
+        return
+
+    @contextmanager
+    def span(self, name):
+        if not self.recording:
+            yield
+            return
+        depth = self.depth
+        self.depth += 1
+        t_start = time()
+        try:
+            yield
+        finally:
+            self.spans.append((self.pagename, name, t_start, time() - t_start, depth))
+            self.depth = depth
+
+    def stages(self):
+        """ Return a dict of sorted lists of seconds indexed by span name. """
+        d = {}
+        for pagename, name, start, seconds, depth in self.spans:
+            d.setdefault(name, []).append(seconds)
+        for l in d.values():
+            l.sort()
+        return d
+
+    def summary(self):
+        """ Return a table of timings for each stage, slowest first. """
+        d = self.stages()
+        if not d:
+            return "No timings."
+        lines = ["%-24s %6s %9s %8s %8s %8s" % ("stage", "count", "total s", "p50 s", "p95 s", "max s")]
+        for name, seconds in sorted(d.items(), key=lambda i: -sum(i[1])):
+            lines.append("%-24s %6d %9.2f %8.3f %8.3f %8.3f" % (name, len(seconds), sum(seconds),
+                         percentile(seconds, 50), percentile(seconds, 95), seconds[-1]))
+        return "\n".join(lines)
+
+    def write_jsonl(self, filename):
+        """ Write the spans as JSON, one per line. """
+        with open(filename, "w") as fp:
+            for pagename, name, start, seconds, depth in self.spans:
+                fp.write(json.dumps({"page": pagename, "stage": name, "start": round(start, 6),
+                                     "seconds": round(seconds, 6), "depth": depth}) + "\n")
+        return
+
+    def write_chrome(self, filename, tid=0):
+        """ Write the spans in Chrome's trace event format.
+        'tid' tells apart the workers when their files are put together. """
+        pid = os.getpid()
+        t0 = min([s[2] for s in self.spans] or [0])
+        events = []
+        for pagename, name, start, seconds, depth in self.spans:
+            events.append({"name": name, "cat": "page", "ph": "X", "pid": pid, "tid": tid,
+                           "ts": int((start - t0) * 1e6), "dur": int(seconds * 1e6),
+                           "args": {"page": pagename}})
+        with open(filename, "w") as fp:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fp)
+        return
+
+    def write(self, basename, tid=0):
+        """ Write "basename.jsonl" and "basename.trace.json". """
+        self.write_jsonl(basename + ".jsonl")
+        self.write_chrome(basename + ".trace.json", tid)
+        return
+
+# The tracer everything in this process uses
+trace = tracer()
+
+def span(name):
+    """ Time a block of code, "with span(name): ..." """
+    return trace.span(name)
+
+def timed(name=None):
+    """ Decorator that times every call to a function. """
+    def decorator(f):
+        label = name or f.__name__
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            with trace.span(label):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# =============================================================================
+if __name__ == "__main__":
+    # unit tests
+    import tempfile, shutil
+    from time import sleep
+
+    assert percentile([1,2,3,4,5,6,7,8,9,10], 50) == 5
+    assert percentile([1,2,3,4,5,6,7,8,9,10], 95) == 10
+    assert percentile([7], 95) == 7
+
+    @timed()
+    def select_scalebar(n):
+        sleep(.001 * n)
+        return n
+
+    # Not recording, nothing is kept.
+    assert select_scalebar(1) == 1
+    assert trace.spans == []
+
+    trace.start()
+    for i, pagename in enumerate(["8 10 5", "8 10 5CD", "8 10 6"]):
+        trace.start_page(pagename)
+        with span("update_page_layout"):
+            select_scalebar(i)
+            with span("RefreshActiveView"):
+                pass
+        with span("ExportToPDF"):
+            sleep(.005)
+    trace.stop()
+    assert len(trace.spans) == 12
+    assert [s[1] for s in trace.spans[:3]] == ["select_scalebar", "RefreshActiveView", "update_page_layout"]
+    assert [s[4] for s in trace.spans[:4]] == [1, 1, 0, 0]
+    assert trace.spans[-1][0] == "8 10 6"
+
+    # An exception still ends the span.
+    trace.start()
+    try:
+        with span("ExportToJPEG"):
+            raise IOError("disk full")
+    except IOError:
+        pass
+    assert trace.depth == 0 and trace.spans[0][1] == "ExportToJPEG"
+
+    trace.start()
+    trace.start_page("8 10 5")
+    with span("ExportToPDF"):
+        sleep(.002)
+    print(trace.summary())
+
+    folder = tempfile.mkdtemp()
+    try:
+        basename = os.path.join(folder, "printmaps")
+        trace.write(basename, tid=3)
+        with open(basename + ".jsonl") as fp:
+            d = json.loads(fp.readline())
+        assert d["page"] == "8 10 5" and d["stage"] == "ExportToPDF"
+        with open(basename + ".trace.json") as fp:
+            events = json.load(fp)["traceEvents"]
+        assert events[0]["ph"] == "X" and events[0]["tid"] == 3 and events[0]["dur"] >= 2000
+    finally:
+        shutil.rmtree(folder)
+
+    print("Unit tests completed.")
+# That's all!
@@ -6,9 +6,9 @@ Created on Tue Dec 19 15:43:00 2017
 from __future__ import print_function
 import arcpy
 from arcpy import mapping as MAP
-import os, sys, re
+import os, sys
 from datetime import datetime
-from arc_utilities import aprint, eprint, SetDefinitionQuery, GetDataframe, GetLayer
+from arc_utilities import aprint, eprint, ListPagenames
 
 # =============================================================================
 # Load the "configuration files"
@@ -21,300 +21,353 @@ sys.path.append(configpath)
 import ORMAP_config as ORMAP
 aprint(ORMAP.__file__)
                            
-from ormapnum import ormapnum
+from ormapnum import ORMapNumber
 from cancellations import cancellations
+from crosswalk import load_or_build
+from layoutindex import layoutindex
+from locatorqueries import compile_locators
+import locatorcache
+import filestamp
+from printmanifest import fingerprint
+import mapchanges
+from pageplan import take_snapshot, planner, apply_plan, update_page, save_plan, load_plan
+from backend import arcpybackend
+from spans import timed
 
-# preload spreadsheet
-can = cancellations(xlsfile = ORMAP.CancelledNumbersTable)
+# locator map settings with the queries compiled, see get_locators()
+locators = None
 
-# locations of locator maps and cancelled taxlots group when on the page.
-locator_positions = {} # tuples index by df name
-can_x = can_y = 0
+# cancelled taxlots, the spreadsheet is not read until the first lookup
+# and then only checked for changes by check_caches()
+can = cancellations(xlsfile = ORMAP.CancelledNumbersTable, report = aprint)
 
-# ==============================================================================
-
-def make_scalebar_dict(mxd):
-    sb = {}
-    # make a list of all the scalebar elements in the map.
-    for elem in MAP.ListLayoutElements(mxd, "MAPSURROUND_ELEMENT"):
-        name = elem.name.lower()
-        if name.find("scalebar") >= 0:
-            sb[name] = elem
-    return sb
-
-def on_page(elem, mxd):
-    """ Return TRUE if the element is visible on its page layout. """
-    x = elem.elementPositionX
-    y = elem.elementPositionY
-        
-    minx = -elem.elementWidth
-    miny = -elem.elementHeight
-    maxx = mxd.pageSize.width
-    maxy = mxd.pageSize.height
-    
-    #print(elem.name,(x,y),(minx,miny),(maxx,maxy))
-    
-    return (x > minx and x < maxx) and (y > miny and y <= maxy)
-
-def select_scalebar(mxd, mapscale):
-    
-    sb = make_scalebar_dict(mxd) # all the scalebars in the map
-    sbname = "scalebar%d" % mapscale # the one we want
-    if not sb.has_key(sbname):
-        sbname = "scalebardefault"
-        if not sb.has_key(sbname):
-            aprint("There is no default scalebar.")
-            return
-        aprint("No scalebar found for %d so I am using %s." % (mapscale, sbname))
-
-    visible_sb = new_sb = None
-    for name in sb:
-        elem = sb[name]
-        lcname = elem.name.lower()
-
-        # Is this scalebar visible?
-        if on_page(elem, mxd):
-            visible_sb = elem           
-            if sbname == lcname:
-                #aprint("%s is already visible." % sbname)
-                # it's already on the map, stop
-                return
-        else:
-            if sbname == lcname:
-                new_sb = elem
-   
-    if not visible_sb:
-        aprint("There is no scalebar visible on the page. Position one on the map so I know where it belongs.")
-        return
-
-    map_x = visible_sb.elementPositionX
-    map_y = visible_sb.elementPositionY        
-
-    # Move this one off the map
-    visible_sb.elementPositionX = new_sb.elementPositionX
-    visible_sb.elementPositionY = new_sb.elementPositionY
-    #aprint("I will hide %s over here (%d,%d)" % (visible_sb.name, visible_sb.elementPositionX, visible_sb.elementPositionY))
-
-    if new_sb:
-        new_sb.elementPositionX = map_x
-        new_sb.elementPositionY = map_y
-        aprint("Put %s on the page (%d,%d)" % (new_sb.name, new_sb.elementPositionX, new_sb.elementPositionY))
-    else:
-        aprint("I did not find a good scalebar for this layout.")
-                
-    return
-
-def update_locator_maps(mxd, orm):
-    """ Update the locator maps to emphasize the area of interest.
-    mxd = map document
-    orm = ormap object, used in query definitions
+# map number crosswalks, indexed by DDP index layer data source
+d_crosswalk = {}
 
-    You can either create a mask or a highlighter based on queries in the configuration.
-    Set up query definitions in each dataframe to control this. 
-    
-    Returns the (x,y) location for the next stacked layout element. """
-
-    global sections_x, sections_y, qsections_x, qsections_y
-
-    # We're trying a stacked layout here. The county-wide locator will be at the top,
-    # and successive features will be below at suitable spacings.
-
-    x = y = 0
+# everything the layout code does to a map document through arcpy.mapping
+mapping_backend = arcpybackend()
 
-    for dfname,layers,extlayername,scale,fcount in [
-            (ORMAP.LocatorDF,  ORMAP.LocatorLayers,  ORMAP.LocatorExtentLayer,  ORMAP.LocatorScale,  ORMAP.LocatorFeatureCount),
-            (ORMAP.SectionDF,  ORMAP.SectionLayers,  ORMAP.SectionExtentLayer,  ORMAP.SectionScale,  ORMAP.SectionFeatureCount),
-            (ORMAP.QSectionDF, ORMAP.QSectionLayers, ORMAP.QSectionExtentLayer, ORMAP.QSectionScale, ORMAP.QSectionFeatureCount),
-            ]:
-        df = GetDataframe(mxd, dfname)
-
-        # Set query definitions
-
-        for layername, qd in layers:
-            query = ""
-            #aprint('qd = %s' % qd)
-            if qd:
-                try:
-                    query = eval(qd)
-                except Exception as e:
-                    aprint("EVAL failed: query=\"%s\", %s" % (query, e))
-            SetDefinitionQuery(mxd, df, layername, query) 
+# layout elements, dataframes and layers of the last map document used
+layout = None
 
-        # Set extent (pan and zoom as needed)
-        # and possibly hide the locator map
+# which sections have features and their extents, indexed by data source, fields and coordinate system
+d_locatorcache = None
+locatorcache_file = None
 
-        if extlayername:
-            # Pan and zoom are optional in locator maps.
-            ext_layer = GetLayer(mxd, df, extlayername)
-            df.extent = ext_layer.getExtent()
-            # if a fixed scale is specified in config, use it
-            if scale: df.scale  = scale
+# plans pages one at a time for update_page_layout(), (layout, plot date, planner)
+live_planner = None
 
-        # Now's our chance to hide (or show) locator maps!!
+# ==============================================================================
 
-        visibility = True
-        try:
-            fc_layer = GetLayer(mxd,df,fcount)
-            c = int(arcpy.GetCount_management(fc_layer).getOutput(0))
-            if c == 0:
-                visibility = False
-                aprint("Nothing to see in layer \"%s\"." % extlayername)
-        except Exception as e:
-            aprint("Error in %s, %s" % (extlayername, e))
+def check_caches(mxd):
+    """ Drop anything cached for this map document that is out of date.
+    Looking is slow (a geodatabase gets listed), so it's done once for
+    each tool run or print batch and not for every page. """
+    global layout, live_planner
+    live_planner = None
+    get_locators()
+    source = mxd.dataDrivenPages.indexLayer.dataSource
+    cw = d_crosswalk.get(source)
+    if cw is not None and cw.is_stale():
+        del d_crosswalk[source]
+    if layout is not None and layout.is_stale(mxd):
+        layout = None
+    d_cache = load_locator_caches(mxd)
+    st = filestamp.stamper()
+    for key in [k for k, lc in d_cache.items() if lc.is_stale(ORMAP.LocatorCacheMaxAge, st)]:
+        del d_cache[key]
+    can.refresh()
+    return
 
-        elm = None
+def get_locators():
+    """ Return the locator map settings with their queries compiled.
+    They're compiled the first time they are needed, so that a bad query
+    in the configuration is reported instead of stopping the toolbox
+    from loading. The locator maps are left alone when that happens. """
+    global locators
+    if locators is None:
         try:
-            elm = MAP.ListLayoutElements(mxd, "DATAFRAME_ELEMENT", dfname)[0]
-        except IndexError:
-            pass
-
-        if elm:
-                # leftover from before stacking was implemented
-#                if on_page(elm, mxd):
-#                    # this element is on the page so save its location for future use
-#                    locator_positions[elm.name] = (elm.elementPositionX, elm.elementPositionY)
-#                x=y=0
-#                try:
-#                    x = locator_positions[elm.name][0]
-#                    y = locator_positions[elm.name][1]
-#                except:
-#                    aprint("Can't figure out where to put \"%s\"" % elm.name)
-
-            if x <> 0 and y <> 0:
-                # LocatorDF won't get moved because it's always visible
-                elm.elementPositionX = x
-                elm.elementPositionY = y
-
-            if not visibility:
-                elm.elementPositionX = mxd.pageSize.width + 2
-                elm.elementPositionY = y
-
-            if on_page(elm, mxd):
-                # Set position for the next element below this one
-                x = elm.elementPositionX
-                y = elm.elementPositionY - (elm.elementHeight + .15)
-
-    return (x,y)
-
-
-def update_page_elements(mxd, df, orm):
-    #aprint("Setting up page layout")
-   
-    select_scalebar(mxd, df.scale)
-  
+            locators = compile_locators(ORMAP)
+        except (ValueError, AttributeError) as e:
+            eprint("Locator maps will not be updated, check ORMAP_config. %s" % e)
+            locators = []
+    return locators
+
+def get_crosswalk(mxd):
+    """ Return the map number crosswalk for the pages in this map document.
+    It's saved next to the MXD and rebuilt when the DDP index changes,
+    call check_caches() to find out. """
+    source = mxd.dataDrivenPages.indexLayer.dataSource
+    cw = d_crosswalk.get(source)
+    if cw is None:
+        if mxd.filePath:
+            filename = os.path.splitext(mxd.filePath)[0] + ".crosswalk"
+        else:
+            filename = os.path.join(os.environ.get("TEMP", os.getcwd()), "ormap.crosswalk")
+        cw = load_or_build(filename, source, lambda: ListPagenames(mxd))
+        d_crosswalk[source] = cw
+    return cw
+
+def page_orm(cw, pagename):
+    """ Return the ORMapNumber for a page, from the crosswalk or from the pagename.
+    Returns None (and says so) if the pagename is not a map number. """
+    orm = cw.orm(pagename)
+    if orm: return orm
     try:
-        elm = MAP.ListLayoutElements(mxd, "TEXT_ELEMENT", "PlotDate")[0]
-        now = datetime.now()
-        elm.text = "PLOT DATE: %2d/%02d/%4d" % (now.month, now.day, now.year)
-    except IndexError:
-        aprint("Could not find a PlotDate text element. Skipping.")
-
-    return
+        return ORMapNumber.expand(pagename)
+    except ValueError as e:
+        aprint("\"%s\" is not a map number, %s" % (pagename, e))
+    return None
+
+def get_layout(mxd):
+    """ Return the layout index for this map document.
+    It's built the first time it's needed and again for another document,
+    check_caches() drops it when the document has been saved since. """
+    global layout
+    if layout is None or layout.mxd is not mxd:
+        layout = layoutindex(mxd, mapping_backend)
+    return layout
+
+def load_locator_caches(mxd):
+    """ Return the dict of locator caches for this map document,
+    they are saved next to the MXD. """
+    global d_locatorcache, locatorcache_file
+    if mxd.filePath:
+        filename = os.path.splitext(mxd.filePath)[0] + ".locators"
+    else:
+        filename = os.path.join(os.environ.get("TEMP", os.getcwd()), "ormap.locators")
+    if filename != locatorcache_file:
+        d_locatorcache = locatorcache.load(filename, ORMAP.LocatorCacheMaxAge)
+        locatorcache_file = filename
+    return d_locatorcache
+
+def get_locator_cache(mxd, df, layer, fields):
+    """ Return the locator cache for a layer, reading the layer if
+    it has not been read yet. check_caches() drops the ones whose data
+    has changed since. These hold the sections and quarter sections
+    that have features and their extents. """
+    d_cache = load_locator_caches(mxd)
+    source = layer.dataSource
+    sr = df.spatialReference
+    key = (source, tuple(fields), sr.name)
+    lc = d_cache.get(key)
+    if lc is None:
+        # Extents come out in the dataframe's coordinates, like getExtent() would give.
+        rows = []
+        with arcpy.da.SearchCursor(source, [f for f,a in fields] + ["SHAPE@"], spatial_reference=sr) as cursor:
+            for row in cursor:
+                e = row[-1].extent if row[-1] else None
+                rows.append(row[:-1] + ((e.XMin, e.YMin, e.XMax, e.YMax) if e else None,))
+        lc = locatorcache.locatorcache(source, fields, rows)
+        aprint("Read %d locator areas from \"%s\"." % (len(lc), source))
+        d_cache[key] = lc
+        try:
+            locatorcache.save(locatorcache_file, d_cache)
+        except Exception as e:
+            aprint("Could not save locator cache \"%s\", %s" % (locatorcache_file, e))
+    return lc
+
+def locator_caches(mxd, layout):
+    """ Return the locator caches the planner uses, indexed by (dfname, "extent"|"count"). """
+    caches = {}
+    for dfname,layers,extlayername,extfields,scale,fcount,fcfields in get_locators():
+        df = layout.dataframe(dfname)
+        for kind, layername, fields in [("extent", extlayername, extfields), ("count", fcount, fcfields)]:
+            layer = layout.layer(df, layername) if df and layername else None
+            if layer and fields:
+                try:
+                    caches[(dfname, kind)] = get_locator_cache(mxd, df, layer, fields)
+                except Exception as e:
+                    aprint("Error in locator cache for %s, %s" % (layername, e))
+    return caches
+
+def plot_date():
+    now = datetime.now()
+    return "PLOT DATE: %2d/%02d/%4d" % (now.month, now.day, now.year)
+
+def make_planner(mxd, caches, cancelled):
+    """ Return a planner for this map document.
+    'cancelled' returns the cancelled taxlots for a dotted map number. """
+    layout = get_layout(mxd)
+    return planner(take_snapshot(layout, mapping_backend.page_size(mxd)), get_locators(), caches,
+                   cancelled, ORMAP.MaxCancelledRows, plot_date())
+
+def get_live_planner(mxd):
+    """ Return the planner for pages that were not planned ahead.
+    It's made again for each batch (check_caches() drops it) or when the date changes. """
+    global live_planner
+    layout = get_layout(mxd)
+    date = plot_date()
+    if live_planner is None or live_planner[0] is not layout or live_planner[1] != date:
+        live_planner = (layout, date, make_planner(mxd, locator_caches(mxd, layout), can.get_list))
+    return live_planner[2]
 
-def update_cancelled(mxd, orm, x,y):
-    global can_x, can_y
+# ==============================================================================
 
-    can_elm = None
-    try:
-        can_elm = MAP.ListLayoutElements(mxd, "GRAPHIC_ELEMENT", "can*")[0]
-    except IndexError:
-        aprint("Could not find a cancelled taxlots group element. Skipping.")
+@timed()
+def update_page_layout(mxd, pagename):
+    """Update the map document page layout using the given pagename.
+    The page is planned and applied the same way as in plan_pages(),
+    see pageplan.update_page(). """
+
+    orm = page_orm(get_crosswalk(mxd), pagename)
+    if not orm:
+        # Show the page anyway, its locator maps and cancelled taxlots are left as they were.
+        mapping_backend.set_page(mxd, pagename)
+        mapping_backend.refresh()
         return
 
-#    if on_page(can_elm,mxd):
-#        can_x = can_elm.elementPositionX
-#        can_y = can_elm.elementPositionY
-#    elif can_x == 0 and can_y == 0:
-#        aprint("The cancelled taxlots element \"%s\" is not on the map so it will never print." % can_elm.name)
-
-    cancelled_taxlots = can.get_list(orm.dotted)
-    aprint("Cancelled taxlots: %d" % len(cancelled_taxlots))
-    if len(cancelled_taxlots) == 0:
-        # Move the cancelled taxlot table off the layout
-        can_elm.elementPositionX = mxd.pageSize.width + 3
-        can_elm.elementPositionY = y
-    else:
-        can_elm.elementPositionX = x
-        can_elm.elementPositionY = y
-
-    populate_cancelled_taxlot_table(mxd, cancelled_taxlots)
-            
-    return
-
-def make_table(seq, columns):
-    """ Break the sequence into 'n' columns and return them. """
-    table = ""
-    maxy = (len(seq)+columns-1)/columns
-    i = 0
-    columns = []
-    for item in seq:
-        table += str(item).ljust(6) + "\n"
-        i += 1
-        if not i % maxy:
-            columns.append(table)
-            table = ""
-    if table:
-        columns.append(table)
-
-    return maxy,columns
-
-def populate_cancelled_taxlot_table(mxd, taxlots):
-    """ Fill in the cancelled taxlot table in the page. 
-        Return the number of cancelled taxlots. """
-
-    #aprint("Populating cancelled taxlot table")
-        
-    # Count the can* columns in this MXD and empty them out.
-
-    ncols = 0
-    cols = []
-    for elm in MAP.ListLayoutElements(mxd, "TEXT_ELEMENT", "can*"):
-        if re.search('^can\d+$', elm.name):
-            cols.append(elm)
-            ncols += 1
-            elm.text = " " # This element has some text in it (event just a single space) so ArcMap does not "lose" it.
-    
-    if len(taxlots):
-        # Sort out the data into as a list of columns
-        max_y, columns = make_table(taxlots, ncols)
-
-        # Adjust the font size of the table according to the number of rows
-        fontsize = 10
-        if max_y > ORMAP.MaxCancelledRows: fontsize = 8
-
-        x = 0
-        for column in columns:
-            cols[x].text = column
-            cols[x].fontSize = fontsize
-            x += 1
-        
+    layout = get_layout(mxd)
+    update_page(mxd, pagename, orm, get_live_planner(mxd), layout, mapping_backend, aprint)
+    aprint("Layout updates: %d written, %d skipped as unchanged." % (layout.writes, layout.skipped))
     return
 
 # ==============================================================================
 
-def update_page_layout(mxd, pagename):
-    """Update the map document page layout using the given pagename."""
-    
+def get_page_scales(mxd):
+    """ Return a dict of map scales indexed by pagename, from the DDP index.
+    It's empty if the index has no PageScaleField. """
+    ddp = mxd.dataDrivenPages
+    d_scale = {}
     try:
-        maindf = mxd.dataDrivenPages.dataFrame
-        ddp_layer = mxd.dataDrivenPages.indexLayer
+        source = ddp.indexLayer.dataSource
+        if not arcpy.ListFields(source, ORMAP.PageScaleField):
+            aprint("The map index \"%s\" has no field \"%s\", set PageScaleField in ORMAP_config. Pages will not be planned ahead."
+                   % (source, ORMAP.PageScaleField))
+            return d_scale
+        fields = [ddp.pageNameField.name, ORMAP.PageScaleField]
+        with arcpy.da.SearchCursor(source, fields) as cursor:
+            for (pagename, scale) in cursor:
+                if scale: d_scale[pagename] = int(scale)
     except Exception as e:
-        aprint(e)
-        return
-
-    page_id = mxd.dataDrivenPages.getPageIDFromName(pagename)
-    mxd.dataDrivenPages.currentPageID = page_id
-    
-    orm = ormapnum()
-    orm.expand(pagename)
-    #aprint("%s -> %s -> %s" % (pagename, orm.dotted, orm.longmaptitle))
-
-    update_page_elements(mxd, maindf, orm)
-    (x,y) = update_locator_maps(mxd, orm)
-    update_cancelled(mxd, orm, x,y)
-
-    arcpy.RefreshActiveView()
+        aprint("Can't read page scales, %s" % e)
+    return d_scale
+
+@timed()
+def plan_pages(mxd, pagenames, reuse=True):
+    """ Work out the layout of each page ahead of time.
+    Returns a dict of operations indexed by pagename, for apply_page_plan().
+    Pages that can't be planned are left out, update_page_layout() has to do those.
+    The plan is saved next to the MXD and reused if nothing it depends on has changed,
+    that's only done for a saved MXD since the fingerprint goes by when it was saved.
+    Pass reuse=False when the document can have unsaved changes ("CURRENT"). """
+    layout = get_layout(mxd)
+    caches = locator_caches(mxd, layout)
+
+    d_scale = get_page_scales(mxd)
+    cw = get_crosswalk(mxd)
+    d_orm = {}
+    for pagename in pagenames:
+        orm = page_orm(cw, pagename)
+        if orm: d_orm[pagename] = orm # the others are set up by update_page_layout()
+    d_cancelled = can.get_lists([orm.dotted for orm in d_orm.values()])
+
+    # What the plan is made from, the layout itself is in the MXD so it goes by when that was saved.
+    config = os.path.splitext(ORMAP.__file__)[0] + ".py"
+    fingerprint = (tuple(pagenames), layout.signature, filestamp.stamp(config), [d_scale.get(p) for p in pagenames],
+                   sorted((k, lc.source, lc.stamp, lc.read_at if lc.stamp is None else None) for k,lc in caches.items()),
+                   can.stamp, plot_date())
+    filename = None
+    pages = None
+    if mxd.filePath and reuse:
+        filename = os.path.splitext(mxd.filePath)[0] + ".plan"
+        pages = load_plan(filename, fingerprint)
+    if pages is None:
+        p = make_planner(mxd, caches, lambda dotted: d_cancelled.get(dotted, ()))
+        pages = []
+        for pagename in pagenames:
+            scale = d_scale.get(pagename)
+            if scale and pagename in d_orm:
+                pages.append((pagename, p.plan(d_orm[pagename], scale)))
+        try:
+            if filename: save_plan(filename, fingerprint, pages)
+        except Exception as e:
+            aprint("Could not save page plan \"%s\", %s" % (filename, e))
+    return dict((pagename, ops) for pagename, ops in pages if ops is not None)
+
+def get_page_rows(mxd):
+    """ Return a dict of DDP index rows (as tuples) indexed by pagename. """
+    ddp = mxd.dataDrivenPages
+    source = ddp.indexLayer.dataSource
+    pagefield = ddp.pageNameField.name
+    d_row = {}
+    fields = [f.name for f in arcpy.ListFields(source) if not f.type in ("Geometry", "Blob", "Raster")]
+    i = fields.index(pagefield)
+    with arcpy.da.SearchCursor(source, fields + ["SHAPE@WKB"]) as cursor:
+        for row in cursor:
+            d_row[row[i]] = row[:-1] + (fingerprint(bytes(row[-1] or b"")),)
+    return d_row
+
+def get_page_cancelled(mxd, pagenames):
+    """ Return a dict of cancelled taxlot tuples indexed by pagename.
+    Pages that are not map numbers are left out. """
+    cw = get_crosswalk(mxd)
+    d_dotted = {}
+    for pagename in pagenames:
+        orm = page_orm(cw, pagename)
+        if orm: d_dotted[pagename] = orm.dotted
+    d_cancelled = can.get_lists(list(d_dotted.values()))
+    return dict((pagename, tuple(d_cancelled.get(dotted, ()))) for pagename, dotted in d_dotted.items())
+
+def page_inputs(mxd, pagenames, d_features=None):
+    """ Return a fingerprint of what goes into each page, indexed by pagename.
+    The map document itself, the map index row, the cancelled taxlots and,
+    if ReprintForPlotDate is set, the plot date.
+    'd_features' is the fingerprint of the features on each map from changed_pages().
+    Without it the stamp of the map index geodatabase is used, so any edit there
+    changes every page. """
+    mxd_stamp = (os.path.normcase(mxd.filePath), int(os.path.getmtime(mxd.filePath))) if mxd.filePath else None
+    if d_features is None:
+        gdb_stamp = filestamp.stamp(mxd.dataDrivenPages.indexLayer.dataSource)
+    d_row = get_page_rows(mxd)
+    d_cancelled = get_page_cancelled(mxd, pagenames)
+    date = plot_date() if ORMAP.ReprintForPlotDate else None
+    d_inputs = {}
+    for pagename in pagenames:
+        features = gdb_stamp if d_features is None else d_features.get(pagename)
+        d_inputs[pagename] = fingerprint(mxd_stamp, d_row.get(pagename), d_cancelled.get(pagename, ()), date, features)
+    return d_inputs
+
+def changes_file(mxd):
+    if mxd.filePath:
+        return os.path.splitext(mxd.filePath)[0] + ".changes"
+    return os.path.join(os.environ.get("TEMP", os.getcwd()), "ormap.changes")
+
+def changed_pages(mxd):
+    """ Return (pagenames, fingerprints) for the pages whose features or cancelled
+    taxlots changed since they were last printed, see mapchanges.
+    Pass the fingerprints to record_printed() once the pages have been printed. """
+    ddp = mxd.dataDrivenPages
+    source = ddp.indexLayer.dataSource
+    gdb = filestamp.workspace(source) or os.path.dirname(source)
+    pagenames = ListPagenames(mxd)
+    d_fp = mapchanges.page_fingerprints(source, ddp.pageNameField.name,
+                                        [os.path.join(gdb, fc) for fc in ORMAP.ChangeFeatureClasses],
+                                        get_page_cancelled(mxd, pagenames), aprint)
+    pagenames = mapchanges.changed(mapchanges.load(changes_file(mxd)), d_fp)
+    aprint("%d of %d maps have changed." % (len(pagenames), len(d_fp)))
+    return pagenames, d_fp
+
+def record_printed(mxd, d_fp, pagenames):
+    """ Save the fingerprints of pages that were printed, so they are
+    not found by changed_pages() again until something changes. """
+    filename = changes_file(mxd)
+    d_saved = mapchanges.load(filename)
+    for pagename in pagenames:
+        if pagename in d_fp:
+            d_saved[pagename] = d_fp[pagename]
+    try:
+        mapchanges.save(filename, d_saved)
+    except Exception as e:
+        aprint("Could not save map fingerprints \"%s\", %s" % (filename, e))
+    return
 
+@timed()
+def apply_page_plan(mxd, pagename, ops):
+    """ Set up the page layout using operations from plan_pages(). """
+    layout = get_layout(mxd)
+    apply_plan(mxd, pagename, ops, layout, mapping_backend, aprint)
+    aprint("Layout updates: %d written, %d skipped as unchanged." % (layout.writes, layout.skipped))
     return
 
 def test_layouts(mxd):
@@ -334,12 +387,7 @@ if __name__ == '__main__':
         mxdname = "C:\\GeoModel\\Clatsop\\Workfolder\\TestMap.mxd"
     
     mxd = MAP.MapDocument(mxdname)
-    select_scalebar(mxd, 120)
-    select_scalebar(mxd, 240)
-    select_scalebar(mxd, 1200)
-    select_scalebar(mxd, 2400)
-    select_scalebar(mxd, 4800)
-    select_scalebar(mxd, 24000)
+    check_caches(mxd)
     test_layouts(mxd)
     del mxd
 
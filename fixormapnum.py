@@ -7,60 +7,75 @@ import os, sys
 import logging
 import arcpy
 sys.path.append("C:\\GeoModel\\MapProduction\\Toolbox")
-from ormap.ormapnum import ormapnum
+from ormap.ormapnum import ormapnum, ORMapNumber
+from ormap import ormapcodec
 
 def posttaxmap(fc):
     """ Code to run after stage 01.
-    Fix taxbound ormapnum, the AML code to create ormapnum is broken for detail maps. """
+    Fix taxbound ormapnum, the AML code to create ormapnum is broken for detail maps.
+
+    The ORMAPNUMs are read first and decoded and repaired all at once by ormapcodec,
+    then the rows are updated. Only the few that ormapcodec can't decode are
+    looked at one at a time. """
 
     logging.info("post01(%s)" % fc)
 
-    fields = ["ORMAPNUM", "PAGENAME", "MAPSUFNUM", "OID@"]
-    ORMAPNUM  = 0
-    PAGENAME  = 1
-    MAPSUFNUM = 2
-    OID       = 3
+    # Read them all, and repair detail map numbers.
+    l_oid = []
+    l_ormapnum = []
+    with arcpy.da.SearchCursor(fc, ["OID@", "ORMAPNUM", "MAPSUFNUM"]) as cursor:
+        for (oid, o, mapsufnum) in cursor:
+            if o and o[-1] == 'D':
+                o += "%03d" % mapsufnum
+                logging.info("Repaired %s" % o)
+            l_oid.append(oid)
+            l_ormapnum.append(o)
 
-    orm = ormapnum()
-    
-    with arcpy.da.UpdateCursor(fc, fields) as cursor:
-        for row in cursor:
-            o   = row[ORMAPNUM]
-            oid = row[OID]
-            if not o:
-                try:
-                    # mysteriously, some ormapnumbers are just empty
-                    cursor.deleteRow()
-                    logging.debug("Deleted empty row.")
-                except Exception as e:
-                    logging.warn("Could not delete empty row(%s). %s" % (oid, e))
-                continue
-
-        # repair detail map number
-            if o[-1] == 'D':
-                o += "%03d" % row[MAPSUFNUM]
-                orm.unpack(o)
-                row[ORMAPNUM] = orm.ormapnumber 
-                logging.info("Repaired %s" % row[ORMAPNUM])
+    a = ormapcodec.unpack(l_ormapnum)
+    packed = ormapcodec.pack(a)
 
+    # (ormapnum, pagename) indexed by OID, None for rows to delete
+    d_fix = {}
+    for i, oid in enumerate(l_oid):
+        o = l_ormapnum[i]
+        if not o:
+            # mysteriously, some ormapnumbers are just empty
+            d_fix[oid] = None
+        elif a['valid'][i]:
+            p = u"%s" % packed[i]
+            d_fix[oid] = (p, ORMapNumber.unpack(p).short)
+        else:
+            orm = ormapnum()
             try:
                 orm.unpack(o)
             except ValueError as e:
                 logging.warn(e)
-
             if orm.township == 0 or orm.range == 0:
+                # mysteriously, some ormapnumbers are 0,0
+                d_fix[oid] = None
+            else:
+                logging.warn("Can't check \"%s\" (%s)." % (o, oid))
+                d_fix[oid] = (o, orm.short)
+
+    fields = ["ORMAPNUM", "PAGENAME", "OID@"]
+    ORMAPNUM  = 0
+    PAGENAME  = 1
+    OID       = 2
+
+    with arcpy.da.UpdateCursor(fc, fields) as cursor:
+        for row in cursor:
+            oid = row[OID]
+            fix = d_fix.get(oid, False)
+            if fix is False: continue # added since we read it
+            if fix is None:
                 try:
-                    # mysteriously, some ormapnumbers are 0,0
                     cursor.deleteRow()
-                    logging.debug("Deleted 0,0 row.")
+                    logging.debug("Deleted empty or 0,0 row.")
                 except Exception as e:
-                    logging.warn("Could not delete 0,0 row(%s). %s" % (oid, e))
+                    logging.warn("Could not delete empty or 0,0 row(%s). %s" % (oid, e))
                 continue
-
-        # calc page number from ormapnum
-            row[PAGENAME] = orm.short
+            (row[ORMAPNUM], row[PAGENAME]) = fix
             cursor.updateRow(row)
-            pass
     return
 
 if __name__ == "__main__":